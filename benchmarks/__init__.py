@@ -0,0 +1,11 @@
+"""
+End-to-end benchmarks for hoplite.
+
+The benchmarks start real hoplite servers on the local machine and measure
+them through the public client API, the same way
+tests/test_multiple_hoplite_instances.py exercises multiple servers. They are
+run from a checkout of hoplite with ``python -m benchmarks.main`` and write
+their results as JSON so that runs against different versions of hoplite can
+be compared. They are not installed with hoplite. The job plugin they run is
+installed with pip while they run, from the plugin directory.
+"""
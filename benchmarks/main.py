@@ -0,0 +1,292 @@
+"""
+Command line entry point for the hoplite benchmarks.
+
+Each benchmark is run against its own freshly started hoplite server so that
+jobs left behind by one benchmark do not affect the next. Run from the root
+of a checkout of hoplite. Example::
+
+    python -m benchmarks.main --output results.json
+    python -m benchmarks.main --benchmarks remotify_latency job_throughput
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import pkg_resources
+import requests
+
+from hoplite.builtin_plugins.install_python_package_job import (
+    install_package_with_pip,
+    uninstall_package_with_pip)
+from hoplite.client.remote_job_manager import RemoteJobManager
+from hoplite.public_api import wait_for_hoplite
+from benchmarks import remotable
+from benchmarks.serializer import bench_serializer
+
+BENCHMARK_PLUGIN = 'hoplite_benchmark_plugin.benchmark_job'
+# Package providing BENCHMARK_PLUGIN, installed while the benchmarks run
+BENCHMARK_PLUGIN_PATH = os.path.join(os.path.dirname(__file__), 'plugin')
+BENCHMARK_PLUGIN_PACKAGE = 'hoplite-benchmark-plugin'
+
+
+@contextlib.contextmanager
+def benchmark_plugin_installed():
+    """
+    Install the benchmark job plugin for the servers started meanwhile, and
+    uninstall it afterwards
+    """
+    ret, out = install_package_with_pip(BENCHMARK_PLUGIN_PATH)
+    if ret:
+        raise RuntimeError(
+            'Could not install the benchmark plugin:\n{0}'.format(out))
+    try:
+        yield
+    finally:
+        # pip reports the uninstall on stdout, where the results may go
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        try:
+            uninstall_package_with_pip(BENCHMARK_PLUGIN_PACKAGE)
+        finally:
+            sys.stdout = stdout
+
+
+def start_hoplite_server(port_num):
+    """
+    Start a hoplite server in a new process and wait for it to accept
+    connections
+
+    :param port_num: The port the server will listen on
+    :return: The process running the server
+    """
+    devnull = open(os.devnull, 'w')
+    proc = subprocess.Popen(
+        [sys.executable, '-c',
+         'import hoplite.main; '
+         'hoplite.main.server_main([\'--port={0}\'])'.format(port_num)],
+        stdout=devnull,
+        stderr=subprocess.STDOUT
+    )
+    devnull.close()
+    wait_for_hoplite('localhost', port_num, retry_period_s=.1, retries=300)
+    return proc
+
+
+def tear_down_hoplite(process):
+    process.terminate()
+    process.wait()
+
+
+def percentile(sorted_values, percent):
+    """
+    Nearest-rank percentile
+
+    :param sorted_values: Values sorted in ascending order
+    :param percent: Percentile to find, between 0 and 100
+    """
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values))) - 1
+    return sorted_values[min(max(rank, 0), len(sorted_values) - 1)]
+
+
+def summarize_latencies(latencies):
+    """
+    :param latencies: Latencies in seconds
+    :return: Summary statistics of the latencies, in seconds
+    :rtype: dict
+    """
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'min': latencies[0] if latencies else None,
+        'max': latencies[-1] if latencies else None,
+        'mean': sum(latencies) / len(latencies) if latencies else None,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99)
+    }
+
+
+def bench_job_throughput(address, args):
+    """
+    Jobs per second for creating, starting and joining a job that does nothing
+    """
+    manager = RemoteJobManager(address)
+    latencies = []
+    start = time.time()
+    for _ in xrange(args.iterations):
+        job_start = time.time()
+        job = manager.create_job(BENCHMARK_PLUGIN, {})
+        job.start()
+        job.join()
+        latencies.append(time.time() - job_start)
+    elapsed = time.time() - start
+    return {
+        'jobs': args.iterations,
+        'jobs_per_second': args.iterations / elapsed,
+        'latency': summarize_latencies(latencies)
+    }
+
+
+def bench_remotify_latency(address, args):
+    """
+    Latency of calling a remotified function with a tiny and a large payload
+    """
+    payloads = {
+        'tiny': 'x',
+        'large': 'x' * args.large_payload_bytes
+    }
+    results = {}
+    for name, payload in sorted(payloads.items()):
+        latencies = []
+        for _ in xrange(args.iterations):
+            call_start = time.time()
+            remotable.remote_echo(address, payload)
+            latencies.append(time.time() - call_start)
+        results[name] = {
+            'payload_bytes': len(payload),
+            'latency': summarize_latencies(latencies)
+        }
+    return results
+
+
+def bench_get_jobs(address, args):
+    """
+    Latency and response size of GET /jobs as the number of stored jobs grows
+    """
+    manager = RemoteJobManager(address)
+    url = 'http://{0}/jobs'.format(address)
+    results = []
+    stored_jobs = 0
+    for job_count in sorted(args.job_counts):
+        while stored_jobs < job_count:
+            manager.create_job(BENCHMARK_PLUGIN, {})
+            stored_jobs += 1
+        latencies = []
+        response_bytes = 0
+        for _ in xrange(args.iterations):
+            request_start = time.time()
+            resp = requests.get(url)
+            latencies.append(time.time() - request_start)
+            response_bytes = len(resp.content)
+        results.append({
+            'stored_jobs': stored_jobs,
+            'response_bytes': response_bytes,
+            'latency': summarize_latencies(latencies)
+        })
+    return results
+
+
+def bench_status_updates(address, args):
+    """
+    Status updates per second sent by a running job to its server
+    """
+    manager = RemoteJobManager(address)
+    job = manager.create_job(
+        BENCHMARK_PLUGIN, {'status_updates': args.status_updates})
+    job.start()
+    job.join()
+    status = job.status()
+    return {
+        'status_updates': status['status_updates'],
+        'updates_per_second': status['status_updates'] / status['elapsed']
+    }
+
+
+BENCHMARKS = {
+    'job_throughput': bench_job_throughput,
+    'remotify_latency': bench_remotify_latency,
+    'get_jobs': bench_get_jobs,
+    'status_updates': bench_status_updates
+}
+
+# Benchmarks that do not need a server
+LOCAL_BENCHMARKS = {
+    'serializer': bench_serializer
+}
+
+
+def get_bench_options_parser():
+    parser = argparse.ArgumentParser(
+        description='Benchmark hoplite servers started on this machine')
+    parser.add_argument(
+        '-b', '--benchmarks', nargs='+',
+        choices=sorted(BENCHMARKS.keys() + LOCAL_BENCHMARKS.keys()),
+        default=sorted(BENCHMARKS.keys() + LOCAL_BENCHMARKS.keys()),
+        help='The benchmarks to run')
+    parser.add_argument(
+        '-p', '--port', type=int, default=5100,
+        help='The port number of the hoplite server started for the '
+             'benchmarks')
+    parser.add_argument(
+        '-n', '--iterations', type=int, default=100,
+        help='Number of measurements taken by each benchmark')
+    parser.add_argument(
+        '--large-payload-bytes', type=int, default=1024 * 1024,
+        help='Size of the large payload sent to remotified functions')
+    parser.add_argument(
+        '--job-counts', type=int, nargs='+', default=[10, 100, 1000],
+        help='Numbers of stored jobs to measure GET /jobs and the serializer '
+             'with')
+    parser.add_argument(
+        '--status-updates', type=int, default=1000,
+        help='Number of status updates sent by the status update benchmark')
+    parser.add_argument(
+        '-o', '--output',
+        help='File the JSON results are written to. Defaults to stdout')
+    return parser
+
+
+def run_benchmarks(args):
+    """
+    :param args: Options parsed by the parser from get_bench_options_parser
+    :return: The results of every benchmark and information about the
+        environment they were run in
+    :rtype: dict
+    """
+    results = {}
+    for name in args.benchmarks:
+        if name in LOCAL_BENCHMARKS:
+            results[name] = LOCAL_BENCHMARKS[name](args)
+    server_benchmarks = [
+        name for name in args.benchmarks if name in BENCHMARKS]
+    if server_benchmarks:
+        with benchmark_plugin_installed():
+            for name in server_benchmarks:
+                server = start_hoplite_server(args.port)
+                try:
+                    results[name] = BENCHMARKS[name](
+                        'localhost:{0}'.format(args.port), args)
+                finally:
+                    tear_down_hoplite(server)
+    return {
+        'hoplite_version': pkg_resources.get_distribution('hoplite').version,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'options': vars(args),
+        'results': results
+    }
+
+
+def bench_main(args=sys.argv):
+    parser = get_bench_options_parser()
+    if args == sys.argv:
+        args = args[1:]
+    args = parser.parse_args(args)
+    results = json.dumps(run_benchmarks(args), indent=4, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(results)
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    bench_main()
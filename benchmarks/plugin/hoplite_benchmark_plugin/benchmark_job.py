@@ -0,0 +1,25 @@
+"""
+Job plugin used by the benchmarks. With no configuration it returns
+immediately, which makes it suitable for measuring the overhead of creating,
+starting and joining a job.
+"""
+import time
+
+
+def run(config, status):
+    """
+    Send a number of status updates to the server and record how long they
+    took.
+
+    :param config: Dictionary which may contain the following keys:
+        * status_updates - Number of status updates to send. Defaults to 0
+    :param status: Used to send the status updates
+    """
+    status_updates = config.get('status_updates', 0)
+    start = time.time()
+    for i in xrange(status_updates):
+        status.update({'update': i})
+    status.update({
+        'status_updates': status_updates,
+        'elapsed': time.time() - start
+    })
@@ -0,0 +1,14 @@
+from setuptools import setup, find_packages
+
+# Installed by the benchmarks while they run, so hoplite itself does not ship
+# the benchmark job
+setup(
+    name="hoplite-benchmark-plugin",
+    version="0.1",
+    packages=find_packages(),
+    entry_points={
+        'hoplite.jobs': [
+            'hoplite_benchmark_plugin.benchmark_job = hoplite_benchmark_plugin.benchmark_job'
+        ]
+    }
+)
@@ -0,0 +1,16 @@
+"""
+Functions called through remotify by the benchmarks. This module has to be
+importable by the hoplite server that runs the benchmark jobs.
+"""
+from hoplite.remote_enabler import remotify
+
+
+@remotify(__name__)
+def echo(payload):
+    """
+    Return the payload unchanged, so it is sent to the server and back
+
+    :param payload: Any picklable object
+    :return: payload
+    """
+    return payload
@@ -0,0 +1,107 @@
+"""
+Benchmark of hoplite_dumps and hoplite_loads.
+
+Compares the paths taken for plain payloads with the bson.json_util paths
+used for payloads containing extended types, using the kind of dictionaries
+the server sends when listing its jobs. Unlike the other benchmarks no
+server is needed.
+"""
+import datetime
+import json
+import timeit
+import uuid
+
+from bson import json_util
+from bson.objectid import ObjectId
+
+from hoplite import serializer
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+
+def job_dict(index):
+    """
+    :return: A job as returned by GET /jobs, with a typical config and status
+    """
+    return {
+        'uuid': str(uuid.UUID(int=index)),
+        'name': 'hoplite_benchmark_plugin.benchmark_job',
+        'config': {
+            'hostname': 'machine-{0}'.format(index),
+            'retries': 3,
+            'timeout_s': 30.5,
+            'paths': ['C:\\builds\\{0}'.format(i) for i in range(10)],
+            'options': {'verbose': True, 'mode': None}
+        },
+        'status': {
+            'progress': index % 100,
+            'messages': ['step {0} done'.format(i) for i in range(20)],
+            'results': [{'name': 'test_{0}'.format(i), 'passed': i % 7 != 0,
+                         'duration': i * .25} for i in range(20)]
+        },
+        'running': False,
+        'finished': True,
+        'killed': False
+    }
+
+
+def extended_job_dict(index):
+    """
+    :return: A job whose status contains extended types
+    """
+    job = job_dict(index)
+    job['status']['started'] = datetime.datetime(2016, 1, 1, 12, 0, index % 60)
+    job['status']['document'] = ObjectId('0' * 23 + str(index % 10))
+    return job
+
+
+def _time_per_call(function, iterations):
+    # Best of three runs, in microseconds
+    return min(timeit.repeat(function, number=iterations, repeat=3)) \
+        / iterations * 1e6
+
+
+def bench_serializer(args):
+    """
+    Microseconds per call of dumping and loading a list of jobs
+    """
+    results = {}
+    for job_count in sorted(args.job_counts):
+        iterations = max(args.iterations // 10, 1)
+        plain = {'jobs': [job_dict(i) for i in range(job_count)]}
+        extended = {'jobs': [extended_job_dict(i) for i in range(job_count)]}
+        plain_text = serializer.hoplite_dumps(plain)
+        extended_text = serializer.hoplite_dumps(extended)
+
+        def slow_loads():
+            json.loads(plain_text, object_hook=lambda dct: serializer.object_hook(dct, True, False, 'utf-8'))
+
+        timings = {
+            'dumps_bson_json_util': lambda: json_util.dumps(plain),
+            'dumps_plain': lambda: serializer.hoplite_dumps(plain),
+            'dumps_extended': lambda: serializer.hoplite_dumps(extended),
+            'loads_object_hook': slow_loads,
+            'loads_plain': lambda: serializer.hoplite_loads(plain_text),
+            'loads_extended': lambda: serializer.hoplite_loads(extended_text)
+        }
+        if simplejson is not None:
+            timings['dumps_plain_simplejson'] = lambda: simplejson.dumps(plain)
+            timings['loads_plain_simplejson'] = lambda: simplejson.loads(
+                plain_text, object_hook=lambda dct: serializer.encode_object(dct, 'utf-8'))
+        result = {
+            'jobs': job_count,
+            'payload_bytes': len(plain_text),
+            'microseconds': dict(
+                (name, _time_per_call(function, iterations))
+                for name, function in timings.items())
+        }
+        micros = result['microseconds']
+        result['dumps_speedup'] = \
+            micros['dumps_bson_json_util'] / micros['dumps_plain']
+        result['loads_speedup'] = \
+            micros['loads_object_hook'] / micros['loads_plain']
+        results[str(job_count)] = result
+    return results
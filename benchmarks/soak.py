@@ -0,0 +1,234 @@
+"""
+Endurance test for a single hoplite server.
+
+Pushes a large number of short jobs through one server and samples the
+server's resident memory, open file descriptors (handles on Windows),
+threads, child processes and number of stored jobs along the way. Leaks such
+as per-job loggers that are never removed, unclosed pipes and retained
+processes only become visible after tens of thousands of jobs, which the unit
+tests never get close to. Example::
+
+    python -m benchmarks.soak --jobs 100000 --output soak.json
+
+The command exits with a non-zero status if any resource grew by more than its
+threshold between the first sample (taken after a warm up) and the last one.
+Requires psutil.
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+
+import requests
+
+from hoplite.client.remote_job_manager import RemoteJobManager
+from benchmarks.main import (
+    BENCHMARK_PLUGIN,
+    benchmark_plugin_installed,
+    start_hoplite_server,
+    tear_down_hoplite)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+JOBS_STORED_PATTERN = re.compile(r'^hoplite_jobs_stored (\S+)$', re.MULTILINE)
+
+
+def _call_psutil(process, *names):
+    # psutil renamed most of its methods in 2.0 (get_children -> children)
+    for name in names:
+        method = getattr(process, name, None)
+        if method is not None:
+            return method()
+    return None
+
+
+def sample_server(process, address):
+    """
+    :param process: psutil.Process of the hoplite server
+    :param address: Address of the hoplite server in the form "host:port"
+    :return: The current resource usage of the server
+    :rtype: dict
+    """
+    children = _call_psutil(process, 'children', 'get_children')
+    memory_info = _call_psutil(process, 'memory_info', 'get_memory_info')
+    open_fds = _call_psutil(
+        process, 'num_fds', 'get_num_fds', 'num_handles', 'get_num_handles')
+    metrics = requests.get('http://{0}/metrics'.format(address)).text
+    match = JOBS_STORED_PATTERN.search(metrics)
+    return {
+        'time': time.time(),
+        'rss_bytes': memory_info.rss,
+        'open_fds': open_fds,
+        'threads': _call_psutil(process, 'num_threads', 'get_num_threads'),
+        'children': len(children),
+        'stored_jobs': int(float(match.group(1))) if match else None
+    }
+
+
+def check_growth(first, last, thresholds):
+    """
+    :param first: The sample used as the baseline
+    :param last: The sample compared against the baseline
+    :param thresholds: Maps sample keys to the maximum allowed growth. Keys
+        whose threshold is None are not checked
+    :return: A description of every resource that grew more than allowed
+    :rtype: list of str
+    """
+    failures = []
+    for key, threshold in sorted(thresholds.items()):
+        if threshold is None or first[key] is None or last[key] is None:
+            continue
+        growth = last[key] - first[key]
+        if growth > threshold:
+            failures.append(
+                '{0} grew by {1} (from {2} to {3}), more than the allowed '
+                '{4}'.format(key, growth, first[key], last[key], threshold))
+    return failures
+
+
+def run_jobs(address, count, concurrency):
+    """
+    Create, start and join count jobs using concurrency client threads
+    """
+    remaining = [count]
+    lock = threading.Lock()
+    errors = []
+
+    def worker():
+        manager = RemoteJobManager(address)
+        while True:
+            with lock:
+                if remaining[0] <= 0 or errors:
+                    return
+                remaining[0] -= 1
+            try:
+                job = manager.create_job(BENCHMARK_PLUGIN, {})
+                job.start()
+                job.join()
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                return
+
+    threads = [threading.Thread(target=worker) for _ in xrange(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def soak(args):
+    """
+    :param args: Options parsed by the parser from get_soak_options_parser
+    :return: The samples taken and any threshold failures
+    :rtype: dict
+    """
+    if psutil is None:
+        raise ImportError('psutil is required to run the soak test')
+    address = 'localhost:{0}'.format(args.port)
+    with benchmark_plugin_installed():
+        server = start_hoplite_server(args.port)
+        try:
+            process = psutil.Process(server.pid)
+            run_jobs(address, args.warm_up_jobs, args.concurrency)
+            samples = [sample_server(process, address)]
+            samples[0]['jobs_run'] = 0
+            jobs_run = 0
+            while jobs_run < args.jobs:
+                batch = min(args.sample_every, args.jobs - jobs_run)
+                run_jobs(address, batch, args.concurrency)
+                jobs_run += batch
+                sample = sample_server(process, address)
+                sample['jobs_run'] = jobs_run
+                samples.append(sample)
+                if args.verbose:
+                    sys.stderr.write(
+                        json.dumps(sample, sort_keys=True) + '\n')
+        finally:
+            tear_down_hoplite(server)
+    failures = check_growth(samples[0], samples[-1], {
+        'rss_bytes': args.max_rss_growth_mb * 1024 * 1024,
+        'open_fds': args.max_fd_growth,
+        'threads': args.max_thread_growth,
+        'children': args.max_children_growth,
+        'stored_jobs': args.max_stored_jobs_growth
+    })
+    return {
+        'options': vars(args),
+        'samples': samples,
+        'failures': failures,
+        'passed': not failures
+    }
+
+
+def get_soak_options_parser():
+    parser = argparse.ArgumentParser(
+        description='Run many short jobs through one hoplite server and '
+                    'check it does not leak resources')
+    parser.add_argument(
+        '-p', '--port', type=int, default=5100,
+        help='The port number of the hoplite server started for the test')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=100000,
+        help='Number of jobs to run')
+    parser.add_argument(
+        '-c', '--concurrency', type=int, default=4,
+        help='Number of jobs run at the same time')
+    parser.add_argument(
+        '--warm-up-jobs', type=int, default=100,
+        help='Number of jobs run before the baseline sample is taken')
+    parser.add_argument(
+        '--sample-every', type=int, default=1000,
+        help='Number of jobs run between samples')
+    parser.add_argument(
+        '--max-rss-growth-mb', type=float, default=100,
+        help='Maximum allowed growth of resident memory in MB')
+    parser.add_argument(
+        '--max-fd-growth', type=int, default=20,
+        help='Maximum allowed growth of open file descriptors')
+    parser.add_argument(
+        '--max-thread-growth', type=int, default=5,
+        help='Maximum allowed growth of the number of threads')
+    parser.add_argument(
+        '--max-children-growth', type=int, default=5,
+        help='Maximum allowed growth of the number of child processes')
+    parser.add_argument(
+        '--max-stored-jobs-growth', type=int, default=None,
+        help='Maximum allowed growth of the number of stored jobs. Not '
+             'checked by default')
+    parser.add_argument(
+        '-o', '--output',
+        help='File the JSON results are written to. Defaults to stdout')
+    parser.add_argument(
+        '-v', '--verbose', action='store_true',
+        help='Print every sample to stderr as it is taken')
+    return parser
+
+
+def soak_main(args=sys.argv):
+    parser = get_soak_options_parser()
+    if args == sys.argv:
+        args = args[1:]
+    args = parser.parse_args(args)
+    results = soak(args)
+    output = json.dumps(results, indent=4, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+    for failure in results['failures']:
+        sys.stderr.write(failure + '\n')
+    if not results['passed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    soak_main()
@@ -0,0 +1,73 @@
+import zlib
+
+from flask import Blueprint, request
+
+from hoplite.api.helpers import jsonify
+from hoplite.serializer import JSON_MIMETYPE
+from hoplite.utils.compression import (
+    GZIP,
+    MIN_COMPRESS_BYTES,
+    DecompressedTooLargeError,
+    accepts_gzip,
+    gzip_compress,
+    gzip_compress_stream,
+    gzip_decompress)
+
+bp = Blueprint('compression', __name__)
+
+
+@bp.before_app_request
+def _decompress_request():
+    encoding = request.headers.get('Content-Encoding', '').strip().lower()
+    if not encoding or encoding == 'identity':
+        return None
+    if encoding != GZIP:
+        return jsonify(
+            error="Unsupported Content-Encoding {0}".format(encoding)), 415
+    try:
+        # Replaces the cached body, so request.data is the decompressed body
+        request._cached_data = gzip_decompress(request.get_data())
+    except DecompressedTooLargeError as e:
+        return jsonify(error=str(e)), 413
+    except zlib.error as e:
+        return jsonify(error="Invalid gzip body: {0}".format(e)), 400
+    return None
+
+
+@bp.after_app_request
+def _compress_response(response):
+    # Lets clients know they can send compressed request bodies (RFC 7694)
+    response.headers['Accept-Encoding'] = GZIP
+    # Logs are streamed as they are, so lines followed with tail -f are not
+    # held back by the compressor
+    if response.direct_passthrough or \
+            (response.is_streamed and response.mimetype != JSON_MIMETYPE) or \
+            response.status_code < 200 or response.status_code >= 300 or \
+            response.status_code in (204, 206) or \
+            'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not accepts_gzip(request.headers.get('Accept-Encoding')):
+        return response
+    if response.is_streamed:
+        return _compress_streamed_response(response)
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+    compressed = gzip_compress(data)
+    if len(compressed) >= len(data):
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = GZIP
+    return response
+
+
+def _compress_streamed_response(response):
+    """
+    Compress streamed JSON, such as job listings, as it is streamed. Its
+    length is not known up front, so it is compressed whatever its size
+    """
+    response.response = gzip_compress_stream(response.response)
+    response.headers['Content-Encoding'] = GZIP
+    response.headers.pop('Content-Length', None)
+    return response
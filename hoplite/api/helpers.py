@@ -1,15 +1,46 @@
 import werkzeug
+from flask import request
 from werkzeug.local import LocalProxy
-from hoplite.serializer import hoplite_dumps
+from hoplite.serializer import (
+    BSON_MIMETYPE,
+    JSON_MIMETYPE,
+    hoplite_bson_dumps,
+    hoplite_bson_loads,
+    hoplite_dumps,
+    hoplite_loads)
 
 
 # Jsonify that uses hoplite's serial decoder
 def jsonify(*args, **kwargs):
     """
-        jsonify that uses hoplite's serial encoder
+        jsonify that uses hoplite's serial encoder. The response is encoded
+        as BSON instead if the client prefers it (see the Accept header) and
+        the dictionary can be represented in BSON
     """
-    return werkzeug.Response(
-        hoplite_dumps(dict(*args, **kwargs)), mimetype='application/json')
+    dct = dict(*args, **kwargs)
+    mimetype = request.accept_mimetypes.best_match(
+        [JSON_MIMETYPE, BSON_MIMETYPE], default=JSON_MIMETYPE)
+    data = None
+    if mimetype == BSON_MIMETYPE:
+        try:
+            data = hoplite_bson_dumps(dct)
+        except ValueError:
+            mimetype = JSON_MIMETYPE
+    if data is None:
+        data = hoplite_dumps(dct)
+    response = werkzeug.Response(data, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+def load_request_data():
+    """
+    Decode the body of the request, which may be JSON or BSON depending on
+    its Content-Type
+    """
+    if request.mimetype == BSON_MIMETYPE:
+        return hoplite_bson_loads(request.data)
+    return hoplite_loads(request.data)
 
 
 # This gets set by the app factory when the app is created
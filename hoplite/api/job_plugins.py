@@ -10,6 +10,5 @@ bp = Blueprint("job_plugins", __name__)
 @bp.route("")
 def available_job_plugins():
     logger.debug(
-        "HTTP: Get Available Job Plugins- From: {0}".format(
-            request.remote_addr))
+        "HTTP: Get Available Job Plugins- From: %s", request.remote_addr)
     return jsonify(job_plugins=job_manager.available_job_plugins())
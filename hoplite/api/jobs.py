@@ -1,83 +1,277 @@
+import os
+
 from hoplite.utils import server_logging
-from hoplite.serializer import hoplite_loads
-from flask import Blueprint, request
-from hoplite.api.helpers import job_manager, jsonify
+from flask import Blueprint, Response, request, send_file
+from hoplite.api.helpers import job_manager, jsonify, load_request_data
+from hoplite.server.jobs.job_log import (
+    COMPRESSED_EXTENSION,
+    find_log,
+    follow_log,
+    read_log)
+from hoplite.server.jobs.job import RUNNING, STATES
+from hoplite.server.jobs.profiling import PROFILE_FILE_TYPES
+from hoplite.serializer import JSON_MIMETYPE, hoplite_dumps
+from hoplite.utils.status_patch import APPEND, SET, UNSET, make_patch
 from hoplite.exceptions import (
+    IdempotencyKeyReusedError,
+    InvalidJobOptionError,
+    InvalidStatusUpdateError,
     JobDoesNotExistError,
     JobPluginDoesNotExistError,
     JobNotStartedError,
-    JobAlreadyStartedError)
+    JobAlreadyStartedError,
+    NotAuthorizedError)
 
 logger = server_logging.get_server_logger(__name__)
 
+# Longest a request to POST /jobs/status may wait for a job to change
+MAX_STATUS_WAIT_S = 60
+# Header of the requests that clients may retry (see
+# hoplite.server.jobs.idempotency)
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+
 
 bp = Blueprint('jobs', __name__)
 
 
+def _split_arg(name):
+    """
+    :return: The values of a query parameter that may be repeated or given as
+        a comma separated list, or None if it is not given
+    """
+    values = [
+        value.strip() for arg in request.args.getlist(name)
+        for value in arg.split(',') if value.strip()]
+    return values or None
+
+
+def _stream_jobs(jobs, limit, fields):
+    """
+    Write the jobs as a JSON object a job at a time, so neither the memory
+    used nor the time to the first byte grow with the number of jobs
+    """
+    yield '{"jobs": ['
+    separator = ''
+    count = 0
+    last_job = None
+    for job in jobs:
+        if count == limit:
+            # There are more jobs, which can be fetched starting from here
+            yield '], "next_cursor": {0}}}'.format(
+                hoplite_dumps(str(last_job.sequence)))
+            return
+        yield separator + hoplite_dumps(job.to_dict(fields))
+        separator = ', '
+        count += 1
+        last_job = job
+    yield '], "next_cursor": null}'
+
+
+def _list_jobs(states=None):
+    requested_states = _split_arg('state')
+    if requested_states is not None:
+        invalid = set(requested_states) - set(STATES)
+        if invalid:
+            return jsonify(
+                error="Invalid state {0}. Valid states: {1}".format(
+                    ", ".join(sorted(invalid)), ", ".join(STATES))), 400
+        if states is not None:
+            requested_states = set(requested_states) & set(states)
+        states = requested_states
+    try:
+        created_since = request.args.get('created_since', None)
+        if created_since is not None:
+            created_since = float(created_since)
+        limit = request.args.get('limit', None)
+        if limit is not None:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError("limit must be at least 1")
+        after = int(request.args.get('cursor', 0))
+    except ValueError as e:
+        return jsonify(error="Invalid query parameter: {0}".format(e)), 400
+    jobs = job_manager.find_jobs(
+        states=states,
+        name=request.args.get('name', None),
+        created_since=created_since,
+        after=after)
+    # Always JSON, as a BSON document can't be written before its length
+    # is known
+    return Response(
+        _stream_jobs(jobs, limit, _split_arg('fields')),
+        mimetype=JSON_MIMETYPE)
+
+
 @bp.route("", methods=['GET'])
 def get_jobs():
     logger.debug(
-        "HTTP: Request All Jobs - From: {0}".format(request.remote_addr))
-    jobs = job_manager.all_jobs()
-    jobs_as_dict = []
-    for job in jobs:
-        jobs_as_dict.append(job.to_dict())
-    return jsonify(jobs=jobs_as_dict)
+        "HTTP: Request All Jobs - From: %s", request.remote_addr)
+    return _list_jobs()
 
 
 @bp.route("", methods=['POST'])
 def create_job():
-    job_dict = hoplite_loads(request.data)
+    job_dict = load_request_data()
     name = job_dict.get('name', "default")
     config = job_dict.get('config', {})
     running = job_dict.get('running', False)
     port = job_dict.get('port', 5000)
+    profiler = job_dict.get(
+        'profiler', request.headers.get('X-Hoplite-Profiler', None))
     try:
         logger.debug(
-            "HTTP: Request Create Job:{0} - From: {1}".format(
-                name, request.remote_addr))
-        job = job_manager.create_job(name, config, running, port)
-    except JobPluginDoesNotExistError, e:
+            "HTTP: Request Create Job:%s - From: %s",
+            name, request.remote_addr)
+        job = job_manager.create_job(
+            name, config, running, port, profiler=profiler,
+            max_runtime=job_dict.get('max_runtime', None),
+            deadline=job_dict.get('deadline', None),
+            executor=job_dict.get('executor', None),
+            cache=job_dict.get('cache', None),
+            idempotency_key=request.headers.get(IDEMPOTENCY_KEY_HEADER, None))
+    except (JobPluginDoesNotExistError, InvalidJobOptionError), e:
         return jsonify(error=str(e)), 400
+    except IdempotencyKeyReusedError, e:
+        return jsonify(error=str(e)), 422
     return jsonify(**job.to_dict())
 
 
+def _job_statuses(changed, missing, fields):
+    if fields is not None:
+        # Clients need these to know which jobs they got and to ask for
+        # what has changed since
+        fields = set(fields) | set(['uuid', 'version'])
+    return {
+        'jobs': [job.to_dict(fields) for job in changed],
+        'missing': missing
+    }
+
+
+def _stream_job_statuses(versions, wait, fields):
+    """
+    Wait for jobs to change while the body of the response is streamed,
+    which is done on a separate thread so the server keeps serving other
+    requests meanwhile
+    """
+    changed, missing = job_manager.changed_jobs(versions, wait)
+    yield hoplite_dumps(_job_statuses(changed, missing, fields))
+
+
+@bp.route("/status", methods=['POST'])
+def get_job_statuses():
+    body = load_request_data()
+    versions = body.get('jobs', {})
+    if isinstance(versions, list):
+        versions = dict((job_uuid, None) for job_uuid in versions)
+    fields = body.get('fields', None)
+    try:
+        if not isinstance(versions, dict):
+            raise ValueError("jobs must be a list or a dictionary")
+        wait = min(float(body.get('wait', 0)), MAX_STATUS_WAIT_S)
+    except (TypeError, ValueError) as e:
+        return jsonify(error="Invalid request: {0}".format(e)), 400
+    logger.debug(
+        "HTTP: Status of %s Jobs Wait:%s - From: %s",
+        len(versions), wait, request.remote_addr)
+    if wait <= 0:
+        changed, missing = job_manager.changed_jobs(versions)
+        return jsonify(**_job_statuses(changed, missing, fields))
+    return Response(
+        _stream_job_statuses(versions, wait, fields), mimetype=JSON_MIMETYPE)
+
+
 @bp.route("/<job_uuid_string>", methods=['GET', 'PUT'])
 def created_job(job_uuid_string):
     logger.debug(
-        "HTTP: {0} Status Job UUID:{1} - From: {2}".format(
-            request.method, job_uuid_string, request.remote_addr))
+        "HTTP: %s Status Job UUID:%s - From: %s",
+        request.method, job_uuid_string, request.remote_addr)
     try:
         job = job_manager.get_job(job_uuid_string)
     except (JobDoesNotExistError, ValueError) as e:
         return jsonify(error=str(e)), 404
     if request.method == 'PUT':
-        r_json = hoplite_loads(request.data)
+        r_json = load_request_data()
         if r_json.get("status", None):
             job.update_status(r_json["api_key"], r_json["status"])
     return jsonify(**job.to_dict())
 
 
+@bp.route("/<job_uuid_string>", methods=['PATCH'])
+def patch_job_status(job_uuid_string):
+    logger.debug(
+        "HTTP: Patch Status Job UUID:%s - From: %s",
+        job_uuid_string, request.remote_addr)
+    try:
+        job = job_manager.get_job(job_uuid_string)
+    except (JobDoesNotExistError, ValueError) as e:
+        return jsonify(error=str(e)), 404
+    r_json = load_request_data()
+    try:
+        patch = make_patch(
+            r_json.get(SET, None), r_json.get(UNSET, None),
+            r_json.get(APPEND, None))
+        job.patch_status(r_json.get("api_key", None), patch)
+    except NotAuthorizedError as e:
+        return jsonify(error=str(e)), 403
+    except InvalidStatusUpdateError as e:
+        return jsonify(error=str(e)), 400
+    # The whole job is not sent back, so the cost of the request depends
+    # only on the size of the change
+    return jsonify(uuid=job.uuid, version=job.version)
+
+
+@bp.route("/<job_uuid>/history", methods=['GET'])
+def get_job_history(job_uuid):
+    logger.debug(
+        "HTTP: Get History Job UUID:%s - From: %s",
+        job_uuid, request.remote_addr)
+    try:
+        job = job_manager.get_job(job_uuid)
+    except JobDoesNotExistError, e:
+        return jsonify(error=str(e)), 404
+    try:
+        since = request.args.get('since', None)
+        if since is not None:
+            since = float(since)
+        until = request.args.get('until', None)
+        if until is not None:
+            until = float(until)
+        after_version = request.args.get('after_version', None)
+        if after_version is not None:
+            after_version = int(after_version)
+    except ValueError as e:
+        return jsonify(error="Invalid query parameter: {0}".format(e)), 400
+    version = job.version
+    history, truncated = job.status_history(since, until, after_version)
+    return jsonify(
+        uuid=job.uuid, version=version, history=history, truncated=truncated)
+
+
 @bp.route("/<job_uuid>/start", methods=['PUT'])
 def start_job(job_uuid):
     try:
         logger.debug(
-            "HTTP: Start Job UUID:{0} - From: {1}".format(
-                job_uuid, request.remote_addr))
-        job = job_manager.get_job(job_uuid)
-        job.start()
+            "HTTP: Start Job UUID:%s - From: %s",
+            job_uuid, request.remote_addr)
+        job = job_manager.start_job(
+            job_uuid,
+            idempotency_key=request.headers.get(IDEMPOTENCY_KEY_HEADER, None))
     except JobDoesNotExistError, e:
         return jsonify(error=str(e)), 404
     except JobAlreadyStartedError, e:
         return jsonify(error=str(e)), 403
+    except InvalidJobOptionError, e:
+        return jsonify(error=str(e)), 400
+    except IdempotencyKeyReusedError, e:
+        return jsonify(error=str(e)), 422
     return jsonify(uuid=job.uuid, started=True)
 
 
 @bp.route("/<job_uuid>/kill", methods=['PUT'])
 def kill_job(job_uuid):
     logger.debug(
-        "HTTP: Terminate Job UUID:{0} - From: {1}".format(
-            job_uuid, request.remote_addr))
+        "HTTP: Terminate Job UUID:%s - From: %s",
+        job_uuid, request.remote_addr)
     try:
         job = job_manager.get_job(job_uuid)
         job.kill()
@@ -88,13 +282,92 @@ def kill_job(job_uuid):
     return jsonify(uuid=job.uuid, killed=True)
 
 
+@bp.route("/<job_uuid>/profile", methods=['GET'])
+def get_job_profile(job_uuid):
+    logger.debug(
+        "HTTP: Get Profile Job UUID:%s - From: %s",
+        job_uuid, request.remote_addr)
+    try:
+        job = job_manager.get_job(job_uuid)
+    except JobDoesNotExistError, e:
+        return jsonify(error=str(e)), 404
+    if job.profiler is None:
+        return jsonify(
+            error="Job UUID: {0} was not run with a profiler".format(
+                job_uuid)), 404
+    if not (job.started() and job.finished()) or \
+            not os.path.isfile(job.profile_path):
+        return jsonify(
+            error="Profile for job UUID: {0} is not available until the "
+                  "job has finished".format(job_uuid)), 404
+    extension, mimetype = PROFILE_FILE_TYPES[job.profiler]
+    return send_file(
+        job.profile_path,
+        mimetype=mimetype,
+        as_attachment=True,
+        attachment_filename="{0}.{1}".format(job.uuid, extension))
+
+
+@bp.route("/<job_uuid>/log", methods=['GET'])
+def get_job_log(job_uuid):
+    logger.debug(
+        "HTTP: Get Log Job UUID:%s - From: %s",
+        job_uuid, request.remote_addr)
+    try:
+        job = job_manager.get_job(job_uuid)
+    except JobDoesNotExistError, e:
+        return jsonify(error=str(e)), 404
+    path, size = find_log(job.log_path)
+    offset = request.args.get('offset', 0, type=int)
+    if offset < 0:
+        # A negative offset is counted from the end of the log
+        offset = max(size + offset, 0)
+    # Only logs of finished jobs are compressed, so there is nothing more to
+    # follow in them
+    if request.args.get('follow', '').lower() == 'true' and \
+            path != job.log_path + COMPRESSED_EXTENSION:
+        if not job.started():
+            # A job that is never started never finishes, so following its
+            # log would never end
+            return jsonify(
+                error="Job UUID: {0} has not been started".format(
+                    job_uuid)), 409
+        return Response(
+            follow_log(job, job.log_path, offset), mimetype='text/plain')
+    if path is None:
+        return jsonify(
+            error="Job UUID: {0} has not written to its log".format(
+                job_uuid)), 404
+    if request.range is not None:
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            response = jsonify(error="Range not satisfiable")
+            response.status_code = 416
+            response.headers['Content-Range'] = 'bytes */{0}'.format(size)
+            return response
+        start, stop = byte_range
+        response = Response(
+            read_log(path, start, stop), status=206,
+            mimetype='text/plain')
+        response.headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+            start, stop - 1, size)
+    else:
+        start = min(offset, size)
+        stop = size
+        length = request.args.get('length', None, type=int)
+        if length is not None:
+            stop = min(start + max(length, 0), size)
+        response = Response(
+            read_log(path, start, stop), mimetype='text/plain')
+        # Lets clients continue reading from where this response ended
+        response.headers['X-Hoplite-Log-Offset'] = str(start)
+        response.headers['X-Hoplite-Log-Size'] = str(size)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
 @bp.route("/running")
 def running_jobs():
     logger.debug(
-        "HTTP: Get Running Jobs- From: {0}".format(request.remote_addr))
-    running_jobs = []
-    jobs = job_manager.all_jobs()
-    for job in jobs:
-        if job.running():
-            running_jobs.append(job.to_dict())
-    return jsonify(jobs=running_jobs)
+        "HTTP: Get Running Jobs- From: %s", request.remote_addr)
+    return _list_jobs(states=[RUNNING])
@@ -0,0 +1,42 @@
+import time
+
+from flask import Blueprint, g, request
+import werkzeug
+
+from hoplite.api.helpers import job_manager
+from hoplite.server import metrics
+from hoplite.server.jobs.job import QUEUED, RUNNING
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.before_app_request
+def _start_request_timer():
+    g.hoplite_request_start_time = time.time()
+
+
+@bp.after_app_request
+def _record_request_metrics(response):
+    start_time = getattr(g, 'hoplite_request_start_time', None)
+    if start_time is None:
+        return response
+    labels = {
+        'blueprint': request.blueprint or '',
+        'route': request.url_rule.rule if request.url_rule else '',
+        'method': request.method
+    }
+    metrics.HTTP_REQUEST_SECONDS.observe(time.time() - start_time, **labels)
+    if not response.is_streamed:
+        metrics.HTTP_RESPONSE_BYTES.observe(
+            response.calculate_content_length() or 0, **labels)
+    return response
+
+
+@bp.route("", methods=['GET'])
+def get_metrics():
+    metrics.JOBS_QUEUED.set(job_manager.count_jobs(QUEUED))
+    metrics.JOBS_RUNNING.set(job_manager.count_jobs(RUNNING))
+    metrics.JOBS_STORED.set(job_manager.count_jobs())
+    return werkzeug.Response(
+        metrics.registry.render(),
+        mimetype='text/plain; version=0.0.4')
@@ -50,7 +50,31 @@ def download_files(ftp_session, source, dest, status):
     _get_files_in_dir(ftp_session, source, dest, status)
 
 
-def run(config, status):
+def setup():
+    """
+    Sessions are kept between the jobs run by the same thread or worker
+    process, by server address, port, username and password
+    """
+    return {}
+
+
+def _connect(sessions, ftp_addr, ftp_port, user, password):
+    key = (ftp_addr, ftp_port, user, password)
+    ftp_session = sessions.pop(key, None)
+    if ftp_session is not None:
+        try:
+            ftp_session.voidcmd("NOOP")
+            logger.debug("Reusing session to {0}".format(ftp_addr))
+            return ftp_session
+        except ftplib.all_errors:
+            ftp_session.close()
+    ftp_session = FTP()
+    ftp_session.connect(ftp_addr, ftp_port)
+    ftp_session.login(user, password)
+    return ftp_session
+
+
+def run(config, status, sessions=None):
     """
     Job to recursively download a directory from an FTP server
     This will overwrite any files that are in the dest_root directory
@@ -62,17 +86,27 @@ def run(config, status):
     user = config.get(KEYS.USERNAME, "")
     password = config.get(KEYS.PASSWORD, "")
 
+    keep_session = sessions is not None
+    if not keep_session:
+        sessions = {}
     try:
-        ftp_session = FTP()
-        ftp_session.connect(ftp_addr, ftp_port)
-        ftp_session.login(user, password)
+        ftp_session = _connect(sessions, ftp_addr, ftp_port, user, password)
     except socket.gaierror, e:
         status.update({"error": str(e)})
         logger.error(e)
         return
     logger.debug("connected {0}")
     download_files(ftp_session, ftp_root, dest_root, status)
-    ftp_session.close()
+    if keep_session:
+        sessions[(ftp_addr, ftp_port, user, password)] = ftp_session
+    else:
+        ftp_session.close()
+
+
+def teardown(sessions):
+    for ftp_session in sessions.values():
+        ftp_session.close()
+    sessions.clear()
 
 if __name__ == "__main__":
     config_dict = {
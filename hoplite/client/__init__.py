@@ -2,6 +2,7 @@
 Idea taken from: https://github.com/mattupstate/overholt/blob/master/tests/utils.py
 """
 
-from status_updater import StatusUpdater, MockStatusUpdater
+from status_updater import StatusUpdater, BufferedStatusUpdater, MockStatusUpdater
 from remote_job_manager import RemoteJobManager
 from remote_job import RemoteJob
+from waiting import wait, FIRST_COMPLETED, FIRST_EXCEPTION, ALL_COMPLETED
@@ -1,14 +1,91 @@
-from hoplite.serializer import hoplite_dumps
+import time
+import urlparse
+
+from hoplite.serializer import (
+    BSON_MIMETYPE,
+    JSON_MIMETYPE,
+    hoplite_bson_dumps,
+    hoplite_bson_loads,
+    hoplite_dumps,
+    hoplite_loads)
 from hoplite.exceptions import InternalServerError
+from hoplite.utils.compression import (
+    GZIP,
+    MIN_COMPRESS_BYTES,
+    accepts_gzip,
+    gzip_compress)
 import requests
 
+# Responses are requested as BSON, which servers older than this version
+# ignore
+ACCEPT = '{0}, {1};q=0.9'.format(BSON_MIMETYPE, JSON_MIMETYPE)
+
+# Times a request that can safely be repeated is retried when the server
+# cannot be reached, and seconds waited before the first retry, which double
+# for each retry after it
+RETRIES = 3
+RETRY_BACKOFF_S = .5
+# Header with which POST requests are made safe to repeat (see
+# hoplite.server.jobs.idempotency)
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+
+# Servers that have answered with BSON, and therefore also accept it in
+# request bodies, by (scheme, host:port)
+_bson_servers = set()
+# Servers that accept gzip compressed request bodies, which they say in the
+# Accept-Encoding header of their responses
+_gzip_servers = set()
+
+
+def _server(url):
+    parts = urlparse.urlsplit(url)
+    return parts.scheme, parts.netloc
+
+
+def loads_response(response):
+    """
+    Decode the body of a response from a hoplite server, which may be JSON or
+    BSON depending on its Content-Type
+    """
+    content_type = response.headers.get('Content-Type', '')
+    if content_type.split(';')[0].strip() == BSON_MIMETYPE:
+        return hoplite_bson_loads(response.content)
+    return hoplite_loads(str(response.text))
+
 
 class ClientMixin(object):
-    def _json_data(self, kwargs):
+    """
+    Makes requests to hoplite servers.
+
+    GET, PUT and DELETE requests, and POST requests sent with an
+    Idempotency-Key header, are retried with exponential backoff when the
+    connection to the server fails or times out, as repeating them does not
+    do anything twice. Whether a request is retried can be chosen with the
+    retry keyword argument.
+    """
+    retries = RETRIES
+    retry_backoff_s = RETRY_BACKOFF_S
+
+    def _json_data(self, kwargs, url=None):
+        content_type = JSON_MIMETYPE
         if 'data' in kwargs:
-            kwargs['data'] = hoplite_dumps(kwargs['data'])
-        if not kwargs.get('headers', None):
-            kwargs['headers'] = {'Content-type': 'application/json'}
+            data = None
+            if url is not None and _server(url) in _bson_servers:
+                try:
+                    data = hoplite_bson_dumps(kwargs['data'])
+                    content_type = BSON_MIMETYPE
+                except ValueError:
+                    pass
+            if data is None:
+                data = hoplite_dumps(kwargs['data'])
+            kwargs['data'] = data
+        headers = dict(kwargs.get('headers', None) or {})
+        headers.setdefault('Content-type', content_type)
+        kwargs['headers'] = headers
+        if url is not None and _server(url) in _gzip_servers and \
+                len(kwargs.get('data', None) or '') >= MIN_COMPRESS_BYTES:
+            kwargs['data'] = gzip_compress(kwargs['data'])
+            kwargs['headers']['Content-Encoding'] = GZIP
         return kwargs
 
     def _raise_if_status_500(self, response):
@@ -17,22 +94,50 @@ class ClientMixin(object):
         return response
 
     def _request(self, method, *args, **kwargs):
-        return self._raise_if_status_500(method(*args, **kwargs))
+        retry = kwargs.pop('retry', False)
+        attempt = 0
+        while True:
+            try:
+                return self._raise_if_status_500(method(*args, **kwargs))
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout):
+                if not retry or attempt >= self.retries:
+                    raise
+            time.sleep(self.retry_backoff_s * 2 ** attempt)
+            attempt += 1
 
-    def _jrequest(self, *args, **kwargs):
-        return self._request(*args, **kwargs)
+    def _jrequest(self, method, url, *args, **kwargs):
+        headers = dict(kwargs.get('headers', None) or {})
+        headers.setdefault('Accept', ACCEPT)
+        kwargs['headers'] = headers
+        response = self._request(method, url, *args, **kwargs)
+        content_type = response.headers.get('Content-Type', '')
+        if content_type.split(';')[0].strip() == BSON_MIMETYPE:
+            _bson_servers.add(_server(url))
+        if accepts_gzip(response.headers.get('Accept-Encoding', None)):
+            _gzip_servers.add(_server(url))
+        return response
 
     def jget(self, *args, **kwargs):
+        kwargs.setdefault('retry', True)
         return self._jrequest(requests.get, *args, **kwargs)
 
-    def jpost(self, *args, **kwargs):
-        return self._jrequest(requests.post, *args, **self._json_data(kwargs))
+    def jpost(self, url, *args, **kwargs):
+        kwargs.setdefault(
+            'retry', IDEMPOTENCY_KEY_HEADER in (kwargs.get('headers') or {}))
+        return self._jrequest(
+            requests.post, url, *args, **self._json_data(kwargs, url))
 
-    def jput(self, *args, **kwargs):
-        return self._jrequest(requests.put, *args, **self._json_data(kwargs))
+    def jput(self, url, *args, **kwargs):
+        kwargs.setdefault('retry', True)
+        return self._jrequest(
+            requests.put, url, *args, **self._json_data(kwargs, url))
 
-    def jpatch(self, *args, **kwargs):
-        return self._jrequest(requests.patch, *args, **self._json_data(kwargs))
+    def jpatch(self, url, *args, **kwargs):
+        return self._jrequest(
+            requests.patch, url, *args, **self._json_data(kwargs, url))
 
-    def jdelete(self, *args, **kwargs):
-        return self._jrequest(requests.delete, *args, **self._json_data(kwargs))
+    def jdelete(self, url, *args, **kwargs):
+        kwargs.setdefault('retry', True)
+        return self._jrequest(
+            requests.delete, url, *args, **self._json_data(kwargs, url))
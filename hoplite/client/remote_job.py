@@ -5,19 +5,26 @@ Used to manage jobs on a remote hoplite server. This can be used to issue
 commands to the job or get info about the job.
 This is a wrapper around most of the commands in :ref:`REST-API-Jobs`
 
+Requests are retried a few times, waiting longer before each retry, when the
+server cannot be reached. Jobs are created and started with an
+Idempotency-Key, so a retried request does not create or start a job twice.
+
 API
 ===
 """
 import pickle
 import time
+from uuid import uuid4
 
-from hoplite.client.helpers import ClientMixin
+from hoplite.client.helpers import (
+    IDEMPOTENCY_KEY_HEADER, ClientMixin, loads_response)
+from hoplite.client.status_multiplexer import get_multiplexer
 from hoplite.exceptions import (
     JobDoesNotExistError,
     TimeoutError,
     ConnectionError,
     JobFailedError)
-from hoplite.serializer import hoplite_loads
+from hoplite.utils.job_context import current_context
 import requests.exceptions
 
 
@@ -26,7 +33,8 @@ class RemoteJob(ClientMixin):
     The representation of a job on a remote hoplite server
     """
 
-    def __init__(self, address, port=5000, name="", uuid="", api_key="", config={}):
+    def __init__(self, address, port=5000, name="", uuid="", api_key="", config={}, profiler=None,
+                 max_runtime=None, deadline=None, executor=None, cache=None):
         """
         :param address: IP address or hostname of the computer running the job.
             If desired, the address may be in the form "address:port", rather
@@ -39,7 +47,24 @@ class RemoteJob(ClientMixin):
         :type uuid: string or None
         :param api_key: this is used to only allow the running job to update
             its own status
+        :param profiler: name of the profiler ("cprofile" or "sample") to run
+            the job under when it is created. The profile can be downloaded
+            with :meth:`get_profile` once the job has finished
+        :param max_runtime: seconds the job may run for once started. The
+            server kills the job if it runs for longer, when it is created
+        :param deadline: time, in seconds since the epoch, by which the server
+            kills the job if it has not finished, when it is created
+        :param executor: what the server runs the job with ("process",
+            "thread" or "pooled-process"), when it is created. By default the
+            plugin decides
+        :param cache: True, or the number of seconds to keep the result for,
+            to let the server finish the job with the result of an identical
+            job instead of running it. False to always run the job. By
+            default the plugin decides
         :raises: InvalidAddressError
+        :raises JobCancelledError: if created by a job that has been cancelled
+        :raises TimeoutError: if created by a job that has run past its
+            deadline
         :raises: JobDoesNotExistError
         :raises: ConnectionError
         """
@@ -54,11 +79,23 @@ class RemoteJob(ClientMixin):
         self.name = name
         self.uuid = uuid
         self._api_key = api_key
+        self._profiler = profiler
+        self._max_runtime = max_runtime
+        self._deadline = deadline
+        self._executor = executor
+        self._cache = cache
+        self._timed_out = False
         self._last_poll = 0
+        self._version = None
+        self._finished = False
+        # Polls of this job also update the other jobs of the same server,
+        # and the other way around
+        self._multiplexer = get_multiplexer(self._daemon_addr)
 
         try:
             if not self.uuid:
                 self._create_job()
+            self._multiplexer.register(self)
             self._get_job()
         except requests.exceptions.ConnectionError:
             raise ConnectionError(self.address)
@@ -103,9 +140,12 @@ class RemoteJob(ClientMixin):
         :raises JobDoesNotExistError: Job does not exist on the server
         """
         self._get_job()
+        # Lets the request be retried without the server starting the job
+        # twice, and failing the retry
         resp = self.jput(
-            self._daemon_addr + '/jobs/{0}/start'.format(self.uuid))
-        return resp.json()["started"]
+            self._daemon_addr + '/jobs/{0}/start'.format(self.uuid),
+            headers={IDEMPOTENCY_KEY_HEADER: str(uuid4())})
+        return loads_response(resp)["started"]
 
     def join(self, timeout=-1):
         """
@@ -114,13 +154,16 @@ class RemoteJob(ClientMixin):
 
         Blocks infinitely by default (timeout=-1).
 
-        :raises TimeoutError: The specified timeout was reached
+        :raises TimeoutError: The specified timeout was reached, or the server
+            killed the job because it ran past its deadline
         :raises JobFailedError: The job threw an exception
         """
         num_seconds = 0
         poll_interval = .05
         while num_seconds < timeout or timeout == -1:
             if self.finished():
+                if self._timed_out:
+                    raise TimeoutError(self.uuid)
                 return True
             time.sleep(poll_interval)
             num_seconds += poll_interval
@@ -140,7 +183,7 @@ class RemoteJob(ClientMixin):
         self._get_job(force)
         resp = self.jput(
             self._daemon_addr + '/jobs/{0}/kill'.format(self.uuid))
-        return hoplite_loads(str(resp.text))["killed"]
+        return loads_response(resp)["killed"]
 
     def running(self, force=False):
         """
@@ -151,6 +194,16 @@ class RemoteJob(ClientMixin):
         self._get_job(force)
         return self._running
 
+    def timed_out(self, force=False):
+        """
+        :return: true if the server killed the job because it ran past its
+            deadline
+        :rtype: bool
+        :raises JobDoesNotExistError: Job not found on the server
+        """
+        self._get_job(force)
+        return self._timed_out
+
     def finished(self, force=False):
         """
         Returns true if the job on the target machine is no longer executing
@@ -163,28 +216,145 @@ class RemoteJob(ClientMixin):
         self.status(force)
         return self._finished
 
+    def get_profile(self):
+        """
+        Get the profile of a job that was created with a profiler
+
+        :return: The contents of the profile. For the "cprofile" profiler this
+            is a pstats file, for the "sample" profiler it is a list of
+            collapsed stacks
+        :rtype: str
+        :raises JobDoesNotExistError: if the job does not exist or the profile
+            is not available
+        """
+        resp = self.jget(
+            self._daemon_addr + '/jobs/{0}/profile'.format(self.uuid))
+        if resp.status_code == 404:
+            raise JobDoesNotExistError(loads_response(resp)["error"])
+        return resp.content
+
+    def get_status_history(self, since=None, until=None, after_version=None):
+        """
+        Get the recent changes to the job's status. The server only keeps a
+        limited number of changes for each job.
+
+        :param since: Only get changes made at or after this time, in seconds
+            since the epoch
+        :param until: Only get changes made before this time
+        :param after_version: Only get changes made after the job had this
+            version, such as the version last seen by :meth:`status`
+        :return: A dictionary with the changes ("history"), oldest first,
+            the current version of the job ("version") and whether changes
+            that would have been returned are no longer kept ("truncated").
+            Each change has the time it was made ("time"), the version of
+            the job after it ("version") and the keys that were removed
+            ("unset"), set ("set") and appended to ("append")
+        :rtype: dict
+        :raises JobDoesNotExistError: if the job does not exist
+        """
+        params = {}
+        if since is not None:
+            params['since'] = since
+        if until is not None:
+            params['until'] = until
+        if after_version is not None:
+            params['after_version'] = after_version
+        resp = self.jget(
+            self._daemon_addr + '/jobs/{0}/history'.format(self.uuid),
+            params=params)
+        if resp.status_code == 404:
+            raise JobDoesNotExistError(loads_response(resp)["error"])
+        return loads_response(resp)
+
+    def get_log(self, offset=0, length=None):
+        """
+        Get part of the job's log. Only the requested part is read by the
+        server, so this is cheap even for very large logs.
+
+        :param offset: Offset of the first byte to get. A negative offset is
+            counted from the end of the log
+        :param length: Maximum number of bytes to get. By default everything
+            from offset to the end of the log is returned
+        :return: The requested part of the log
+        :rtype: str
+        :raises JobDoesNotExistError: if the job does not exist or has not
+            written to its log yet
+        """
+        params = {'offset': offset}
+        if length is not None:
+            params['length'] = length
+        resp = self.jget(
+            self._daemon_addr + '/jobs/{0}/log'.format(self.uuid),
+            params=params)
+        if resp.status_code == 404:
+            raise JobDoesNotExistError(loads_response(resp)["error"])
+        return resp.content
+
+    def follow_log(self, offset=0):
+        """
+        Follow the job's log, like tail -f. The log is returned as it is
+        written until the job finishes.
+
+        :param offset: Offset of the first byte to get. A negative offset is
+            counted from the end of the log
+        :return: Generator of the chunks of the log
+        :raises JobDoesNotExistError: if the job does not exist
+        """
+        resp = self.jget(
+            self._daemon_addr + '/jobs/{0}/log'.format(self.uuid),
+            params={'offset': offset, 'follow': 'true'}, stream=True)
+        if resp.status_code == 404:
+            raise JobDoesNotExistError(loads_response(resp)["error"])
+        return resp.iter_content(chunk_size=None)
+
     def _get_job(self, force=False):
         """
 
         I call this before most other requests to get the status code sanity
         check.
-        This method is rate limited for sanity
+        This method is rate limited for sanity. The other unfinished jobs of
+        the same server are updated by the same request (see
+        :py:mod:`hoplite.client.status_multiplexer`), so their next calls
+        are free
         """
         time_elapsed = time.time() - self._last_poll
         if time_elapsed > .2 or force:
-            resp = self.jget(self._daemon_addr + '/jobs/{0}'.format(self.uuid))
-            if resp.status_code == 404:
-                raise JobDoesNotExistError
-            self._set_attributes_from_response_json(
-                hoplite_loads(str(resp.text)))
-            self._last_poll = time.time()
+            self._multiplexer.poll(self)
+
+    def _get_single_job(self):
+        resp = self.jget(self._daemon_addr + '/jobs/{0}'.format(self.uuid))
+        if resp.status_code == 404:
+            raise JobDoesNotExistError
+        self._set_attributes_from_response_json(loads_response(resp))
+        self._last_poll = time.time()
 
     def _create_job(self):
+        # A job created by another job is given no more time than the other
+        # job has left, and is killed with it
+        context = current_context()
+        if context is not None:
+            self._max_runtime = context.child_max_runtime(self._max_runtime)
         job_data = {"name": self.name, "config": self._config, "port": self.port}
-        resp = self.jpost(self._daemon_addr + '/jobs', data=job_data)
+        if self._profiler is not None:
+            job_data["profiler"] = self._profiler
+        if self._max_runtime is not None:
+            job_data["max_runtime"] = self._max_runtime
+        if self._deadline is not None:
+            job_data["deadline"] = self._deadline
+        if self._executor is not None:
+            job_data["executor"] = self._executor
+        if self._cache is not None:
+            job_data["cache"] = self._cache
+        # Lets the request be retried without the server creating the job
+        # twice
+        resp = self.jpost(
+            self._daemon_addr + '/jobs', data=job_data,
+            headers={IDEMPOTENCY_KEY_HEADER: str(uuid4())})
         if resp.status_code == 400:
-            raise JobDoesNotExistError(hoplite_loads(str(resp.text))["error"])
-        self._set_attributes_from_response_json(hoplite_loads(str(resp.text)))
+            raise JobDoesNotExistError(loads_response(resp)["error"])
+        self._set_attributes_from_response_json(loads_response(resp))
+        if context is not None:
+            context.add_child(self)
 
     def _set_attributes_from_response_json(self, resp_dict):
         job = resp_dict
@@ -194,3 +364,5 @@ class RemoteJob(ClientMixin):
         self._config = job.get("config", {})
         self._running = job.get("running", False)
         self._finished = job.get("finished", False)
+        self._timed_out = job.get("timed_out", False)
+        self._version = job.get("version", None)
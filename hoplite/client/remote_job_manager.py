@@ -11,10 +11,9 @@ API
 import logging
 import socket
 import time
-from hoplite.client.helpers import ClientMixin
+from hoplite.client.helpers import ClientMixin, loads_response
 from hoplite.client.remote_job import RemoteJob
-from hoplite.serializer import hoplite_loads
-from hoplite.exceptions import TimeoutError
+from hoplite.exceptions import InvalidJobOptionError, TimeoutError
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -95,17 +94,75 @@ class RemoteJobManager(ClientMixin):
         """
         return RemoteJob(self.address, self.port, uuid=uuid)
 
-    def create_job(self, plugin_name, config):
+    def create_job(self, plugin_name, config, profiler=None, max_runtime=None,
+                   deadline=None, executor=None, cache=None):
         """
         Create a job
 
         :param str plugin_name: name of the plugin you want to run in the job
         :param dict config: the configuration dictionary for the job
+        :param str profiler: name of the profiler ("cprofile" or "sample") to
+            run the job under. Profiling is disabled by default
+        :param float max_runtime: seconds the job may run for once started.
+            The server kills the job and marks it as timed out if it runs for
+            longer. By default jobs run for as long as they take
+        :param float deadline: time, in seconds since the epoch, by which the
+            server kills the job and marks it as timed out if it has not
+            finished
+        :param str executor: what the server runs the job with: "process"
+            (a new process), "thread" (a thread of the server) or
+            "pooled-process" (a reused worker process). By default the plugin
+            decides, and jobs are run in a new process if it does not
+        :param cache: True, or the number of seconds the server keeps the
+            result for, to let the server finish the job with the result of
+            an identical job (same plugin and config) instead of running it.
+            False to always run the job. By default the plugin decides
         :return: a RemoteJob to access the created job with
         :rtype: :py:class:`hoplite.client.RemoteJob`
         """
         return RemoteJob(
-            self.address, self.port, name=plugin_name, config=config)
+            self.address, self.port, name=plugin_name, config=config,
+            profiler=profiler, max_runtime=max_runtime, deadline=deadline,
+            executor=executor, cache=cache)
+
+    def get_jobs(self, state=None, name=None, created_since=None,
+                  fields=None, page_size=100):
+        """
+        Get the jobs on the server, in the order they were created. The jobs
+        are fetched a page at a time as the generator is consumed.
+
+        :param state: State, or list of states, of the jobs to get. One of
+            "queued", "running", "finished", "failed" and "killed"
+        :param str name: Name of the plugin of the jobs to get
+        :param float created_since: Only get jobs created at or after this
+            time, in seconds since the epoch
+        :param list fields: Keys of the job dictionaries to get, such as
+            "uuid" and "state". Everything is returned by default
+        :param int page_size: Number of jobs fetched per request
+        :return: Generator of the job dictionaries
+        :raises InvalidJobOptionError: if the server rejects the query
+        """
+        remote = self._daemon_addr + '/jobs'
+        params = {'limit': page_size}
+        if state is not None:
+            params['state'] = state if isinstance(state, basestring) \
+                else ','.join(state)
+        if name is not None:
+            params['name'] = name
+        if created_since is not None:
+            params['created_since'] = repr(float(created_since))
+        if fields is not None:
+            params['fields'] = ','.join(fields)
+        while True:
+            r = self.jget(remote, params=params)
+            page = loads_response(r)
+            if r.status_code == 400:
+                raise InvalidJobOptionError(page["error"])
+            for job in page["jobs"]:
+                yield job
+            if page.get("next_cursor", None) is None:
+                return
+            params['cursor'] = page["next_cursor"]
 
     def get_running_jobs(self):
         """
@@ -113,7 +170,7 @@ class RemoteJobManager(ClientMixin):
         """
         remote = self._daemon_addr + '/jobs/running'
         r = self.jget(remote)
-        return hoplite_loads(str(r.text))["jobs"]
+        return loads_response(r)["jobs"]
 
     def get_job_plugins(self):
         """
@@ -124,7 +181,7 @@ class RemoteJobManager(ClientMixin):
         """
         remote = self._daemon_addr + '/job_plugins'
         r = self.jget(remote)
-        return hoplite_loads(str(r.text))["job_plugins"]
+        return loads_response(r)["job_plugins"]
 
     def reload_site_packages(self):
         """
@@ -0,0 +1,144 @@
+"""
+Role
+====
+Polls the status of many :py:class:`hoplite.client.RemoteJob` objects on the
+same server with a single request to :http:post:`/jobs/status`.
+
+Every RemoteJob registers with the multiplexer of its server. When a job
+needs fresh information, the status of every registered job that has not
+finished is fetched at once and all of them are updated. Only the jobs that
+changed since they were last seen are sent back by the server. A driver
+joining 500 jobs on one server therefore makes one request per polling
+interval instead of 500.
+
+Servers that predate :http:post:`/jobs/status` are polled one job at a time,
+as before.
+
+API
+===
+"""
+import threading
+import time
+import weakref
+
+from hoplite.client.helpers import ClientMixin, loads_response
+from hoplite.exceptions import InternalServerError, JobDoesNotExistError
+
+_multiplexers = {}
+_multiplexers_lock = threading.Lock()
+
+
+def get_multiplexer(daemon_addr):
+    """
+    Get the multiplexer shared by every job of a server
+
+    :param daemon_addr: Address of the server, such as "http://host:5000"
+    :rtype: StatusMultiplexer
+    """
+    with _multiplexers_lock:
+        multiplexer = _multiplexers.get(daemon_addr, None)
+        if multiplexer is None:
+            multiplexer = StatusMultiplexer(daemon_addr)
+            _multiplexers[daemon_addr] = multiplexer
+        return multiplexer
+
+
+class StatusMultiplexer(ClientMixin):
+    """
+    Fetches the status of every outstanding job of a server with one request
+    """
+    def __init__(self, daemon_addr):
+        """
+        :param daemon_addr: Address of the server, such as "http://host:5000"
+        """
+        self._daemon_addr = daemon_addr
+        # The jobs are only weakly referenced, so jobs nobody uses anymore
+        # stop being polled
+        self._jobs = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._supported = True
+
+    def register(self, job):
+        """
+        Have the job updated whenever the jobs of its server are polled
+        """
+        with self._lock:
+            self._jobs[id(job)] = job
+
+    def jobs(self):
+        """
+        :return: The registered jobs that still exist
+        """
+        with self._lock:
+            return self._jobs.values()
+
+    @property
+    def supports_bulk_status(self):
+        """
+        False once the server has turned out to predate bulk status queries,
+        so each job is polled with its own request
+        """
+        return self._supported
+
+    def poll(self, job=None, wait=0):
+        """
+        Update the registered jobs that have not finished, and job
+
+        :param job: A job that must be updated even if it has finished
+        :param wait: Maximum number of seconds to wait for one of the jobs to
+            change. The server returns as soon as one has
+        :return: The updated jobs which had changed
+        :raises JobDoesNotExistError: if job does not exist on the server
+        """
+        jobs = [
+            registered for registered in self.jobs()
+            if registered is job or not registered._finished]
+        if job is not None and job not in jobs:
+            jobs.append(job)
+        by_uuid = {}
+        for registered in jobs:
+            by_uuid.setdefault(registered.uuid, []).append(registered)
+        if not self._supported or (len(by_uuid) == 1 and wait <= 0):
+            # A single job is cheaper to get on its own
+            return self._poll_one_at_a_time(jobs, job)
+        versions = {}
+        for job_uuid, same_jobs in by_uuid.items():
+            # A job whose version is not known is always sent back
+            known = set(same_job._version for same_job in same_jobs)
+            versions[job_uuid] = known.pop() if len(known) == 1 else None
+        body = {'jobs': versions}
+        if wait > 0:
+            body['wait'] = wait
+        polled_at = time.time()
+        # Only reads the statuses, so it is safe to repeat
+        r = self.jpost(
+            self._daemon_addr + '/jobs/status', data=body, retry=True)
+        if r.status_code in (404, 405):
+            # The server predates bulk status queries
+            self._supported = False
+            return self._poll_one_at_a_time(jobs, job)
+        result = loads_response(r) if r.status_code == 200 else None
+        if not isinstance(result, dict) or 'jobs' not in result:
+            raise InternalServerError(
+                "Could not poll the jobs of {0}: the server answered with "
+                "status {1}".format(self._daemon_addr, r.status_code))
+        changed = []
+        for job_dict in result['jobs']:
+            for same_job in by_uuid.get(job_dict['uuid'], []):
+                same_job._set_attributes_from_response_json(job_dict)
+                changed.append(same_job)
+        for same_jobs in by_uuid.values():
+            for same_job in same_jobs:
+                same_job._last_poll = polled_at
+        if job is not None and job.uuid in result['missing']:
+            raise JobDoesNotExistError(
+                "Job with UUID: {0} does not exist".format(job.uuid))
+        return changed
+
+    def _poll_one_at_a_time(self, jobs, job):
+        if job is None:
+            job = jobs[0] if jobs else None
+        if job is None:
+            return []
+        job._get_single_job()
+        return [job]
@@ -25,12 +25,33 @@ console.
             config = {}
             run(config, MockStatusUpdater())
 
+Jobs run by the server are given a
+:py:class:`hoplite.client.BufferedStatusUpdater`, so they can report their
+progress as often as they like without slowing down or flooding the server.
+
 API
 ===
 """
+import copy
+import threading
+import time
+
 import requests
-from hoplite.serializer import hoplite_dumps
+from hoplite.serializer import (
+    BSON_MIMETYPE,
+    JSON_MIMETYPE,
+    hoplite_bson_dumps,
+    hoplite_dumps)
 from hoplite.exceptions import JobDoesNotExistError
+from hoplite.utils.status_patch import (
+    apply_patch,
+    check_patch,
+    make_patch,
+    merge_patches)
+from hoplite.utils.compression import (
+    GZIP,
+    MIN_COMPRESS_BYTES,
+    gzip_compress)
 
 
 class StatusUpdater(object):
@@ -44,25 +65,256 @@ class StatusUpdater(object):
         self._daemon_addr = 'http://{0}'.format(self.addr)
         self._api_key = api_key
         self.status = {}
+        # Copy of the status the server has, to find which keys have changed
+        self._sent = {}
+        self._session = None
 
-    def update(self, status):
+    def __getstate__(self):
+        # Updaters are passed to job processes, which make their own
+        # connections
+        state = self.__dict__.copy()
+        state['_session'] = None
+        return state
+
+    def update(self, status, flush=False):
         """
-        Updates the job's status on the server that created it.
+        Updates the job's status on the server that created it. Only the keys
+        whose values have changed since the last update are sent, and they
+        are merged into the status on the server.
 
         :param dict status: The new status of the job
+        :param flush: Ignored, every update is sent straight away
         """
         self.status = status
-        body = hoplite_dumps({
-            "api_key": self._api_key,
-            "status": status
-        })
+        changed = dict(
+            (key, value) for key, value in status.items()
+            if key not in self._sent or self._sent[key] != value)
+        if changed:
+            self._patch(make_patch(values=changed))
+
+    def patch(self, values=None, unset=None, append=None, flush=False):
+        """
+        Changes part of the job's status. The keys in unset are removed
+        first, then the values are set, then the items are appended.
+
+        :param dict values: Values to set, by key
+        :param unset: Keys to remove from the status
+        :param dict append: Lists of items to append to the list at each
+            key. Missing lists are created
+        :param flush: Ignored, every update is sent straight away
+        :raises InvalidStatusUpdateError: if items are appended to a value
+            which is not a list
+        """
+        patch = make_patch(values, unset, append)
+        check_patch(self.status, patch)
+        apply_patch(self.status, patch)
+        self._patch(patch)
+
+    def flush(self):
+        """
+        Does nothing, as every update is sent as soon as it is made
+        """
+        pass
+
+    def close(self):
+        """
+        Close the connection to the server. It is opened again by the next
+        update
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _patch(self, patch):
+        # What was sent is copied, so values the job changes in place are
+        # still seen to have changed
+        sent = copy.deepcopy(patch)
+        self._send_patch(patch)
+        apply_patch(self._sent, sent)
+
+    def _send_patch(self, patch):
+        self._request(patch)
+
+    def _request(self, patch):
+        if self._session is None:
+            # Keeps the connection to the server open between updates
+            self._session = requests.Session()
+        update = dict(patch)
+        update["api_key"] = self._api_key
+        # The server that created the job always accepts BSON, which is
+        # smaller and faster to decode, but not every status can be
+        # represented in it
+        try:
+            body = hoplite_bson_dumps(update)
+            content_type = BSON_MIMETYPE
+        except ValueError:
+            body = hoplite_dumps(update)
+            content_type = JSON_MIMETYPE
         url = self._daemon_addr + '/jobs/{0}'.format(self._uuid)
-        headers = {'content-type': 'application/json'}
-        r = requests.put(url, data=body, headers=headers)
+        headers = {'content-type': content_type}
+        # As is gzip, so large statuses are compressed
+        if len(body) >= MIN_COMPRESS_BYTES:
+            body = gzip_compress(body)
+            headers['content-encoding'] = GZIP
+        r = self._session.patch(url, data=body, headers=headers)
         if r.status_code == 404:
             raise JobDoesNotExistError
 
 
+class BufferedStatusUpdater(StatusUpdater):
+    """
+    Updates the status of the job running on the daemon from a background
+    thread. Updates made in quick succession are merged into one patch, and
+    sent at most once every flush_interval_s seconds. The job's status ends
+    up the same as if every update had been sent.
+
+    Updates that fail are reported by the next call to :meth:`update` or
+    :meth:`flush`.
+    """
+    def __init__(self, addr, uuid, api_key, flush_interval_s=.25):
+        """
+        :param flush_interval_s: Least number of seconds between updates
+            sent to the server
+        """
+        super(BufferedStatusUpdater, self).__init__(addr, uuid, api_key)
+        self.flush_interval_s = flush_interval_s
+        self._reset_buffer()
+
+    def _reset_buffer(self):
+        self._pending = None
+        self._sending = False
+        self._last_sent = 0
+        self._error = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def __getstate__(self):
+        state = super(BufferedStatusUpdater, self).__getstate__()
+        for name in ('_pending', '_sending', '_last_sent', '_error',
+                     '_condition', '_thread', '_stopping'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_buffer()
+
+    def update(self, status, flush=False):
+        """
+        Updates the job's status on the server that created it. The keys that
+        changed are sent from a background thread, merged with any other
+        updates made before they are sent.
+
+        :param dict status: The new status of the job
+        :param flush: Send the update now and wait until it has been sent,
+            for example for the final result of the job
+        """
+        super(BufferedStatusUpdater, self).update(status)
+        if flush:
+            self.flush()
+
+    def patch(self, values=None, unset=None, append=None, flush=False):
+        """
+        Changes part of the job's status. See :meth:`StatusUpdater.patch`.
+
+        :param flush: Send the update now and wait until it has been sent
+        """
+        super(BufferedStatusUpdater, self).patch(values, unset, append)
+        if flush:
+            self.flush()
+
+    def _send_patch(self, patch):
+        with self._condition:
+            self._raise_error()
+            if self._pending is None:
+                self._pending = {}
+            merge_patches(self._pending, patch)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='hoplite-status-updater')
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self):
+        """
+        Send any updates which have not been sent yet, and wait until they
+        have been. This must be called before the job's process exits.
+
+        :raises JobDoesNotExistError: if the job no longer exists on the
+            server
+        """
+        with self._condition:
+            while self._sending:
+                self._condition.wait()
+            pending = self._take_pending()
+        if pending is not None:
+            self._send(pending)
+        with self._condition:
+            self._raise_error()
+
+    def close(self):
+        """
+        Stop the background thread and close the connection to the server.
+        Updates which have not been sent are dropped, so :meth:`flush` should
+        be called first. Jobs run on threads of the server, or by its worker
+        processes, are closed once they end, so their threads do not outlive
+        them. A later update starts a new thread.
+        """
+        with self._condition:
+            thread = self._thread
+            self._stopping = True
+            self._condition.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._condition:
+            self._thread = None
+            self._stopping = False
+            self._pending = None
+        super(BufferedStatusUpdater, self).close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                if self._pending is None or self._sending:
+                    self._condition.wait()
+                    continue
+                delay = self._last_sent + self.flush_interval_s - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                pending = self._take_pending()
+            self._send(pending)
+
+    def _take_pending(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            self._sending = True
+        return pending
+
+    def _send(self, patch):
+        error = None
+        try:
+            self._request(patch)
+        except Exception as e:
+            error = e
+        with self._condition:
+            self._sending = False
+            self._last_sent = time.time()
+            if error is not None:
+                self._error = error
+            self._condition.notify_all()
+
+    def _raise_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+
 class MockStatusUpdater(object):
     """
     For use while developing a job
@@ -74,12 +326,36 @@ class MockStatusUpdater(object):
         self._api_key = api_key
         self.status = {}
 
-    def update(self, status):
+    def update(self, status, flush=False):
         """
         Prints the status to stdout for debugging and sets the
         member variable status for use in testing status updates
 
         :param status: status dictionary
+        :param flush: Ignored
         """
         self.status = status
         print(self.status)
+
+    def patch(self, values=None, unset=None, append=None, flush=False):
+        """
+        Changes part of the status and prints it to stdout for debugging
+
+        :param flush: Ignored
+        """
+        patch = make_patch(values, unset, append)
+        check_patch(self.status, patch)
+        apply_patch(self.status, patch)
+        print(self.status)
+
+    def flush(self):
+        """
+        Does nothing, as updates are printed as soon as they are made
+        """
+        pass
+
+    def close(self):
+        """
+        Does nothing
+        """
+        pass
@@ -0,0 +1,258 @@
+"""
+Role
+====
+Waits for any or all of a collection of
+:py:class:`hoplite.client.RemoteJob` objects to finish, like
+:py:func:`concurrent.futures.wait`.
+
+The jobs are grouped by server, and the jobs of each server are polled
+together with one request to :http:post:`/jobs/status` (see
+:py:mod:`hoplite.client.status_multiplexer`). The request waits on the server
+until one of the jobs changes, so waiting on thousands of jobs spread over
+many servers costs one outstanding request per server, rather than one
+request per job every 200 ms. Each server has a single thread polling it for
+all calls to :py:func:`wait`, so calling it again and again, such as with
+FIRST_COMPLETED in a loop, does not add requests. Servers that do not support
+:http:post:`/jobs/status` are asked about each job in turn.
+
+Example
+=======
+
+    ..  code-block:: python
+
+        from hoplite.client import wait, FIRST_COMPLETED
+
+        jobs = [manager.create_job('my.plugin', config) for config in configs]
+        for job in jobs:
+            job.start()
+        done, not_done = wait(jobs, return_when=FIRST_COMPLETED, timeout=600)
+
+API
+===
+"""
+import collections
+import threading
+import time
+
+from hoplite.client.remote_job import RemoteJob
+
+FIRST_COMPLETED = 'FIRST_COMPLETED'
+FIRST_EXCEPTION = 'FIRST_EXCEPTION'
+ALL_COMPLETED = 'ALL_COMPLETED'
+
+DoneAndNotDoneJobs = collections.namedtuple(
+    'DoneAndNotDoneJobs', 'done not_done')
+
+# Longest a single request waits on the server for a job to change
+LONG_POLL_S = 10
+# Least time between polls of servers which do not support long polling
+POLL_INTERVAL_S = .2
+
+
+def wait(jobs, return_when=ALL_COMPLETED, timeout=None):
+    """
+    Wait for the jobs to finish
+
+    :param jobs: The :py:class:`hoplite.client.RemoteJob` objects (or the
+        jobs returned by asynchronous remoted functions) to wait for
+    :param return_when: When to return. FIRST_COMPLETED returns once any job
+        has finished, FIRST_EXCEPTION once any job has failed or all have
+        finished, and ALL_COMPLETED once all jobs have finished
+    :param timeout: Maximum number of seconds to wait. None or -1 waits
+        until return_when is satisfied
+    :return: A named tuple of the set of finished jobs (done) and the set of
+        unfinished jobs (not_done)
+    :raises JobDoesNotExistError: if a job does not exist on its server
+    :raises ConnectionError: if a server can't be reached
+    """
+    if return_when not in (FIRST_COMPLETED, FIRST_EXCEPTION, ALL_COMPLETED):
+        raise ValueError("Invalid return_when: {0}".format(return_when))
+    jobs = set(jobs)
+    deadline = None
+    if timeout is not None and timeout >= 0:
+        deadline = time.time() + timeout
+
+    jobs_by_server = {}
+    for job in jobs:
+        remote_job = _remote_job(job)
+        jobs_by_server.setdefault(
+            remote_job._multiplexer, []).append(remote_job)
+
+    waiter = _Waiter(deadline)
+    pollers = []
+    try:
+        for multiplexer, server_jobs in jobs_by_server.items():
+            poller = _get_poller(multiplexer)
+            poller.add(waiter, server_jobs)
+            pollers.append(poller)
+        with waiter.changed:
+            while True:
+                if waiter.errors:
+                    raise waiter.errors[0]
+                done, not_done = _partition(jobs)
+                if _satisfied(done, not_done, return_when):
+                    break
+                if deadline is not None and time.time() >= deadline:
+                    break
+                # Waits in short steps so the program can still be
+                # interrupted
+                timeout_s = 1
+                if deadline is not None:
+                    timeout_s = min(timeout_s, deadline - time.time())
+                waiter.changed.wait(max(timeout_s, 0))
+    finally:
+        for poller in pollers:
+            poller.remove(waiter)
+    return DoneAndNotDoneJobs(done, not_done)
+
+
+class _Waiter(object):
+    """
+    A call to wait(), which the pollers of the servers of its jobs notify
+    whenever they have polled them
+    """
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.changed = threading.Condition()
+        self.errors = []
+
+    def notify(self, error=None):
+        with self.changed:
+            if error is not None:
+                self.errors.append(error)
+            self.changed.notify_all()
+
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def _get_poller(multiplexer):
+    with _pollers_lock:
+        poller = _pollers.get(multiplexer, None)
+        if poller is None:
+            poller = _Poller(multiplexer)
+            _pollers[multiplexer] = poller
+        return poller
+
+
+class _Poller(object):
+    """
+    Polls the jobs of a server for every call to wait() waiting on them. A
+    server has one, so however many calls there are, and however often wait
+    is called, at most one request to the server is outstanding. A request
+    already waiting on the server when wait() is called is not interrupted,
+    so jobs created after it was sent are polled once it returns. The thread
+    stops once nobody waits on the server, which may be after wait() has
+    returned, when its last request returns and updates the jobs.
+    """
+    def __init__(self, multiplexer):
+        self.multiplexer = multiplexer
+        # The jobs of the server each waiter waits on
+        self._waiters = {}
+        self._lock = threading.Lock()
+        # Wakes the thread up when the last waiter leaves, so it stops
+        # rather than sleeping until its next poll
+        self._waiters_changed = threading.Condition(self._lock)
+        self._thread = None
+
+    def add(self, waiter, jobs):
+        with self._lock:
+            self._waiters[waiter] = jobs
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='hoplite-wait')
+                # A request waiting on a server does not keep the program
+                # from exiting
+                self._thread.daemon = True
+                self._thread.start()
+
+    def remove(self, waiter):
+        with self._lock:
+            self._waiters.pop(waiter, None)
+            self._waiters_changed.notify_all()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._thread = None
+                    return
+                waiters = self._waiters.items()
+            pending = []
+            wait_s = LONG_POLL_S
+            for waiter, jobs in waiters:
+                pending.extend(
+                    job for job in jobs
+                    if not _completed(job) and job not in pending)
+                if waiter.deadline is not None:
+                    wait_s = min(
+                        wait_s, max(waiter.deadline - time.time(), 0))
+            start = time.time()
+            error = None
+            try:
+                _poll(self.multiplexer, pending, wait_s)
+            except Exception as e:
+                error = e
+            for waiter, _ in waiters:
+                waiter.notify(error)
+            elapsed = time.time() - start
+            if elapsed < POLL_INTERVAL_S:
+                # Either a job changed, or the server answered straight away
+                # because it does not support long polling
+                with self._lock:
+                    if self._waiters:
+                        self._waiters_changed.wait(
+                            min(POLL_INTERVAL_S - elapsed, max(wait_s, .01)))
+
+
+def _remote_job(job):
+    if isinstance(job, RemoteJob):
+        return job
+    # The jobs of asynchronous remoted functions wrap a RemoteJob
+    return job.job
+
+
+def _completed(job):
+    return job._finished
+
+
+def _failed(job):
+    return bool(job._status.get("exception", None))
+
+
+def _partition(jobs):
+    done = set()
+    not_done = set()
+    for job in jobs:
+        if _completed(_remote_job(job)):
+            done.add(job)
+        else:
+            not_done.add(job)
+    return done, not_done
+
+
+def _satisfied(done, not_done, return_when):
+    if not not_done:
+        return True
+    if return_when == FIRST_COMPLETED:
+        return bool(done)
+    if return_when == FIRST_EXCEPTION:
+        return any(_failed(_remote_job(job)) for job in done)
+    return False
+
+
+def _poll(multiplexer, jobs, wait_s):
+    """
+    Poll the jobs of a server, waiting up to wait_s seconds for one of them
+    to change. Servers that do not support bulk status queries are asked
+    for each job in turn
+    """
+    if not jobs:
+        return
+    if multiplexer.supports_bulk_status:
+        # Every job of the server that has not finished is polled with it
+        multiplexer.poll(jobs[0], wait=wait_s)
+    else:
+        for job in jobs:
+            multiplexer.poll(job)
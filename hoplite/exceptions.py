@@ -164,6 +164,31 @@ class JobAlreadyStartedError(HopliteError):
         return self.msg
 
 
+class InvalidJobOptionError(HopliteError):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class IdempotencyKeyReusedError(HopliteError):
+    def __init__(self, key):
+        self.msg = "Idempotency key '{0}' was already used for another " \
+                   "request".format(key)
+
+    def __str__(self):
+        return self.msg
+
+
+class InvalidStatusUpdateError(HopliteError):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
 class NotAuthorizedError(HopliteError):
     def __init__(self):
         pass
@@ -204,6 +229,18 @@ class TimeoutError(HopliteError):
         return "Waiting for job {0} timed out".format(self._uuid)
 
 
+class JobCancelledError(HopliteError):
+    """
+    Raised in a job when it is killed or runs past its deadline, and when it
+    tries to start another job after that
+    """
+    def __init__(self, uuid=''):
+        self.uuid = uuid
+
+    def __str__(self):
+        return "Job {0} was cancelled".format(self.uuid)
+
+
 class ConnectionError(HopliteError):
     def __init__(self, addr):
         self.addr = addr
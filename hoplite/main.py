@@ -8,10 +8,16 @@ import argparse
 import pprint
 import sys
 from datetime import timedelta
-from tornado.wsgi import WSGIContainer
 from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop
 from globals import HopliteServerSettings
+from hoplite.server.log_janitor import LogJanitor
+from hoplite.server.jobs.process_tree import KILL_GRACE_PERIOD_S
+from hoplite.server.jobs.executors import PROCESS_POOL_SIZE, THREAD_POOL_SIZE
+from hoplite.server.jobs.result_cache import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_S
+from hoplite.server.jobs.idempotency import IDEMPOTENCY_KEY_TTL_S
+from hoplite.server.wsgi_container import StreamingWSGIContainer
+import hoplite.api.helpers
 
 logger = server_logging.get_server_logger(__name__)
 
@@ -117,6 +123,33 @@ def get_server_options_parser():
 
     parser.add_argument('-p', '--port', default='5000', help='The port number to listen on')
     parser.add_argument('-d', '--debug', action='store_true', help='Start the server in debug mode')
+    parser.add_argument('--log-max-age-days', type=float, default=30,
+                        help='Job and remoted function logs older than this are deleted. 0 keeps logs regardless '
+                             'of their age')
+    parser.add_argument('--log-max-size-mb', type=float, default=1024,
+                        help='Once job and remoted function logs take up more than this, the oldest ones are '
+                             'deleted. 0 disables the quota')
+    parser.add_argument('--log-compress-after-hours', type=float, default=1,
+                        help='Logs that have not been written to for this long are compressed. 0 disables '
+                             'compression')
+    parser.add_argument('--no-log-janitor', action='store_true',
+                        help='Never compress or delete job and remoted function logs')
+    parser.add_argument('--kill-grace-period', type=float, default=KILL_GRACE_PERIOD_S,
+                        help='Seconds the processes of a killed job are given to exit before they are killed '
+                             'forcefully')
+    parser.add_argument('--thread-pool-size', type=int, default=THREAD_POOL_SIZE,
+                        help='Most jobs run on threads of the server at once')
+    parser.add_argument('--process-pool-size', type=int, default=PROCESS_POOL_SIZE,
+                        help='Number of worker processes that run pooled-process jobs')
+    parser.add_argument('--result-cache-size', type=int, default=RESULT_CACHE_MAX_ENTRIES,
+                        help='Most results of jobs that ask for their results to be cached are kept. 0 disables '
+                             'the cache')
+    parser.add_argument('--result-cache-ttl', type=float, default=RESULT_CACHE_TTL_S,
+                        help='Seconds cached results of jobs are kept for, unless their plugin asks for another '
+                             'time')
+    parser.add_argument('--idempotency-key-ttl', type=float, default=IDEMPOTENCY_KEY_TTL_S,
+                        help='Seconds the Idempotency-Key of a request creating or starting a job is remembered '
+                             'for, so retries of the request are not handled twice')
 
     return parser
 
@@ -134,8 +167,17 @@ def server_main(args=sys.argv):
     HopliteServerSettings.debug = args.debug
 
     app = create_app()
+    hoplite.api.helpers.manager.kill_grace_period_s = args.kill_grace_period
+    hoplite.api.helpers.manager.thread_pool_size = args.thread_pool_size
+    hoplite.api.helpers.manager.process_pool_size = args.process_pool_size
+    hoplite.api.helpers.manager.result_cache.max_entries = args.result_cache_size
+    hoplite.api.helpers.manager.result_cache.ttl_s = args.result_cache_ttl
+    hoplite.api.helpers.manager.idempotency_keys.ttl_s = args.idempotency_key_ttl
+    log_janitor = get_log_janitor(args)
+    if log_janitor is not None:
+        log_janitor.start()
     logger.info('Starting Hoplite server on port {}'.format(args.port))
-    http_server = HTTPServer(WSGIContainer(app))
+    http_server = HTTPServer(StreamingWSGIContainer(app))
     http_server.listen(args.port)
     ioloop = IOLoop.instance()
     # This is needed to ensure Ctrl-C kills the server quickly
@@ -148,6 +190,21 @@ def server_main(args=sys.argv):
         # Ensure that the server always closes the socket when it's no longer
         # in use
         ioloop.stop()
+        hoplite.api.helpers.manager.shutdown(timeout=10)
+
+
+def get_log_janitor(args):
+    """
+    Create the janitor of the logs from the server's options
+    :return: The janitor, or None if it is disabled
+    """
+    if args.no_log_janitor:
+        return None
+    return LogJanitor(
+        max_age_s=args.log_max_age_days * 24 * 60 * 60 or None,
+        max_total_bytes=int(args.log_max_size_mb * 1024 * 1024) or None,
+        compress_after_s=args.log_compress_after_hours * 60 * 60 or None,
+        active_paths=hoplite.api.helpers.manager.active_log_paths)
 
 
 def client_main():
@@ -9,7 +9,7 @@ from hoplite.exceptions import JobFailedError
 from globals import HopliteClientSettings
 
 
-def remotify(module_name, functions=None, add_documentation=True):
+def remotify(module_name, functions=None, add_documentation=True, cache=False):
     """
     Decorator which can be used to add remote capabilities to functions or
     classes.
@@ -50,6 +50,14 @@ def remotify(module_name, functions=None, add_documentation=True):
       should be included
     :type add_documentation: bool
     :type functions: list of [str]
+    :param cache: If true, the function must return the same values whenever
+      it is called with the same arguments (and, for methods, on an instance
+      in the same state). The remote machine then returns the values it
+      returned for the last identical call, if it has them, rather than
+      calling it again, and calls made while an identical call is running
+      wait for it (see :mod:`hoplite.server.jobs.result_cache`). It may also
+      be the number of seconds the remote machine keeps the values for
+    :type cache: bool or float
     """
     if functions is None:
         functions = []
@@ -78,9 +86,9 @@ def remotify(module_name, functions=None, add_documentation=True):
                             'Unable to add remote capability to function {0}:'
                             ' function cannot begin with "remote_" or '
                             '"async_"'.format(name))
-                    class_func = wraps(func)(remote_func_builder(name))
+                    class_func = wraps(func)(remote_func_builder(name, cache))
                     async_class_func = wraps(func)(
-                        remote_async_func_builder(name))
+                        remote_async_func_builder(name, cache))
                     class_func.__name__ = 'remote_' + class_func.__name__
                     async_class_func.__name__ = 'remote_async_' + \
                         async_class_func.__name__
@@ -119,9 +127,9 @@ def remotify(module_name, functions=None, add_documentation=True):
                   ' function cannot begin with "remote_" or "async_"'.format(
                       name))
             mod_func = wraps(func)(
-                remote_module_func_builder(name, module_name))
+                remote_module_func_builder(name, module_name, cache))
             async_mod_func = wraps(func)(
-                remote_module_async_func_builder(name, module_name))
+                remote_module_async_func_builder(name, module_name, cache))
             mod_func.__name__ = 'remote_' + mod_func.__name__
             async_mod_func.__name__ = 'remote_async_' + async_mod_func.__name__
             if add_documentation:
@@ -285,7 +293,7 @@ class RemoteEnablerMetaClass(type):
         return type.__new__(mcs, clsname, bases, dct)
 
 
-def remote_func_builder(function_name):
+def remote_func_builder(function_name, cache=False):
     """
     Build a function that will connect to a remote machine and execute a
     function on it.
@@ -294,6 +302,8 @@ def remote_func_builder(function_name):
         the remote machine.  This is necessary because, even though it is
         technically something like remote_do_stuff that is called, it will be
         recognized as _remote_func instead.
+    :param cache: Let the remote machine reuse the values returned by
+        identical calls (see :func:`remotify`)
     :returns: Function that, when called, will connect to a remote machine and
         execute the function represented by 'function_name'
     """
@@ -315,7 +325,8 @@ def remote_func_builder(function_name):
             default (5000), then "remote_machine_address" can be specified in
             the form "address:port"
         :param remote_timeout: Timeout (in floating-point seconds) of the
-            function
+            function. The remote machine kills the function if it runs for
+            longer
         :param *args: Normal arguments being passed to the remotely called
             function
         :param *kwargs: Keyword arguments being passed to the remotely called
@@ -327,9 +338,13 @@ def remote_func_builder(function_name):
         logger.addHandler(logging.NullHandler())
 
         remote_timeout = -1
+        max_runtime = None
         timeout_message = ''
         if kwargs.get('remote_timeout') is not None and kwargs['remote_timeout'] > 0.0:
             remote_timeout = kwargs['remote_timeout']
+            # The server kills the job once it times out, so it does not
+            # keep running after the caller has given up on it
+            max_runtime = remote_timeout
             kwargs.pop('remote_timeout')
             timeout_message = ' with timeout of {} seconds'.format(
                 remote_timeout)
@@ -359,7 +374,8 @@ def remote_func_builder(function_name):
             job_manager = client.remote_job_manager.RemoteJobManager(
                 remote_machine_address)
             job = job_manager.create_job(
-                'hoplite.plugins.remote_enabler_job', config)
+                'hoplite.plugins.remote_enabler_job', config,
+                max_runtime=max_runtime, cache=cache or None)
             job.start()
             job.join(remote_timeout)
 
@@ -407,13 +423,15 @@ def remote_func_builder(function_name):
     return _remote_func
 
 
-def remote_async_func_builder(function_name):
+def remote_async_func_builder(function_name, cache=False):
     """
     Build a function that will connect to a remote machine and create a job
     wrapper that can be used to run a function asynchronously
 
     :param function_name: The name of the class function that will be called on
         the remote machine.
+    :param cache: Let the remote machine reuse the values returned by
+        identical calls (see :func:`remotify`)
     :returns: Function that, when called, will connect to a remote machine and
         create then return a job wrapper for running the specified function
     """
@@ -454,18 +472,20 @@ def remote_async_func_builder(function_name):
         job_manager = client.remote_job_manager.RemoteJobManager(
             remote_machine_address)
         job = job_manager.create_job(
-            'hoplite.plugins.remote_enabler_job', config)
+            'hoplite.plugins.remote_enabler_job', config, cache=cache or None)
         return RemoteAsyncJobWrapper(job, function_name)
     return _remote_async_func
 
 
-def remote_module_func_builder(function_name, module_name):
+def remote_module_func_builder(function_name, module_name, cache=False):
     """
     Build a function that will connect to a remote machine and execute a
     function on it.
 
     :param function_name: The name of the function that will be called on the
         remote machine.
+    :param cache: Let the remote machine reuse the values returned by
+        identical calls (see :func:`remotify`)
     :returns: Function that, when called, will connect to a remote machine and
         execute the function represented by 'function_name'
     """
@@ -485,7 +505,9 @@ def remote_module_func_builder(function_name, module_name):
             the port can be specified in the form "address:port"
         :param *args: Normal arguments being passed to the remotely called
             function
-        :param remote_timeout:
+        :param remote_timeout: Timeout (in floating-point seconds) of the
+            function. The remote machine kills the function if it runs for
+            longer
         :param *kwargs: Keyword arguments being passed to the remotely called
             function
         :returns: The value(s) returned by the function which was called on the
@@ -495,9 +517,13 @@ def remote_module_func_builder(function_name, module_name):
         logger.addHandler(logging.NullHandler())
 
         remote_timeout = -1
+        max_runtime = None
         timeout_message = ''
         if kwargs.get('remote_timeout') is not None and kwargs['remote_timeout'] > 0.0:
             remote_timeout = kwargs['remote_timeout']
+            # The server kills the job once it times out, so it does not
+            # keep running after the caller has given up on it
+            max_runtime = remote_timeout
             kwargs.pop('remote_timeout')
             timeout_message = ' with timeout of {} seconds'.format(
                 remote_timeout)
@@ -527,7 +553,8 @@ def remote_module_func_builder(function_name, module_name):
             job_manager = client.remote_job_manager.RemoteJobManager(
                 remote_machine_address)
             job = job_manager.create_job(
-                'hoplite.plugins.remote_enabler_module_job', config)
+                'hoplite.plugins.remote_enabler_module_job', config,
+                max_runtime=max_runtime, cache=cache or None)
             job.start()
             job.join(remote_timeout)
         except JobFailedError as e:
@@ -572,13 +599,16 @@ def remote_module_func_builder(function_name, module_name):
     return _remote_module_func
 
 
-def remote_module_async_func_builder(function_name, module_name):
+def remote_module_async_func_builder(function_name, module_name,
+                                     cache=False):
     """
     Build a function that will connect to a remote machine and create a job
     wrapper that can be used to run a function asynchronously
 
     :param function_name: The name of the class function that will be called on
         the remote machine.
+    :param cache: Let the remote machine reuse the values returned by
+        identical calls (see :func:`remotify`)
     :returns: Function that, when called, will connect to a remote machine and
         create then return a job wrapper for running the specified function
     """
@@ -625,7 +655,8 @@ def remote_module_async_func_builder(function_name, module_name):
         job_manager = client.remote_job_manager.RemoteJobManager(
             remote_machine_address)
         job = job_manager.create_job(
-            'hoplite.plugins.remote_enabler_module_job', config)
+            'hoplite.plugins.remote_enabler_module_job', config,
+            cache=cache or None)
         return RemoteAsyncJobWrapper(job, function_name)
     return _remote_async_module_func
 
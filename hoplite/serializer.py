@@ -12,6 +12,20 @@ Hoplite requires a json serializer that:
         We copy and modify the
     bson.json_util.loads function and object hook in this module to make it
         satisfy the requirements described above.
+
+Most payloads (job configs, statuses and lists of jobs) only contain plain
+JSON types. Converting them with bson.json_util is many times slower than
+encoding them directly, so both functions take a fast path when they can tell
+the payload contains no extended types: hoplite_dumps checks the types of the
+values, and hoplite_loads checks the text for "$", which every extended type
+key starts with. The output of the fast path is identical to the output of
+the slow path. simplejson is used to decode if it is installed, and the JSON
+module used by the fast path can be replaced with :func:`set_json_backend`.
+
+The REST API can also use BSON rather than JSON text (see
+:ref:`REST-API-Content-Types`). It is encoded and decoded with
+:func:`hoplite_bson_dumps` and :func:`hoplite_bson_loads`, which decode to the
+same values as hoplite_loads.
 """
 
 import base64
@@ -21,10 +35,11 @@ import re
 import uuid
 
 import bson
-from bson import EPOCH_AWARE, EPOCH_NAIVE
+from bson import BSON, EPOCH_AWARE, EPOCH_NAIVE
 from bson.binary import Binary
 from bson.code import Code
 from bson.dbref import DBRef
+from bson.errors import BSONError
 from bson.int64 import Int64
 from bson.max_key import MaxKey
 from bson.min_key import MinKey
@@ -32,9 +47,12 @@ from bson.objectid import ObjectId
 from bson.regex import Regex
 from bson.timestamp import Timestamp
 
-
+from bson import json_util
 from bson.json_util import dumps
 
+JSON_MIMETYPE = 'application/json'
+BSON_MIMETYPE = 'application/bson'
+
 _RE_OPT_TABLE = {
     "i": re.I,
     "l": re.L,
@@ -45,6 +63,50 @@ _RE_OPT_TABLE = {
 }
 
 
+# Types bson.json_util leaves for the json module to encode. Subclasses of
+# these, such as bson.code.Code and bson.int64.Int64, are extended types.
+_PLAIN_TYPES = frozenset([str, unicode, int, long, bool, type(None)])
+# Dictionary keys every backend writes like the json module. Python 2's json
+# module writes the key True as "True", but simplejson as "true"
+_PLAIN_KEY_TYPES = frozenset([str, unicode, int, long, float, type(None)])
+# JSONMode.CANONICAL, which also wraps numbers (pymongo >= 3.5)
+_CANONICAL_JSON_MODE = 2
+
+
+def _default_loads_backend():
+    # simplejson decodes faster than the json module, but only with its C
+    # extension. It encodes slower, so it is not used by hoplite_dumps.
+    try:
+        import simplejson._speedups
+    except ImportError:
+        return json
+    return simplejson
+
+_dumps_backend = json
+_loads_backend = _default_loads_backend()
+
+
+def set_json_backend(backend=None):
+    """
+    Set the module used to encode and decode payloads without extended types.
+
+    The backend is only used when no extra arguments are given to
+    hoplite_dumps and hoplite_loads, and must produce exactly the same output
+    as the json module for plain JSON types.
+
+    :param backend: Module with the same dumps and loads functions as the json
+        module. None restores the defaults: the json module for encoding, and
+        simplejson for decoding if it is installed with its C extension
+    """
+    global _dumps_backend, _loads_backend
+    if backend is None:
+        _dumps_backend = json
+        _loads_backend = _default_loads_backend()
+    else:
+        _dumps_backend = backend
+        _loads_backend = backend
+
+
 def hoplite_dumps(obj, *args, **kwargs):
     """
     Serializes a dictionary into unicode(unless specified otherwise)
@@ -57,6 +119,10 @@ def hoplite_dumps(obj, *args, **kwargs):
         bson.json_util.dumps and json.dumps
     :return: serialized obj in unicode
     """
+    if 'json_options' not in kwargs and 'default' not in kwargs and \
+            'cls' not in kwargs and _is_plain_json_mode() and _is_plain(obj):
+        backend = json if args or kwargs else _dumps_backend
+        return backend.dumps(obj, *args, **kwargs)
     return dumps(obj, *args, **kwargs)
 
 
@@ -69,10 +135,115 @@ def hoplite_loads(s, *args, **kwargs):
     compile_re = kwargs.pop('compile_re', True)
     ensure_tzinfo = kwargs.pop('ensure_tzinfo', False)
     encoding = kwargs.pop('encoding', 'utf-8')
+    # Every extended type is an object with a key starting with "$", which
+    # may also have been written as the escape sequence "\u0024"
+    if '$' not in s and '\\u0024' not in s:
+        backend = json if args or kwargs else _loads_backend
+        if backend is not json and isinstance(s, str):
+            # Other backends may decode ASCII strings to str rather than
+            # unicode when given a str
+            s = s.decode('utf-8')
+        if encoding:
+            kwargs['object_hook'] = lambda dct: encode_object(dct, encoding)
+        return backend.loads(s, *args, **kwargs)
     kwargs['object_hook'] = lambda dct: object_hook(dct, compile_re, ensure_tzinfo, encoding)
     return json.loads(s, *args, **kwargs)
 
 
+def hoplite_bson_dumps(obj):
+    """
+    Serializes a dictionary into BSON
+    :param obj: Python dictionary to be serialized
+    :return: serialized obj
+    :raises ValueError: if obj can't be represented in BSON, for example
+        because it contains strings which are not UTF-8, integers larger
+        than 64 bits or keys which are not strings. Such dictionaries can
+        still be serialized with hoplite_dumps
+    """
+    try:
+        return BSON.encode(obj)
+    except (BSONError, OverflowError, TypeError) as e:
+        raise ValueError(
+            "Can't be represented in BSON: {0}".format(e))
+
+
+def hoplite_bson_loads(data, compile_re=True, encoding='utf-8'):
+    """
+    Decodes a dictionary serialized into BSON. The result is the same as
+    decoding the dictionary with hoplite_loads after it was serialized with
+    hoplite_dumps.
+    :param data: serialized dictionary
+    :return: unserialized dictionary
+    """
+    return _from_bson(BSON(data).decode(), compile_re, encoding)
+
+
+def _from_bson(obj, compile_re, encoding):
+    if isinstance(obj, dict):
+        dct = dict(
+            (key, _from_bson(value, compile_re, encoding))
+            for key, value in obj.iteritems())
+        return encode_object(dct, encoding) if encoding else dct
+    if isinstance(obj, list):
+        return [_from_bson(value, compile_re, encoding) for value in obj]
+    if compile_re and isinstance(obj, Regex):
+        return obj.try_compile()
+    if isinstance(obj, Int64):
+        # Integers too large for 32 bits are stored as 64 bit integers. JSON
+        # has a single integer type, so they are decoded as plain integers.
+        return long(obj)
+    return obj
+
+
+def _is_plain_json_mode():
+    mode = getattr(json_util.DEFAULT_JSON_OPTIONS, 'json_mode', None)
+    return mode != _CANONICAL_JSON_MODE
+
+
+def _is_plain(obj):
+    """
+    :return: True if obj is made of plain JSON types only, in which case
+        bson.json_util.dumps would give it to the json module unchanged
+    """
+    obj_type = type(obj)
+    if obj_type in _PLAIN_TYPES:
+        return True
+    if obj_type is float:
+        # Infinity and NaN are extended types in the newer JSON modes
+        return obj - obj == 0
+    if obj_type is dict:
+        for key, value in obj.iteritems():
+            if type(key) not in _PLAIN_KEY_TYPES:
+                return False
+            if not _is_plain(value):
+                return False
+        return True
+    if obj_type is list or obj_type is tuple:
+        for value in obj:
+            if not _is_plain(value):
+                return False
+        return True
+    return False
+
+
+def encode_object(dct, encoding):
+    """
+    Converts all keys and unicode values in the top layer of a decoded
+    dictionary to the given encoding.
+    :param dct: Dictionary decoded by the json module
+    :param encoding: Encoding the text is converted to
+    :return: The converted dictionary
+    """
+    new_dct = {}
+    for key, value in dct.iteritems():
+        if isinstance(key, unicode):
+            key = key.encode(encoding)
+        if isinstance(value, unicode):
+            value = value.encode(encoding)
+        new_dct[key] = value
+    return new_dct
+
+
 def object_hook(dct, compile_re=False, ensure_tzinfo=True, encoding=None):
     """
     Object hook used by hoplite_loads. This object hook can encode the
@@ -90,16 +261,7 @@ def object_hook(dct, compile_re=False, ensure_tzinfo=True, encoding=None):
     """
 
     if encoding:
-        # Converts all keys and unicode values in the top layer of the current
-        # dictionary to the desired encoding type.
-        new_dct = {}
-        for key, value in dct.iteritems():
-            if isinstance(key, unicode):
-                key = key.encode(encoding)
-            if isinstance(value, unicode):
-                value = value.encode(encoding)
-            new_dct[key] = value
-        dct = new_dct
+        dct = encode_object(dct, encoding)
 
     if "$oid" in dct:
         return ObjectId(str(dct["$oid"]))
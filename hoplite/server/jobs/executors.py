@@ -0,0 +1,598 @@
+"""
+How the plugins of jobs are run. A job runs on one of these executors,
+asked for when the job is created (see :ref:`REST-API-Jobs`), or declared by
+the plugin module with an ``EXECUTOR`` attribute::
+
+    EXECUTOR = 'thread'
+
+    def run(config, status):
+        ...
+
+* process - The default. Each job is run in a new process, which is the
+  leader of its own process group. Killing the job sends SIGTERM to the
+  group, and SIGKILL to what is left once the kill grace period has passed
+  (see :mod:`hoplite.server.jobs.process_tree`).
+* thread - The job is run on a thread of the server, from a bounded pool.
+  This costs next to nothing to start, so it suits jobs that spend their
+  time waiting on other servers. Threads can't be killed: killing the job
+  cancels its context (see :mod:`hoplite.utils.job_context`), which the
+  plugin has to check. If it has not returned once the grace period has
+  passed, JobCancelledError is raised in its thread the next time it runs
+  Python code, which the plugin may not let through. Such a job stays
+  "killing" until the plugin returns. A plugin that crashes or hangs the
+  interpreter takes the server with it, so only trusted plugins should use
+  this.
+* pooled-process - The job is run by one of a pool of worker processes,
+  which are started once and reused. Killing the job sends SIGTERM to the
+  worker's process group, which cancels the job and leaves the worker to
+  run the next one. If the job has not finished once the grace period has
+  passed the worker is killed with SIGKILL, and replaced when the next job
+  is run.
+
+Jobs run under a profiler are always run in a process of their own, since
+profilers change the state of the whole process.
+
+The threads and worker processes of the pools keep the resources plugins
+set up (see :mod:`hoplite.server.jobs.plugin_resources`) between the jobs
+they run, until the pool is shut down.
+
+Jobs started while all the threads or workers of a pool are busy wait for
+one to be free. They are counted as running while they wait, and their
+process_spawned_at is when they were handed to the pool.
+"""
+from multiprocessing import Pipe, Process, Value
+import Queue
+import ctypes
+import logging
+import os
+import pickle
+import signal
+import threading
+import time
+
+from hoplite.exceptions import JobCancelledError
+from hoplite.utils.job_context import JobContext
+from job_wrapper import job_wrapper
+from plugin_resources import PluginResources
+from process_tree import ProcessTree, start_session
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+PROCESS = 'process'
+THREAD = 'thread'
+POOLED_PROCESS = 'pooled-process'
+EXECUTORS = (PROCESS, THREAD, POOLED_PROCESS)
+
+# Default sizes of the pools
+THREAD_POOL_SIZE = 16
+PROCESS_POOL_SIZE = 4
+
+
+class ProcessExecutor(object):
+    """
+    Runs each job in a new process
+    """
+    name = PROCESS
+
+    def submit(self, job_kwargs, on_exit=None):
+        """
+        Start running a job
+
+        :param job_kwargs: Keyword arguments of
+            :func:`hoplite.server.jobs.job_wrapper.job_wrapper`, other than
+            pipe_to_parent, plugin_loaded_at and new_session
+        :param on_exit: Called without arguments once the job has finished,
+            if the executor can tell straight away
+        :return: The task running the job
+        """
+        return ProcessTask(job_kwargs)
+
+    def shutdown(self, timeout=None):
+        """
+        Nothing is kept between jobs, so there is nothing to stop
+        """
+        pass
+
+
+class ProcessTask(object):
+    """
+    A job running in a process of its own. Every task has the same methods,
+    used by :class:`hoplite.server.jobs.job.Job`.
+    """
+    def __init__(self, job_kwargs):
+        # The exception raised by the plugin, if any, is sent through the
+        # pipe. The job process writes to the other end, which is closed
+        # here once the process is started so reads end when it exits.
+        self.results, results_to_parent = Pipe()
+        # Written by the job process once the plugin module has been loaded
+        self._loaded_at = Value('d', 0.0, lock=False)
+        kwargs = dict(
+            job_kwargs, plugin_loaded_at=self._loaded_at, new_session=True)
+        self._process = Process(
+            target=job_wrapper, args=(results_to_parent,), kwargs=kwargs)
+        self._process.start()
+        results_to_parent.close()
+        self.pid = self._process.pid
+        self._tree = ProcessTree(self.pid)
+        self._exited = False
+
+    def is_alive(self):
+        """
+        :return: True until the plugin has returned
+        """
+        if self._process.is_alive():
+            return True
+        if not self._exited:
+            # The job process has just been reaped, so its group is checked
+            # before its ID can be reused
+            self._exited = True
+            self._tree.job_exited()
+        return False
+
+    def plugin_loaded_at(self):
+        """
+        :return: The time the plugin module was loaded, or None
+        """
+        return self._loaded_at.value or None
+
+    def terminate(self):
+        """
+        Ask the job to stop
+        """
+        self._tree.terminate()
+        self._process.terminate()
+
+    def kill(self):
+        """
+        Stop what is left of the job, once it has been given time to stop
+        """
+        self._tree.kill()
+        if self._process.is_alive() and hasattr(signal, 'SIGKILL'):
+            # The job process may not have started its session yet
+            os.kill(self.pid, signal.SIGKILL)
+
+    def alive(self):
+        """
+        :return: True while the job, or a process it started, is running
+        """
+        return self._tree.alive(self._process.is_alive())
+
+    def count_alive(self):
+        """
+        :return: The number of processes of the job that are running, or
+            None if it is not known
+        """
+        return self._tree.count_alive(self._process.is_alive())
+
+
+class _Results(object):
+    """
+    Stands in for the pipe of a process task, for tasks that are not run in
+    a process of their own
+    """
+    def __init__(self):
+        self._items = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def send(self, item):
+        # Goes through pickle like anything sent through a pipe, so that what
+        # the job gets is the same whatever runs it
+        self.put(pickle.loads(pickle.dumps(item, pickle.HIGHEST_PROTOCOL)))
+
+    def put(self, item):
+        with self._lock:
+            self._items.append(item)
+
+    def poll(self):
+        with self._lock:
+            return bool(self._items) or self._closed
+
+    def recv(self):
+        with self._lock:
+            if self._items:
+                return self._items.pop(0)
+        raise EOFError
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+
+
+class _LoadedAt(object):
+    """
+    Stands in for the shared value the plugin load time is written to
+    """
+    def __init__(self, on_set=None):
+        self._value = 0.0
+        self._on_set = on_set
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        if self._on_set is not None:
+            self._on_set(value)
+
+
+class _PooledTask(object):
+    """
+    A job waiting for, or running on, a thread or worker of a pool
+    """
+    def __init__(self, job_kwargs, on_exit):
+        self.job_kwargs = job_kwargs
+        self.results = _Results()
+        self.pid = None
+        self._on_exit = on_exit
+        self._loaded_at = _LoadedAt()
+        self._lock = threading.Lock()
+        self._started = False
+        self._cancelled = False
+        self._finished = threading.Event()
+
+    def is_alive(self):
+        return not self._finished.is_set()
+
+    def plugin_loaded_at(self):
+        return self._loaded_at.value or None
+
+    def alive(self):
+        return self.is_alive()
+
+    def count_alive(self):
+        return int(self.is_alive())
+
+    def _cancel_if_waiting(self):
+        """
+        :return: True if the task was waiting for the pool, and won't be run
+        """
+        with self._lock:
+            if self._started or self._finished.is_set():
+                return False
+            self._cancelled = True
+        # The job is being killed, which records its end
+        self.finish(notify=False)
+        return True
+
+    def claim(self):
+        """
+        Called by the pool before running the task
+
+        :return: False if the task has been cancelled while it waited
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._started = True
+            return True
+
+    def finish(self, notify=True):
+        """
+        Called once the task has ended, whether it ran or not
+
+        :param notify: Call on_exit
+        """
+        with self._lock:
+            if self._finished.is_set():
+                return
+            self._finished.set()
+        self.results.close()
+        if notify and self._on_exit is not None:
+            try:
+                self._on_exit()
+            except Exception:
+                logger.exception("Could not record the end of a job")
+
+
+class _Pool(object):
+    """
+    Runs tasks on up to size threads, which are started as they are needed
+    """
+    thread_name = 'hoplite-pool'
+
+    def __init__(self, size):
+        self.size = size
+        self._tasks = Queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._idle = 0
+        self._all_threads = []
+
+    def _put(self, task):
+        with self._lock:
+            start_thread = self._idle <= 0 and self._threads < self.size
+            if start_thread:
+                self._threads += 1
+            else:
+                self._idle -= 1
+        if start_thread:
+            thread = threading.Thread(target=self._work, name=self.thread_name)
+            thread.daemon = True
+            thread.start()
+            with self._lock:
+                self._all_threads.append(thread)
+        self._tasks.put(task)
+
+    def shutdown(self, timeout=None):
+        """
+        Stop the threads of the pool once the jobs handed to it have run,
+        so the resources they keep are torn down
+
+        :param timeout: Most seconds to wait for the threads to stop
+        """
+        with self._lock:
+            threads = self._all_threads
+            self._all_threads = []
+            self._threads -= len(threads)
+            self._idle -= len(threads)
+        for _ in threads:
+            self._tasks.put(None)
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in threads:
+            thread.join(
+                None if deadline is None else max(deadline - time.time(), 0))
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                self._stop_thread()
+                return
+            if task.claim():
+                try:
+                    self._run(task)
+                except Exception:
+                    logger.exception("Could not run a job")
+            # A cancellation can be raised in the thread as it finishes
+            while task.is_alive():
+                try:
+                    task.finish()
+                except Exception:
+                    pass
+            with self._lock:
+                self._idle += 1
+
+    def _run(self, task):
+        raise NotImplementedError
+
+    def _stop_thread(self):
+        """
+        Called by each thread of the pool as it stops
+        """
+        pass
+
+
+class ThreadExecutor(_Pool):
+    """
+    Runs jobs on a bounded pool of threads of the server
+    """
+    name = THREAD
+    thread_name = 'hoplite-job-thread'
+
+    def __init__(self, size=THREAD_POOL_SIZE):
+        super(ThreadExecutor, self).__init__(size)
+        self._resources = threading.local()
+
+    def submit(self, job_kwargs, on_exit=None):
+        task = ThreadTask(job_kwargs, on_exit)
+        self._put(task)
+        return task
+
+    def _run(self, task):
+        resources = getattr(self._resources, 'resources', None)
+        if resources is None:
+            resources = self._resources.resources = PluginResources()
+        task.run(resources)
+
+    def _stop_thread(self):
+        resources = getattr(self._resources, 'resources', None)
+        if resources is not None:
+            resources.teardown_all()
+
+
+def _raise_in_thread(thread_id, exception_type):
+    """
+    Raise an exception in another thread, the next time it runs Python code.
+    An exception_type of None clears one that has not been raised yet.
+    """
+    if not hasattr(ctypes, 'pythonapi'):
+        return
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_long(thread_id),
+        None if exception_type is None else ctypes.py_object(exception_type))
+
+
+class ThreadTask(_PooledTask):
+    """
+    A job run on a thread of the server
+    """
+    def __init__(self, job_kwargs, on_exit):
+        super(ThreadTask, self).__init__(job_kwargs, on_exit)
+        self._context = JobContext(
+            job_kwargs.get('uuid', ''), job_kwargs.get('deadline'))
+        self._thread_id = None
+
+    def run(self, resources=None):
+        with self._lock:
+            self._thread_id = threading.current_thread().ident
+        job_wrapper(
+            self.results, plugin_loaded_at=self._loaded_at,
+            context=self._context, resources=resources, **self.job_kwargs)
+
+    def finish(self, notify=True):
+        with self._lock:
+            if self._thread_id is not None and not self._finished.is_set():
+                # A cancellation that has not been raised yet must not be
+                # raised in the next job run on the thread
+                _raise_in_thread(self._thread_id, None)
+        super(ThreadTask, self).finish(notify)
+
+    def terminate(self):
+        if self._cancel_if_waiting():
+            return
+        # Killing the remote jobs the job created takes requests to other
+        # servers, which the caller should not wait for
+        cancel = threading.Thread(
+            target=self._context.cancel, name='hoplite-job-cancel')
+        cancel.daemon = True
+        cancel.start()
+
+    def kill(self):
+        # Threads can't be killed. Raising an exception in the thread while
+        # the plugin is cleaning up after being cancelled would interrupt it,
+        # so it is only done once the plugin has had time to return.
+        with self._lock:
+            if self._thread_id is not None and not self._finished.is_set():
+                _raise_in_thread(self._thread_id, JobCancelledError)
+
+
+def _pool_worker(connection):
+    """
+    Main function of a worker process of a process pool. Runs the jobs sent
+    through the connection one at a time, until None is sent or the
+    connection is closed.
+    """
+    start_session()
+    resources = PluginResources()
+    while True:
+        try:
+            job_kwargs = connection.recv()
+        except (EOFError, IOError):
+            break
+        if job_kwargs is None:
+            break
+        results = _WorkerResults(connection)
+        job_wrapper(
+            results, plugin_loaded_at=_LoadedAt(results.send_loaded_at),
+            resources=resources, **job_kwargs)
+        connection.send(('done', None))
+    resources.teardown_all()
+
+
+class _WorkerResults(object):
+    """
+    Sends what the job sends its parent through the connection of the worker
+    """
+    def __init__(self, connection):
+        self._connection = connection
+
+    def send(self, item):
+        self._connection.send(('result', item))
+
+    def send_loaded_at(self, value):
+        self._connection.send(('loaded', value))
+
+
+class _Worker(object):
+    """
+    A worker process of a process pool, seen from the server
+    """
+    def __init__(self):
+        self.connection, worker_connection = Pipe()
+        self.process = Process(
+            target=_pool_worker, args=(worker_connection,),
+            name='hoplite-pool-worker')
+        self.process.daemon = True
+        self.process.start()
+        worker_connection.close()
+        self.tree = ProcessTree(self.process.pid)
+
+    def run(self, task):
+        """
+        Run the task, and wait for it to end
+
+        :return: False if the worker process died
+        """
+        try:
+            self.connection.send(task.job_kwargs)
+            while True:
+                kind, value = self.connection.recv()
+                if kind == 'done':
+                    return True
+                if kind == 'loaded':
+                    task._loaded_at.value = value
+                else:
+                    task.results.put(value)
+        except (EOFError, IOError):
+            self.process.join()
+            return False
+
+    def stop(self, timeout=None):
+        """
+        Ask the worker process to exit once it has torn down the resources
+        of its plugins, and wait for it to
+        """
+        # Processes forked since the worker was started share the connection,
+        # so closing it may not be seen by the worker
+        try:
+            self.connection.send(None)
+        except IOError:
+            pass
+        self.connection.close()
+        self.process.join(timeout)
+
+
+class ProcessPoolExecutor(_Pool):
+    """
+    Runs jobs on a bounded pool of worker processes, which are reused
+    """
+    name = POOLED_PROCESS
+    thread_name = 'hoplite-pool-worker'
+
+    def __init__(self, size=PROCESS_POOL_SIZE):
+        super(ProcessPoolExecutor, self).__init__(size)
+        self._workers = threading.local()
+
+    def submit(self, job_kwargs, on_exit=None):
+        task = PooledProcessTask(job_kwargs, on_exit)
+        self._put(task)
+        return task
+
+    def _run(self, task):
+        # Each thread of the pool drives a worker, which is started when the
+        # first job is run and replaced when it dies
+        worker = getattr(self._workers, 'worker', None)
+        if worker is None or not worker.process.is_alive():
+            # SIGTERM cancels a job while it runs (see job_wrapper), but one
+            # sent just as the job finished stops the worker
+            worker = self._workers.worker = _Worker()
+        task.assign(worker)
+        if not worker.run(task):
+            self._workers.worker = None
+
+    def _stop_thread(self):
+        worker = getattr(self._workers, 'worker', None)
+        if worker is not None:
+            self._workers.worker = None
+            worker.stop(timeout=10)
+
+
+class PooledProcessTask(_PooledTask):
+    """
+    A job run by a worker process of a process pool
+    """
+    def __init__(self, job_kwargs, on_exit):
+        super(PooledProcessTask, self).__init__(job_kwargs, on_exit)
+        self._worker = None
+
+    def assign(self, worker):
+        with self._lock:
+            self._worker = worker
+            self.pid = worker.process.pid
+
+    def terminate(self):
+        if self._cancel_if_waiting():
+            return
+        with self._lock:
+            # The worker may already be running the next job
+            if self._worker is not None and not self._finished.is_set():
+                self._worker.tree.terminate()
+
+    def kill(self):
+        with self._lock:
+            if self._worker is not None and not self._finished.is_set():
+                self._worker.tree.kill()
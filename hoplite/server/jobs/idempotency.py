@@ -0,0 +1,91 @@
+"""
+Idempotency keys, which let clients retry requests that create or start
+jobs without the jobs being created or started twice.
+
+A client that sends such a request with an ``Idempotency-Key`` header, and
+does not get an answer, can send the same request with the same key again.
+If the server had already handled the request, it answers with the job the
+first request created or started rather than handling it again. A key sent
+with a different request is an error.
+
+The server remembers the most recently used keys, up to a number of them,
+for a time.
+"""
+import collections
+import time
+
+from hoplite.exceptions import IdempotencyKeyReusedError, InvalidJobOptionError
+
+# Default number of keys remembered and seconds they are remembered for
+IDEMPOTENCY_KEY_MAX_ENTRIES = 10000
+IDEMPOTENCY_KEY_TTL_S = 24 * 60 * 60
+# Longest key accepted
+MAX_KEY_LENGTH = 255
+
+
+def check_key(key):
+    """
+    :raises InvalidJobOptionError: if the key is not a string of up to
+        MAX_KEY_LENGTH characters
+    """
+    if not isinstance(key, basestring) or not key or \
+            len(key) > MAX_KEY_LENGTH:
+        raise InvalidJobOptionError(
+            "Idempotency key must be between 1 and {0} characters".format(
+                MAX_KEY_LENGTH))
+
+
+class IdempotencyKeys(object):
+    """
+    What each key was used for, and what the request it was sent with
+    returned. It is not thread safe, so the job manager guards it.
+    """
+    def __init__(self, max_entries=IDEMPOTENCY_KEY_MAX_ENTRIES,
+                 ttl_s=IDEMPOTENCY_KEY_TTL_S):
+        """
+        :param max_entries: Most keys remembered. The least recently used are
+            forgotten first
+        :param ttl_s: Seconds keys are remembered for
+        """
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        # Requests, results and the times they expire, least recently used
+        # first
+        self._keys = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, key, request):
+        """
+        :param request: What identifies the request the key is sent with.
+            Requests that are retried have the same
+        :return: The result of the request the key was first sent with, or
+            None if the key is not known
+        :raises IdempotencyKeyReusedError: if the key was sent with another
+            request
+        """
+        entry = self._keys.pop(key, None)
+        if entry is None:
+            return None
+        first_request, result, expires_at = entry
+        if expires_at <= time.time():
+            return None
+        self._keys[key] = entry
+        if first_request != request:
+            raise IdempotencyKeyReusedError(key)
+        return result
+
+    def put(self, key, request, result):
+        """
+        Remember the result of the request the key was sent with
+        """
+        if self.max_entries <= 0:
+            return
+        self._keys.pop(key, None)
+        self._keys[key] = (request, result, time.time() + self.ttl_s)
+        while len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+
+    def clear(self):
+        self._keys.clear()
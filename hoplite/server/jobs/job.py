@@ -1,57 +1,163 @@
-from multiprocessing import Process
-from multiprocessing import Pipe
+import threading
+import time
 
+from hoplite.server import metrics
 from hoplite.utils import server_logging
 from hoplite.exceptions import (
     JobAlreadyStartedError,
     JobNotStartedError,
     NotAuthorizedError)
-from job_wrapper import job_wrapper
-from hoplite.client.status_updater import StatusUpdater
+from profiling import PROFILE_FILE_TYPES
+from hoplite.client.status_updater import BufferedStatusUpdater
 from hoplite.plugin_manager import EntryPointManager
+from hoplite.utils.status_patch import SET, apply_patch, check_patch
+from status_history import StatusHistory
+from process_tree import KILL_GRACE_PERIOD_S
+from executors import ProcessExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+KILLED = 'killed'
+STATES = (QUEUED, RUNNING, FINISHED, FAILED, KILLED)
+
+# Progress of the kill of a job's processes
+KILL_TERMINATING = 'terminating'
+KILL_KILLING = 'killing'
+KILL_TERMINATED = 'terminated'
+KILL_KILLED = 'killed'
 
 
 class Job(object):
     """
     Represents a job that has been created on the server
     """
-    def __init__(self, job_uuid, name, config, api_key, entry_point_group_name="hoplite.jobs", port=5000):
+    def __init__(self, job_uuid, name, config, api_key, entry_point_group_name="hoplite.jobs", port=5000,
+                 profiler=None, state_listener=None, change_listener=None,
+                 max_runtime=None, deadline=None,
+                 kill_grace_period_s=KILL_GRACE_PERIOD_S, executor=None,
+                 result_cache=None, cache_key=None, cache_ttl_s=None,
+                 plugin_module=None):
         """
         @param job_uuid unique identifier for this job
         @param name the name of the job, corresponds to the plugin name
         @param config dictionary object containing configuration for the
             specific job
+        @param profiler name of the profiler (see hoplite.server.jobs.profiling)
+            to run the job under, or None to run it without profiling
+        @param state_listener called with the job, its previous state and its
+            new state whenever the state (see state()) of the job changes
+        @param change_listener called with the job whenever its version
+            changes
+        @param max_runtime seconds the job may run for once started before it
+            is killed, or None to let it run for as long as it takes
+        @param deadline time, in seconds since the epoch, by which the job is
+            killed if it has not finished, or None for no deadline
+        @param kill_grace_period_s seconds the processes of a killed job are
+            given to exit after being asked to, before they are killed
+        @param executor what runs the job (see
+            hoplite.server.jobs.executors). Each job is run in a new process
+            by default
+        @param result_cache the ResultCache (see
+            hoplite.server.jobs.result_cache) the result of the job is looked
+            up in and kept in, or None to always run the job
+        @param cache_key key of the result of the job in result_cache
+        @param cache_ttl_s seconds the result of the job is cached for, or
+            None for as long as the cache keeps results by default
+        @param plugin_module the plugin module, if it has already been found.
+            Otherwise it is looked up by name
         """
         self.port = port
         self.uuid = job_uuid
         self.name = name
+        # Set by the job manager, orders the jobs by when they were created
+        self.sequence = None
         self.config = config
         self._api_key = api_key
         self._status = {}
-        self._process = None
+        self._executor = executor if executor is not None else \
+            ProcessExecutor()
+        self.executor = self._executor.name
+        # What the executor runs the job with, once it has been started
+        self._task = None
+        self._result_cache = result_cache
+        self._cache_key = cache_key
+        self._cache_ttl_s = cache_ttl_s
+        # Whether the job finished with the status of another job instead of
+        # being run
+        self._cached = False
         self._started = False
         self._killed = False
-        self._pipe_to_self = None
-        self._pipe_to_process = None
+        self._timed_out = False
+        self._exited = False
+        self.max_runtime = max_runtime
+        self.deadline = deadline
+        self.kill_grace_period_s = kill_grace_period_s
+        self._kill_requested_at = None
+        self._kill_status = None
+        self._surviving_processes = None
+        self._results = None
+        self._state_listener = state_listener
+        self._change_listener = change_listener
+        # Incremented whenever the state or status of the job changes, so
+        # clients can tell whether the job has changed since they last saw it
+        self.version = 0
+        self._history = StatusHistory()
+        # Responses that are streamed, such as a followed log, check on the
+        # job from other threads
+        self._lock = threading.RLock()
+        # Lifecycle timestamps, in seconds since the epoch. These are used to
+        # find out how much of a job's latency is spent scheduling, spawning
+        # the process, importing the plugin and running it.
+        self.created_at = time.time()
+        self.start_requested_at = None
+        self.process_spawned_at = None
+        self.first_status_at = None
+        self.finished_at = None
         # TODO: We need this workaround because in tests I create jobs that
         # don't have a corresponding loaded entry point
         # At some point the tests should be refactored to use jobs that exist
         # and we can get rid of this code
-        module = EntryPointManager().get_plugin_module_by_name(name)
+        module = plugin_module
+        if module is None:
+            module = EntryPointManager(
+                entry_point_group_name).get_plugin_module_by_name(name)
+        # Lets the job be run without looking its plugin up again, which
+        # reloads pkg_resources
+        self._plugin_module_name = \
+            module.__name__ if module is not None else None
         logger_name = module.__name__ if module is not None else name
         self._logger = server_logging.get_job_logger(
             logger_name, uuid=self.uuid)
+        self.log_path = server_logging.get_job_file_path(
+            logger_name, self.uuid, "log")
         self._entry_point_group_name = entry_point_group_name
+        self.profiler = profiler
+        self.profile_path = None
+        if profiler is not None:
+            extension, _ = PROFILE_FILE_TYPES[profiler]
+            self.profile_path = server_logging.get_job_file_path(
+                logger_name, self.uuid, extension)
 
     def running(self):
         """
         The current state of the process executing the job
         :return: Boolean describing if job is running
         """
-        if self._process:
-            return self._process.is_alive()
+        if self._task:
+            if self._task.is_alive():
+                return True
+            self._on_process_exit()
         return False
 
+    def started(self):
+        """
+        Checks if the job has been started.
+        :return: Boolean describing if :meth:`job.start` has been called
+        """
+        return self._started
+
     def killed(self):
         """
         Checked if job has been killed.
@@ -59,6 +165,69 @@ class Job(object):
         """
         return self._killed
 
+    def timed_out(self):
+        """
+        :return: True if the job was killed because it ran past its deadline
+        """
+        return self._timed_out
+
+    def run_deadline(self):
+        """
+        :return: The time, in seconds since the epoch, by which the job must
+            have finished, or None if it may run for as long as it takes. The
+            max_runtime only counts once the job has been started.
+        """
+        deadlines = []
+        if self.deadline is not None:
+            deadlines.append(self.deadline)
+        if self.max_runtime is not None and \
+                self.start_requested_at is not None:
+            deadlines.append(self.start_requested_at + self.max_runtime)
+        return min(deadlines) if deadlines else None
+
+    def state(self):
+        """
+        :return: One of "queued" (not started yet), "running", "finished",
+            "failed" (finished by raising an exception) and "killed"
+        """
+        # Records the exit of the process if it has exited
+        self.running()
+        return self._current_state()
+
+    def _current_state(self):
+        """
+        The state of the job as of the last time its process was checked on
+        """
+        if not self._started:
+            return QUEUED
+        if self._killed:
+            return KILLED
+        if not self._exited:
+            return RUNNING
+        if "exception" in self._status:
+            return FAILED
+        return FINISHED
+
+    def _notify_state_change(self, previous_state):
+        state = self._current_state()
+        if state == previous_state:
+            return
+        if self._state_listener is not None:
+            self._state_listener(self, previous_state, state)
+        self._notify_change()
+
+    def _notify_change(self, patch=None):
+        """
+        Increment the version of the job. Changes to the status are recorded
+        in its history, with the version they made.
+        """
+        with self._lock:
+            self.version += 1
+            if patch is not None:
+                self._history.record(self.version, patch)
+        if self._change_listener is not None:
+            self._change_listener(self)
+
     def start(self):
         """
         Start the job. If the job has already been started before, a
@@ -69,22 +238,69 @@ class Job(object):
         if self.name:
             # TODO Testing hole here...We don't make sure updater is good or
             # anything
-            updater = StatusUpdater(
+            updater = BufferedStatusUpdater(
                 'localhost:{}'.format(self.port), self.uuid, self._api_key)
-            self._pipe_to_process, self._pipe_to_self = Pipe()
             self._logger.debug(
                 "Starting Job {0} UUID:{1}".format(self.name, self.uuid))
-            self._process = Process(
-                target=job_wrapper,
-                args=(
-                    self._pipe_to_self,
-                    self.name,
-                    self.config,
-                    updater,
-                    self._entry_point_group_name,
-                    self.uuid))
-            self._process.start()
-            self._started = True
+            with self._lock:
+                self.start_requested_at = time.time()
+                job_kwargs = {
+                    'entry_point_name': self.name,
+                    'config': self.config,
+                    'status_updater': updater,
+                    'entry_point_group_name': self._entry_point_group_name,
+                    'plugin_module_name': self._plugin_module_name,
+                    'uuid': self.uuid,
+                    'profiler': self.profiler,
+                    'profile_path': self.profile_path,
+                    'deadline': self.run_deadline()
+                }
+                if self._result_cache is not None:
+                    self._task = self._result_cache.submit(
+                        self._cache_key, self._executor, job_kwargs,
+                        on_exit=self._on_task_exit,
+                        on_status=self._on_cached_status,
+                        ttl_s=self._cache_ttl_s)
+                else:
+                    self._task = self._executor.submit(
+                        job_kwargs, on_exit=self._on_task_exit)
+                self._results = self._task.results
+                self.process_spawned_at = time.time()
+                self._started = True
+            metrics.JOBS_STARTED.inc(plugin=self.name)
+            metrics.JOB_SPAWN_SECONDS.observe(
+                self.process_spawned_at - self.start_requested_at,
+                plugin=self.name)
+            self._notify_state_change(QUEUED)
+            # Jobs whose results were cached have finished already
+            self.running()
+
+    def _on_cached_status(self, status):
+        """
+        Called instead of running the job, with the status of an identical
+        job
+        """
+        self._cached = True
+        metrics.JOB_RESULT_CACHE_HITS.inc(plugin=self.name)
+        self.patch_status(self._api_key, {SET: status})
+
+    def cached(self):
+        """
+        :return: True if the job was not run, and finished with the status
+            of an identical job instead (see
+            :mod:`hoplite.server.jobs.result_cache`)
+        """
+        return self._cached
+
+    def _on_task_exit(self):
+        """
+        Called by executors that can tell when the job finishes, so it is
+        recorded without waiting for the job manager to check on the job
+        """
+        # Jobs run on a pool can finish before start() has returned
+        with self._lock:
+            pass
+        self.running()
 
     def finished(self):
         """
@@ -94,9 +310,9 @@ class Job(object):
         :return: Boolean describing if the process has started and is no longer
             running
         """
-        if self._process is None:
+        if self._task is None:
             raise JobNotStartedError(self.uuid)
-        return not self._process.is_alive() and self._started
+        return not self.running() and self._started
 
     def status(self):
         """
@@ -104,20 +320,71 @@ class Job(object):
         from the process pipe. Returns the updated status afterwards.
         :return: status dictionary from the job processes
         """
-        if self._pipe_to_process:
-            if self._pipe_to_process.poll():
-                exception_dictionary = self._pipe_to_process.recv()
-                self._status["exception"] = exception_dictionary
-                self._pipe_to_process = None
+        with self._lock:
+            if self._results:
+                if self._results.poll():
+                    try:
+                        exception_dictionary = self._results.recv()
+                        self._status["exception"] = exception_dictionary
+                    except EOFError:
+                        # The process exited without raising an exception
+                        pass
+                    self._close_results()
         return self._status
 
     def update_status(self, api_key, status_update):
+        """
+        Merge status_update into the status
+        """
+        self.patch_status(api_key, {SET: status_update})
+
+    def patch_status(self, api_key, patch):
+        """
+        Change part of the status (see :mod:`hoplite.utils.status_patch`).
+        Only the keys in the patch are touched, and the version of the job is
+        incremented.
+
+        :param patch: The patch, made with
+            :func:`hoplite.utils.status_patch.make_patch`
+        :raises NotAuthorizedError: if api_key is not the job's
+        :raises InvalidStatusUpdateError: if the patch appends to a value
+            which is not a list
+        """
         if api_key != self._api_key:
             raise NotAuthorizedError
-        self._status = dict(self._status.items() + status_update.items())
+        with self._lock:
+            check_patch(self._status, patch)
+            if self.first_status_at is None:
+                self.first_status_at = time.time()
+            # Statuses returned earlier may still be being serialized by
+            # other threads, so the keys are changed in a copy. Only the
+            # references to the values are copied, not the values.
+            status = dict(self._status)
+            apply_patch(status, patch)
+            self._status = status
+        metrics.JOB_STATUS_UPDATES.inc(plugin=self.name)
+        # Only the update is logged, formatting the whole status on every
+        # update gets expensive for jobs with large statuses
         self._logger.debug(
-            "Update Status:{0} UUID:{1} Status:{2}".format(
-                self.name, self.uuid, self._status))
+            "Update Status:%s UUID:%s Update:%s",
+            self.name, self.uuid, patch)
+        self._notify_change(patch)
+
+    def status_history(self, since=None, until=None, after_version=None):
+        """
+        Find the recent changes to the status (see
+        :class:`hoplite.server.jobs.status_history.StatusHistory`)
+
+        :param since: Only find changes made at or after this time, in
+            seconds since the epoch
+        :param until: Only find changes made before this time
+        :param after_version: Only find changes that made versions after this
+            one
+        :return: The changes, oldest first, and whether changes that would
+            have been found have been dropped from the history
+        """
+        with self._lock:
+            return self._history.find(since, until, after_version)
 
     def kill(self):
         """
@@ -125,20 +392,144 @@ class Job(object):
         has not started yet. If the job has already finished, the job will
         still be flagged as killed, but it will not have any further
         consequences.
+
+        The job is asked to stop, which for jobs run in a process means
+        sending SIGTERM to it and every process it started. Those left after
+        kill_grace_period_s are killed (SIGKILL) by :meth:`check_kill`. What
+        happens for each executor is described in
+        :mod:`hoplite.server.jobs.executors`.
         """
-        if self._process is None:
+        if self._task is None:
             raise JobNotStartedError(self.uuid)
         self._logger.debug(
             "Terminating Job:{0} UUID:{1}".format(self.name, self.uuid))
-        self._process.terminate()
-        self._pipe_to_process = None
-        self._pipe_to_self = None
+        previous_state = self._current_state()
+        with self._lock:
+            if self._kill_requested_at is None:
+                self._kill_requested_at = time.time()
+                self._kill_status = KILL_TERMINATING
+                self._task.terminate()
+            self._close_results()
+        if not self._killed:
+            metrics.JOBS_KILLED.inc(plugin=self.name)
         self._killed = True
+        self._notify_state_change(previous_state)
+
+    def processes_alive(self):
+        """
+        :return: True while the job, or a process it started and left behind,
+            is running. Once none is, the processes of the job are never
+            signalled again, as their IDs may be reused
+        """
+        with self._lock:
+            return self._task is not None and self._task.alive()
+
+    def check_kill(self):
+        """
+        Check on the processes of a killed job, killing the ones left once the
+        grace period has passed
+
+        :return: True once every process of the job has exited
+        """
+        with self._lock:
+            if self._kill_status is None:
+                return True
+            if self._kill_status in (KILL_TERMINATED, KILL_KILLED):
+                return True
+            if not self._task.alive():
+                if self._kill_status == KILL_KILLING:
+                    self._kill_status = KILL_KILLED
+                else:
+                    self._kill_status = KILL_TERMINATED
+                    self._surviving_processes = 0
+                return True
+            if self._kill_status == KILL_TERMINATING and time.time() >= \
+                    self._kill_requested_at + self.kill_grace_period_s:
+                self._surviving_processes = self._task.count_alive()
+                self._logger.warning(
+                    "Job:%s UUID:%s did not exit within %s seconds, killing "
+                    "it", self.name, self.uuid, self.kill_grace_period_s)
+                self._kill_status = KILL_KILLING
+                self._task.kill()
+            return False
+
+    def kill_status(self):
+        """
+        :return: None if the job has not been killed, "terminating" while its
+            processes are given time to exit, "killing" once the ones left
+            have been killed, and "terminated" or "killed" once they have all
+            exited
+        """
+        return self._kill_status
+
+    def surviving_processes(self):
+        """
+        :return: The number of processes of a killed job that were still
+            running when the grace period ran out (0 if they all exited in
+            time), or None if the job has not been killed, is still within
+            the grace period, or the number is not known
+        """
+        return self._surviving_processes
+
+    def time_out(self):
+        """
+        Kill the job because it ran past its deadline
+        """
+        self._logger.info(
+            "Job:%s UUID:%s ran past its deadline", self.name, self.uuid)
+        if not self._timed_out:
+            metrics.JOBS_TIMED_OUT.inc(plugin=self.name)
+        # Set first, so listeners told of the kill see why it happened
+        self._timed_out = True
+        self.kill()
 
-    def to_dict(self):
+    def _close_results(self):
+        if self._results is not None:
+            self._results.close()
+            self._results = None
+
+    def _on_process_exit(self):
+        """
+        Records the end of the job the first time its process is seen to have
+        exited
+        """
+        with self._lock:
+            if self._exited:
+                return
+            previous_state = self._current_state()
+            # Drain and close the pipe so that failures are counted
+            self.status()
+            self._close_results()
+            self._exited = True
+        self.finished_at = time.time()
+        failed = "exception" in self._status
+        metrics.JOBS_FINISHED.inc(plugin=self.name)
+        if failed:
+            metrics.JOBS_FAILED.inc(plugin=self.name)
+        metrics.JOB_DURATION_SECONDS.observe(
+            self.finished_at - self.start_requested_at, plugin=self.name)
+        server_logging.close_job_logger(self._logger)
+        if self._result_cache is not None:
+            self._task.job_ended(
+                None if failed or self._killed else self._status)
+        self._notify_state_change(previous_state)
+
+    def plugin_loaded_at(self):
+        """
+        :return: The time the job process finished loading the plugin module,
+            or None if it has not happened yet
+        """
+        if self._task is None:
+            return None
+        return self._task.plugin_loaded_at()
+
+    def to_dict(self, fields=None):
         """
         Returns a dictionary representation of the job.
         Used to serialize job data using JSON for sending over the network.
+
+        :param fields: Keys of the dictionary to include. All of them are
+            included by default
         """
         d = {}
         d["uuid"] = self.uuid
@@ -147,8 +538,26 @@ class Job(object):
         d["status"] = self.status()
         d["running"] = self.running()
         d["killed"] = self.killed()
+        d["timed_out"] = self.timed_out()
+        d["kill_status"] = self.kill_status()
+        d["surviving_processes"] = self.surviving_processes()
+        d["max_runtime"] = self.max_runtime
+        d["deadline"] = self.deadline
+        d["profiler"] = self.profiler
+        d["executor"] = self.executor
+        d["cached"] = self.cached()
         try:
             d["finished"] = self.finished()
         except JobNotStartedError:
             d["finished"] = False
+        d["created_at"] = self.created_at
+        d["start_requested_at"] = self.start_requested_at
+        d["process_spawned_at"] = self.process_spawned_at
+        d["plugin_loaded_at"] = self.plugin_loaded_at()
+        d["first_status_at"] = self.first_status_at
+        d["finished_at"] = self.finished_at
+        d["state"] = self.state()
+        d["version"] = self.version
+        if fields is not None:
+            d = dict((field, d[field]) for field in fields if field in d)
         return d
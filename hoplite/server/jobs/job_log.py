@@ -0,0 +1,119 @@
+"""
+Reading job log files for the :http:get:`/jobs/(int:job_uuid)/log` endpoint.
+Log files can be very large, so they are never read whole. Only the
+requested part of the file is read, a chunk at a time.
+
+Logs of finished jobs may have been compressed by the
+:class:`~hoplite.server.log_janitor.LogJanitor`. They are read the same way,
+and are decompressed as they are read.
+"""
+import gzip
+import os
+import struct
+import time
+
+CHUNK_SIZE = 64 * 1024
+COMPRESSED_EXTENSION = '.gz'
+
+
+def find_log(path):
+    """
+    Find a log file, which may have been compressed
+
+    :param path: Path of the uncompressed log file
+    :return: The path of the log file and the size of the log when
+        uncompressed, or (None, 0) if there is no log
+    """
+    if os.path.isfile(path):
+        return path, os.path.getsize(path)
+    compressed_path = path + COMPRESSED_EXTENSION
+    if os.path.isfile(compressed_path):
+        return compressed_path, _uncompressed_size(compressed_path)
+    return None, 0
+
+
+def read_log(path, start, stop, chunk_size=CHUNK_SIZE):
+    """
+    Read part of a log file
+
+    :param path: Path of the log file
+    :param start: Offset of the first byte to read
+    :param stop: Offset one past the last byte to read
+    :return: Generator of the chunks of the requested part of the file
+    """
+    with _open(path) as log_file:
+        log_file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = log_file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def follow_log(job, path, start, poll_interval=.25, chunk_size=CHUNK_SIZE):
+    """
+    Read a log file from start and keep reading what is written to it until
+    the job has finished, like tail -f. Empty chunks are produced while
+    waiting for more to be written, so the consumer can stop if the client
+    has gone away.
+
+    :param job: The job writing the log
+    :param path: Path of the log file
+    :param start: Offset of the first byte to read
+    :param poll_interval: Seconds to wait before checking for more data
+    :return: Generator of the chunks of the log file
+    """
+    log_file = None
+    position = start
+    try:
+        while True:
+            # Checked before reading so nothing written before the job
+            # finished is missed
+            finished = job.started() and job.finished()
+            if log_file is None and os.path.exists(path):
+                log_file = open(path, 'rb')
+                log_file.seek(position)
+            elif log_file is not None and _size(path, position) < position:
+                # The log has been rotated
+                log_file.close()
+                log_file = open(path, 'rb')
+                position = 0
+            if log_file is not None:
+                chunk = log_file.read(chunk_size)
+                while chunk:
+                    position += len(chunk)
+                    yield chunk
+                    chunk = log_file.read(chunk_size)
+            if finished:
+                return
+            yield b""
+            time.sleep(poll_interval)
+    finally:
+        if log_file is not None:
+            log_file.close()
+
+
+def _open(path):
+    if path.endswith(COMPRESSED_EXTENSION):
+        # Seeking forward decompresses everything before the offset, which
+        # is cheap as logs are rotated long before they get large
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _uncompressed_size(path):
+    # gzip stores the size modulo 2**32 in its last four bytes. Log files
+    # are rotated long before they get that large.
+    with open(path, 'rb') as compressed_file:
+        compressed_file.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', compressed_file.read(4))[0]
+
+
+def _size(path, default):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        # The log is being rotated
+        return default
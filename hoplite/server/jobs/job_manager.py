@@ -1,26 +1,190 @@
 """
 @author Matt Murphy
 """
+import bisect
+import heapq
+import itertools
+import threading
+import time
+
+from hoplite.server import metrics
 from hoplite.utils import server_logging
-from job import Job
-from hoplite.exceptions import JobDoesNotExistError, JobPluginDoesNotExistError
+from job import Job, KILLED, QUEUED, RUNNING, STATES
+from process_tree import KILL_GRACE_PERIOD_S
+from executors import (
+    EXECUTORS, PROCESS, PROCESS_POOL_SIZE, THREAD, THREAD_POOL_SIZE,
+    ProcessExecutor, ProcessPoolExecutor, ThreadExecutor)
+from result_cache import (
+    RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_S, ResultCache, cache_key)
+from idempotency import (
+    IDEMPOTENCY_KEY_MAX_ENTRIES, IDEMPOTENCY_KEY_TTL_S, IdempotencyKeys,
+    check_key)
+from hoplite.server.jobs.profiling import available_profilers
+from hoplite.exceptions import (
+    InvalidJobOptionError,
+    JobDoesNotExistError,
+    JobPluginDoesNotExistError)
 import uuid
 
 logger = server_logging.get_server_logger(__name__)
 
 
+class _OrderedJobs(object):
+    """
+    Jobs in the order they were created. Jobs are only ever appended, so the
+    jobs can be read while other threads add to them.
+    """
+    def __init__(self):
+        self._jobs = []
+        self._sequences = []
+        # Latest creation time of the jobs up to each index. Unlike the
+        # creation times themselves this never decreases, even if the clock
+        # is set back, so it can be searched.
+        self._created_at = []
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def append(self, job):
+        created_at = job.created_at
+        if self._created_at:
+            created_at = max(created_at, self._created_at[-1])
+        self._sequences.append(job.sequence)
+        self._created_at.append(created_at)
+        self._jobs.append(job)
+
+    def find(self, after=0, created_since=None):
+        """
+        :return: Generator of the jobs created after the job with sequence
+            number after. If created_since is given, jobs that are known to
+            have been created before it are skipped
+        """
+        index = bisect.bisect_right(self._sequences, after)
+        if created_since is not None:
+            index = max(
+                index, bisect.bisect_left(self._created_at, created_since))
+        jobs = self._jobs
+        while index < len(jobs):
+            yield jobs[index]
+            index += 1
+
+    def sequence_before(self, created_since):
+        """
+        :return: The sequence number of the last job known to have been
+            created before created_since, or 0 if there is none
+        """
+        index = bisect.bisect_left(self._created_at, created_since)
+        return self._sequences[index - 1] if index else 0
+
+
+class _SortedJobs(object):
+    """
+    Jobs in the order they were created, which can be added and removed in
+    any order, such as the jobs in a state. Jobs can be read while other
+    threads add and remove them.
+    """
+    def __init__(self):
+        self._sequences = []
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sequences)
+
+    def add(self, job):
+        with self._lock:
+            if job.sequence not in self._jobs:
+                bisect.insort(self._sequences, job.sequence)
+            self._jobs[job.sequence] = job
+
+    def remove(self, job):
+        with self._lock:
+            if self._jobs.pop(job.sequence, None) is not None:
+                del self._sequences[
+                    bisect.bisect_left(self._sequences, job.sequence)]
+
+    def find(self, after=0):
+        """
+        :return: Generator of the sequence numbers and jobs created after the
+            job with sequence number after. Each job is looked up when it is
+            reached, so finding the next one costs O(log n) however many jobs
+            there are, and jobs added or removed meanwhile are taken into
+            account
+        """
+        while True:
+            with self._lock:
+                index = bisect.bisect_right(self._sequences, after)
+                if index == len(self._sequences):
+                    return
+                after = self._sequences[index]
+                job = self._jobs[after]
+            yield after, job
+
+
 class JobManager(object):
     """
     Class used by the server to manage jobs
     """
 
-    def __init__(self, plugin_manager):
+    def __init__(self, plugin_manager, reap_interval_s=.1,
+                 kill_grace_period_s=KILL_GRACE_PERIOD_S,
+                 thread_pool_size=THREAD_POOL_SIZE,
+                 process_pool_size=PROCESS_POOL_SIZE,
+                 result_cache_size=RESULT_CACHE_MAX_ENTRIES,
+                 result_cache_ttl_s=RESULT_CACHE_TTL_S,
+                 idempotency_key_ttl_s=IDEMPOTENCY_KEY_TTL_S):
         """
         Initialize with unique id for this instance
         and the configured plugin paths
+
+        :param reap_interval_s: Seconds between checks on the processes of
+            running jobs
+        :param kill_grace_period_s: Seconds the processes of killed jobs are
+            given to exit before they are killed forcefully
+        :param thread_pool_size: Most jobs run on threads at once (see
+            hoplite.server.jobs.executors)
+        :param process_pool_size: Most jobs run on pooled processes at once
+        :param result_cache_size: Most results of jobs kept for identical
+            jobs (see hoplite.server.jobs.result_cache)
+        :param result_cache_ttl_s: Seconds the results of jobs are kept for,
+            unless their plugin asks for another time
+        :param idempotency_key_ttl_s: Seconds the idempotency keys of
+            requests are remembered for (see
+            hoplite.server.jobs.idempotency)
         """
         self.plugin_manager = plugin_manager
+        self.reap_interval_s = reap_interval_s
+        self.kill_grace_period_s = kill_grace_period_s
+        self.thread_pool_size = thread_pool_size
+        self.process_pool_size = process_pool_size
+        # Executors by name. The pools are only started once a job uses them.
+        self._executors = {PROCESS: ProcessExecutor()}
+        self.result_cache = ResultCache(result_cache_size, result_cache_ttl_s)
+        self.idempotency_keys = IdempotencyKeys(
+            IDEMPOTENCY_KEY_MAX_ENTRIES, idempotency_key_ttl_s)
+        # Held while a request with an idempotency key is handled, so a
+        # retry waits for the request it repeats
+        self._idempotency_lock = threading.Lock()
         self.jobs = {}
+        self._sequence = itertools.count(1)
+        # Indexes of the jobs, so finding jobs costs as much as the number of
+        # jobs found rather than the number of jobs ever created
+        self._jobs_in_order = _OrderedJobs()
+        self._jobs_by_name = {}
+        self._jobs_by_state = dict((state, _SortedJobs()) for state in STATES)
+        # The jobs in each state by name, by state and name
+        self._jobs_by_state_and_name = {}
+        # Jobs whose processes have not been seen to exit yet. Jobs stay here
+        # until the processes they started are gone too.
+        self._live_jobs = {}
+        # Heap of the deadlines of the running jobs that have one, with their
+        # sequence numbers and the jobs. Jobs that exit before their
+        # deadlines are only removed once their deadlines pass.
+        self._deadlines = []
+        self._lock = threading.Condition(threading.Lock())
+        self._reaper = None
+        # Notified whenever the version of any job changes
+        self._changes = threading.Condition(threading.Lock())
 
     def available_job_plugins(self):
         """
@@ -30,9 +194,112 @@ class JobManager(object):
 
     def all_jobs(self):
         """
-        Get all jobs that have been created
+        Get all jobs that have been created, in the order they were created
+        """
+        return list(self._jobs_in_order.find())
+
+    def count_jobs(self, state=None):
+        """
+        :param state: State of the jobs to count. All jobs are counted by
+            default
+        :return: The number of jobs in the state
+        """
+        if state is None:
+            return len(self._jobs_in_order)
+        return len(self._jobs_by_state[state])
+
+    def find_jobs(self, states=None, name=None, created_since=None,
+                  after=0):
+        """
+        Find jobs in the order they were created. The states of the jobs are
+        looked up in an index, which is updated as the jobs are started and
+        as their processes are seen to exit.
+
+        :param states: States (see :meth:`Job.state`) of the jobs to find.
+            Jobs in any state are found by default
+        :param name: Name of the plugin of the jobs to find
+        :param created_since: Only find jobs created at or after this time, in
+            seconds since the epoch
+        :param after: Only find jobs created after the job with this sequence
+            number
+        :return: Generator of the jobs
+        """
+        if states is not None:
+            if created_since is not None:
+                # Skips the jobs created before, which come first
+                after = max(
+                    after, self._jobs_in_order.sequence_before(created_since))
+            if name is None:
+                indexes = [self._jobs_by_state[state] for state in set(states)]
+            else:
+                indexes = [
+                    self._jobs_by_state_and_name[(state, name)]
+                    for state in set(states)
+                    if (state, name) in self._jobs_by_state_and_name]
+            jobs = self._merge(indexes, after)
+        elif name is not None:
+            jobs = self._jobs_by_name.get(name, _OrderedJobs()).find(
+                after, created_since)
+        else:
+            jobs = self._jobs_in_order.find(after, created_since)
+        for job in jobs:
+            if name is not None and job.name != name:
+                continue
+            if created_since is not None and job.created_at < created_since:
+                continue
+            yield job
+
+    @staticmethod
+    def _merge(indexes, after):
+        """
+        :return: Generator of the jobs of the indexes created after the job
+            with sequence number after, in the order they were created
+        """
+        previous = None
+        for sequence, job in heapq.merge(
+                *[index.find(after) for index in indexes]):
+            # A job that changes state meanwhile may be found in both
+            if sequence != previous:
+                yield job
+            previous = sequence
+
+    def changed_jobs(self, versions, timeout=0):
+        """
+        Find the jobs that have changed since a client last saw them,
+        waiting for one to change if none have
+
+        :param dict versions: The version (see :attr:`Job.version`) of each
+            job last seen by the client, by UUID. Jobs whose version is None
+            are always returned
+        :param timeout: Maximum number of seconds to wait for a job to change
+        :return: The jobs that have changed, and the UUIDs of the jobs that do
+            not exist
         """
-        return self.jobs.values()
+        deadline = time.time() + timeout
+        with self._changes:
+            while True:
+                changed = []
+                missing = []
+                for job_uuid, version in versions.items():
+                    job = self.jobs.get(job_uuid, None)
+                    if job is None:
+                        missing.append(job_uuid)
+                    elif job.version != version:
+                        changed.append(job)
+                remaining = deadline - time.time()
+                if changed or missing or remaining <= 0:
+                    return changed, missing
+                self._changes.wait(remaining)
+
+    def active_log_paths(self):
+        """
+        Get the log paths of the jobs that have not finished. Their logs may
+        still be written to, so they must not be compressed or deleted.
+        """
+        with self._lock:
+            jobs = [job for _, job in self._jobs_by_state[QUEUED].find()] + \
+                self._live_jobs.values()
+        return [job.log_path for job in jobs]
 
     def get_job(self, job_uuid):
         job = self.jobs.get(job_uuid, None)
@@ -41,12 +308,125 @@ class JobManager(object):
                 "Job with UUID: {0} does not exist".format(job_uuid))
         return job
 
-    def create_job(self, name, config, running=False, port=5000):
+    def create_job(self, name, config, running=False, port=5000,
+                   profiler=None, max_runtime=None, deadline=None,
+                   executor=None, cache=None, idempotency_key=None):
         """
         Stores information about job in the job dictionary.
         If running is true then starts the job.
+        If profiler is given, the job is run under that profiler.
+        If max_runtime (seconds from when the job is started) or deadline
+        (seconds since the epoch) is given, the job is killed and marked as
+        timed out if it has not finished by then.
+        If executor is given, the job is run by that executor (see
+        hoplite.server.jobs.executors). Otherwise the executor named by the
+        EXECUTOR attribute of the plugin module is used, if it has one.
+        If cache is True, or a number of seconds, the result of the job may be
+        reused by identical jobs, and the job may not be run if an identical
+        job has run (see hoplite.server.jobs.result_cache). Otherwise the
+        CACHE_RESULTS attribute of the plugin module is used, unless cache is
+        False.
+        If idempotency_key is given and a job was already created with it,
+        that job is returned rather than a new one (see
+        hoplite.server.jobs.idempotency).
+        """
+        if idempotency_key is None:
+            job = self._create_job(
+                name, config, port, profiler, max_runtime, deadline,
+                executor, cache)
+        else:
+            check_key(idempotency_key)
+            request = 'create:' + cache_key(name, [
+                config, running, port, profiler, max_runtime, deadline,
+                executor, cache])
+            with self._idempotency_lock:
+                job_uuid = self.idempotency_keys.get(idempotency_key, request)
+                job = self.jobs.get(job_uuid, None)
+                if job is not None:
+                    logger.debug(
+                        "Job UUID:{0} was already created with key "
+                        "{1}".format(job_uuid, idempotency_key))
+                    return job
+                job = self._create_job(
+                    name, config, port, profiler, max_runtime, deadline,
+                    executor, cache)
+                self.idempotency_keys.put(idempotency_key, request, job.uuid)
+        if running:
+            job.start()
+        return job
+
+    def start_job(self, job_uuid, idempotency_key=None):
         """
+        Start a job. If idempotency_key is given and the job was already
+        started with it, the job is not started again.
+
+        :raises JobDoesNotExistError: if the job does not exist
+        :raises JobAlreadyStartedError: if the job was started without the
+            key
+        :raises IdempotencyKeyReusedError: if the key was sent with another
+            request
+        """
+        job = self.get_job(job_uuid)
+        if idempotency_key is None:
+            job.start()
+            return job
+        check_key(idempotency_key)
+        request = 'start:' + job.uuid
+        with self._idempotency_lock:
+            if self.idempotency_keys.get(idempotency_key, request) is None:
+                job.start()
+                self.idempotency_keys.put(idempotency_key, request, job.uuid)
+        return job
+
+    def shutdown(self, timeout=None):
+        """
+        Stop the pools of threads and worker processes once the jobs handed
+        to them have run, tearing down the resources their plugins set up
+
+        :param timeout: Most seconds to wait for each pool
+        """
+        with self._lock:
+            executors = self._executors.values()
+            self._executors = {PROCESS: self._executors[PROCESS]}
+        for executor in executors:
+            executor.shutdown(timeout)
+
+    def _create_job(self, name, config, port, profiler, max_runtime,
+                    deadline, executor, cache):
         module = self._get_plugin_with_name(name)
+        if executor is None:
+            executor = getattr(module, 'EXECUTOR', PROCESS)
+        if executor not in EXECUTORS:
+            raise InvalidJobOptionError(
+                "Executor '{0}' does not exist. Available executors: "
+                "{1}".format(executor, ", ".join(EXECUTORS)))
+        if profiler is not None:
+            # Profilers change the state of the whole process
+            executor = PROCESS
+        if cache is None:
+            cache = getattr(module, 'CACHE_RESULTS', False)
+        cache_ttl_s = None
+        if not isinstance(cache, bool):
+            if not isinstance(cache, (int, long, float)) or cache <= 0:
+                raise InvalidJobOptionError(
+                    "cache must be true, false or a positive number of "
+                    "seconds")
+            cache_ttl_s = cache
+            cache = True
+        if profiler is not None:
+            # Profiling a job that is not run would be of no use
+            cache = False
+        if profiler is not None and profiler not in available_profilers():
+            raise InvalidJobOptionError(
+                "Profiler '{0}' is not available. Available profilers: "
+                "{1}".format(profiler, ", ".join(available_profilers())))
+        for option, value in (
+                ('max_runtime', max_runtime), ('deadline', deadline)):
+            if value is not None and (
+                    isinstance(value, bool) or
+                    not isinstance(value, (int, long, float)) or value <= 0):
+                raise InvalidJobOptionError(
+                    "{0} must be a positive number of seconds".format(option))
         job_uuid = str(uuid.uuid4())
         job_api_key = str(uuid.uuid4())
         # TODO: Try/Catch if run does not exist
@@ -56,13 +436,134 @@ class JobManager(object):
             config,
             job_api_key,
             entry_point_group_name=self.plugin_manager.entry_point_group_name,
-            port=port)
+            port=port,
+            profiler=profiler,
+            state_listener=self._on_state_change,
+            change_listener=self._on_change,
+            max_runtime=max_runtime,
+            deadline=deadline,
+            kill_grace_period_s=self.kill_grace_period_s,
+            executor=self._get_executor(executor),
+            result_cache=self.result_cache if cache else None,
+            cache_key=cache_key(name, config) if cache else None,
+            cache_ttl_s=cache_ttl_s,
+            plugin_module=module)
         logger.debug("Creating Job:{0} UUID:{1}".format(name, job_uuid))
-        self.jobs[job.uuid] = job
-        if running:
-            job.start()
+        with self._lock:
+            job.sequence = next(self._sequence)
+            self.jobs[job.uuid] = job
+            self._jobs_in_order.append(job)
+            self._jobs_by_name.setdefault(name, _OrderedJobs()).append(job)
+            self._add_to_state(job, QUEUED)
+        metrics.JOBS_CREATED.inc(plugin=name)
         return job
 
+    def _add_to_state(self, job, state):
+        self._jobs_by_state[state].add(job)
+        self._jobs_by_state_and_name.setdefault(
+            (state, job.name), _SortedJobs()).add(job)
+
+    def _remove_from_state(self, job, state):
+        self._jobs_by_state[state].remove(job)
+        by_name = self._jobs_by_state_and_name.get((state, job.name), None)
+        if by_name is not None:
+            by_name.remove(job)
+
+    def _on_state_change(self, job, previous_state, state):
+        with self._lock:
+            if self.jobs.get(job.uuid, None) is not job:
+                # Cleared from the manager
+                return
+            self._remove_from_state(job, previous_state)
+            self._add_to_state(job, state)
+            if state == RUNNING:
+                self._live_jobs[job.sequence] = job
+                deadline = job.run_deadline()
+                if deadline is not None:
+                    heapq.heappush(
+                        self._deadlines, (deadline, job.sequence, job))
+                self._start_reaper()
+                self._lock.notify()
+            elif state == KILLED:
+                # Even if its process had exited, processes it started may
+                # be left, and they have to be seen to exit
+                self._live_jobs[job.sequence] = job
+                self._start_reaper()
+                self._lock.notify()
+
+    def _on_change(self, job):
+        with self._changes:
+            self._changes.notify_all()
+
+    def _start_reaper(self):
+        if self._reaper is not None:
+            return
+        self._reaper = threading.Thread(
+            target=self._reap, name='hoplite-job-reaper')
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _reap(self):
+        """
+        Checks on the processes of the jobs that have been started until they
+        exit. This is what moves jobs out of the running state, what cleans
+        up after their processes, and what kills jobs that run past their
+        deadlines.
+        """
+        while True:
+            with self._lock:
+                while not self._live_jobs:
+                    self._lock.wait()
+                live_jobs = self._live_jobs.values()
+            for job in live_jobs:
+                try:
+                    exited = not job.running()
+                    if job.killed():
+                        # Kills the processes left once their grace period
+                        # has passed
+                        exited = job.check_kill()
+                    elif exited:
+                        # Processes the job started may outlive it. Until
+                        # they have been seen to exit, killing the job still
+                        # signals them rather than whatever reuses their IDs
+                        exited = not job.processes_alive()
+                except Exception:
+                    logger.exception(
+                        "Could not check on job UUID:%s", job.uuid)
+                    continue
+                if exited:
+                    with self._lock:
+                        self._live_jobs.pop(job.sequence, None)
+            self._time_out_jobs()
+            time.sleep(self.reap_interval_s)
+
+    def _time_out_jobs(self):
+        """
+        Kill the jobs whose deadlines have passed
+        """
+        now = time.time()
+        while True:
+            with self._lock:
+                if not self._deadlines or self._deadlines[0][0] > now:
+                    return
+                _, _, job = heapq.heappop(self._deadlines)
+            try:
+                if job.running():
+                    job.time_out()
+            except Exception:
+                logger.exception("Could not time out job UUID:%s", job.uuid)
+
+    def _get_executor(self, name):
+        with self._lock:
+            if name not in self._executors:
+                if name == THREAD:
+                    self._executors[name] = ThreadExecutor(
+                        self.thread_pool_size)
+                else:
+                    self._executors[name] = ProcessPoolExecutor(
+                        self.process_pool_size)
+            return self._executors[name]
+
     def _get_plugin_with_name(self, name):
         plugin = self.plugin_manager.get_plugin_module_by_name(name)
         if plugin is None:
@@ -71,4 +572,15 @@ class JobManager(object):
 
     def _clear(self):
         logger.warning("Clearing all jobs")
-        self.jobs = {}
+        with self._lock:
+            self.jobs = {}
+            self._jobs_in_order = _OrderedJobs()
+            self._jobs_by_name = {}
+            self._jobs_by_state = dict(
+                (state, _SortedJobs()) for state in STATES)
+            self._jobs_by_state_and_name = {}
+            self._live_jobs = {}
+            self._deadlines = []
+        self.result_cache.clear()
+        with self._idempotency_lock:
+            self.idempotency_keys.clear()
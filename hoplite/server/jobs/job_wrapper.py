@@ -1,18 +1,28 @@
+import importlib
 import pickle
+import signal
 import sys
 from tblib import pickling_support
+import time
 import traceback
 
 from hoplite.utils import server_logging
 from hoplite.plugin_manager import EntryPointManager
-from hoplite.exceptions import JobFailedError
+from hoplite.exceptions import JobCancelledError, JobFailedError
+from hoplite.utils.job_context import JobContext, set_current_context
+from plugin_resources import PluginResources, uses_resources
+from profiling import run_with_profiler
+from process_tree import start_session
 
 # This makes it so that traceback objects can be pickled
 pickling_support.install()
 
 
 def job_wrapper(pipe_to_parent, entry_point_name, config, status_updater,
-                entry_point_group_name='hoplite.jobs', uuid=''):
+                entry_point_group_name='hoplite.jobs', uuid='',
+                plugin_loaded_at=None, profiler=None, profile_path=None,
+                new_session=False, deadline=None, context=None,
+                resources=None, plugin_module_name=None):
     """
     A picklable function that is used to start the job. It loads the specified
     module and calls run on it with the correct parameters.
@@ -27,12 +37,66 @@ def job_wrapper(pipe_to_parent, entry_point_name, config, status_updater,
     call other jobs. The stack trace for each "level" is saved, and the entire
     list of jobs with their respective traces can be displayed at the top level
     (where the JobFailedError is handled).
+
+    If plugin_module_name is given, the plugin module is imported by that
+    name rather than looked up among the entry points, which reloads
+    pkg_resources. Modules the server or a worker has already imported are
+    not imported again, so jobs run on a pool start without loading their
+    plugin.
+
+    If plugin_loaded_at is given (a multiprocessing.Value shared with the
+    server), the time at which the plugin module finished loading is written
+    to it so the server can report how long the import took.
+
+    If profiler is given, the plugin is run under that profiler (see
+    hoplite.server.jobs.profiling) and the profile is written to profile_path.
+
+    If new_session is True, the job process starts a new session first, so it
+    can be killed together with every process it starts (see
+    hoplite.server.jobs.process_tree).
+
+    The plugin runs with a job context (see hoplite.utils.job_context), which
+    passes what is left of the deadline on to the remote jobs it creates, and
+    kills them if the job is killed or times out. A context is made from uuid
+    and deadline unless one is given, for jobs run on a thread of the server,
+    in which case it is only set for the calling thread.
+
+    If the plugin module defines setup, its resources (see
+    hoplite.server.jobs.plugin_resources) are taken from resources, which
+    the threads and worker processes that run many jobs keep between them,
+    and passed to run. Without resources they are set up for this job only.
     """
-    module = EntryPointManager(
-        entry_point_group_name).get_plugin_module_by_name(entry_point_name)
+    if new_session:
+        start_session()
+    if plugin_module_name is not None:
+        module = importlib.import_module(plugin_module_name)
+    else:
+        module = EntryPointManager(
+            entry_point_group_name).get_plugin_module_by_name(
+                entry_point_name)
+    if plugin_loaded_at is not None:
+        plugin_loaded_at.value = time.time()
     logger = server_logging.get_job_logger(module.__name__, uuid)
+    thread_only = context is not None
+    if context is None:
+        context = JobContext(uuid, deadline)
+    set_current_context(context, thread_only)
+    previous_handler = context.install_signal_handler()
+    owns_resources = resources is None
+    if owns_resources:
+        resources = PluginResources()
+    succeeded = False
     try:
-        module.run(config, status_updater)
+        args = (config, status_updater)
+        if uses_resources(module):
+            args += (resources.get(module),)
+        if profiler is None:
+            module.run(*args)
+        else:
+            run_with_profiler(profiler, profile_path, module.run, *args)
+        succeeded = True
+    except JobCancelledError:
+        logger.info("Job UUID:{0} was cancelled".format(uuid))
     except JobFailedError as e:
         logger.error(
             "A job raised an exception and it was not caught."
@@ -76,4 +140,30 @@ def job_wrapper(pipe_to_parent, entry_point_name, config, status_updater,
                         uuid, entry_point_name,
                         except_type, except_class, traceback.format_tb(tb)))
         pipe_to_parent.send(pass_to_parent)
-    logger.debug("Finished running UUID:{0}".format(uuid))
+    finally:
+        if context.cancelled():
+            # Kills the children of a job stopped by SIGTERM, which only
+            # raised JobCancelledError
+            context.cancel()
+        if previous_handler is not None:
+            signal.signal(signal.SIGTERM, previous_handler)
+        set_current_context(None, thread_only)
+        if owns_resources:
+            resources.teardown_all()
+        elif not succeeded:
+            # The resources may have been left in a bad state
+            resources.discard(module)
+        try:
+            # Updates may still be buffered, and the process is about to exit
+            status_updater.flush()
+        except Exception:
+            logger.exception(
+                "Could not send the final status of UUID:{0}".format(uuid))
+        # Threads and worker processes outlive the job, so its updater must
+        # not leave a thread and a connection behind
+        status_updater.close()
+        logger.debug("Finished running UUID:{0}".format(uuid))
+        # The job process exits without running atexit handlers, so the
+        # queued log records have to be written now
+        server_logging.close_job_logger(logger)
+        server_logging.flush()
@@ -0,0 +1,97 @@
+"""
+Resources that plugins keep between the jobs they run, such as connections
+to other servers. A plugin module asks for them by defining setup, and
+optionally teardown::
+
+    def setup():
+        return {'sessions': {}}
+
+    def run(config, status, resources):
+        ...
+
+    def teardown(resources):
+        ...
+
+setup is called without arguments before the first job of the plugin is run
+by a thread or worker process (see :mod:`hoplite.server.jobs.executors`),
+and what it returns is passed to run as a third argument for every job of
+the plugin the thread or worker runs. teardown is called with the same
+value once the thread or worker stops, or when it next runs a job of the
+plugin after the plugin has been reloaded. Jobs
+run in a process of their own set up and tear down their resources around
+each job.
+
+The resources are dropped, and torn down, when run raises, so a job that
+fails does not leave broken connections to the next one. They are not torn
+down if the worker process running the job is killed.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def uses_resources(module):
+    """
+    :return: True if the plugin module defines setup
+    """
+    return callable(getattr(module, 'setup', None))
+
+
+class PluginResources(object):
+    """
+    The resources of the plugins run by one thread or process. It is not
+    thread safe, as each thread has its own.
+    """
+    def __init__(self):
+        # Plugin modules and their resources, by module name
+        self._resources = {}
+
+    def __len__(self):
+        return len(self._resources)
+
+    def get(self, module):
+        """
+        Get the resources of a plugin, setting them up if they are not yet
+
+        :param module: The plugin module, which defines setup
+        :return: What setup returned
+        """
+        name = module.__name__
+        if name in self._resources:
+            cached_module, resources = self._resources[name]
+            if cached_module is module:
+                return resources
+            # The plugin has been reloaded since its resources were set up
+            self.discard(cached_module)
+        resources = module.setup()
+        self._resources[name] = (module, resources)
+        return resources
+
+    def discard(self, module):
+        """
+        Tear down the resources of a plugin, if it has any
+        """
+        cached = self._resources.pop(module.__name__, None)
+        if cached is not None:
+            self._teardown(*cached)
+
+    def teardown_all(self):
+        """
+        Tear down the resources of every plugin
+        """
+        while self._resources:
+            _, cached = self._resources.popitem()
+            self._teardown(*cached)
+
+    @staticmethod
+    def _teardown(module, resources):
+        teardown = getattr(module, 'teardown', None)
+        if teardown is None:
+            return
+        try:
+            teardown(resources)
+        except Exception:
+            logger.exception(
+                "Could not tear down the resources of {0}".format(
+                    module.__name__))
@@ -0,0 +1,175 @@
+"""
+Stopping a job together with every process it started.
+
+On POSIX systems each job process starts a new session before running its
+plugin (see :func:`start_session`), so the job and every process it starts,
+such as p4 or a command run with Popen, share a process group. The group is
+signalled as a whole, even after the job process itself has exited.
+
+Elsewhere the descendants of the job process are found with psutil when it
+is installed. Without psutil only the job process itself can be stopped.
+"""
+import errno
+import os
+import signal
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Seconds between asking the processes of a killed job to terminate and
+# killing them
+KILL_GRACE_PERIOD_S = 5
+
+HAS_PROCESS_GROUPS = hasattr(os, 'setsid') and hasattr(os, 'killpg')
+
+
+def start_session():
+    """
+    Make the calling process the leader of a new session and process group.
+    This is called in the job process before the plugin runs.
+    """
+    if HAS_PROCESS_GROUPS:
+        try:
+            os.setsid()
+        except OSError:
+            # Already the leader of a process group
+            pass
+
+
+class ProcessTree(object):
+    """
+    The processes started by a job. The job process itself is stopped with
+    its multiprocessing.Process, which knows when it has been reaped and so
+    when its process ID may belong to another process.
+    """
+    def __init__(self, pid):
+        """
+        :param pid: Process ID of the job process
+        """
+        self.pid = pid
+        # The descendants found when the tree was terminated, on systems
+        # without process groups
+        self._descendants = []
+        # Once the group is empty its ID may be reused, so it is not
+        # signalled again
+        self._gone = False
+
+    def job_exited(self):
+        """
+        Called once the job process has been reaped. If it started no process
+        that is still running its group is gone, and its ID may be reused by
+        an unrelated process before the job is killed, so the group is never
+        signalled
+        """
+        if HAS_PROCESS_GROUPS:
+            self.alive(False)
+
+    def terminate(self):
+        """
+        Ask every process of the tree to exit (SIGTERM)
+        """
+        if HAS_PROCESS_GROUPS:
+            self._signal_group(signal.SIGTERM)
+        elif psutil is not None:
+            try:
+                self._descendants = psutil.Process(self.pid).children(
+                    recursive=True)
+            except psutil.Error:
+                self._descendants = []
+            for process in self._descendants:
+                try:
+                    process.terminate()
+                except psutil.Error:
+                    pass
+
+    def kill(self):
+        """
+        Kill every process of the tree which is left (SIGKILL)
+        """
+        if HAS_PROCESS_GROUPS:
+            self._signal_group(signal.SIGKILL)
+            return
+        for process in self._descendants:
+            try:
+                process.kill()
+            except psutil.Error:
+                pass
+
+    def alive(self, job_alive):
+        """
+        :param job_alive: Whether the job process is still running, as told
+            by its multiprocessing.Process
+        :return: True if a process of the tree is still running
+        """
+        if job_alive:
+            return True
+        # The job process has been reaped, so only the processes it started
+        # can be left in the group
+        if HAS_PROCESS_GROUPS:
+            # Processes which have exited but not been reaped yet are still
+            # in the group
+            alive = self._signal_group(0) and (
+                psutil is None or self._count_group() > 0)
+        else:
+            alive = any(self._descendant_is_running(process)
+                        for process in self._descendants)
+        if not alive:
+            self._gone = True
+        return alive
+
+    def count_alive(self, job_alive):
+        """
+        :param job_alive: Whether the job process is still running
+        :return: The number of processes of the tree that are still running,
+            or None if it can't be told because psutil is not installed and
+            some are
+        """
+        if not self.alive(job_alive):
+            return 0
+        if psutil is None:
+            return None
+        if not HAS_PROCESS_GROUPS:
+            return int(job_alive) + sum(
+                1 for process in self._descendants
+                if self._descendant_is_running(process))
+        return self._count_group()
+
+    def _count_group(self):
+        # The job process leads the group, so the group ID is its process ID
+        count = 0
+        for process in psutil.process_iter():
+            try:
+                if os.getpgid(process.pid) == self.pid and \
+                        process.status() != psutil.STATUS_ZOMBIE:
+                    count += 1
+            except (OSError, psutil.Error):
+                # The process exited while the processes were being listed
+                pass
+        return count
+
+    def _signal_group(self, sig):
+        """
+        :return: False if there is no process left in the group
+        """
+        if self._gone:
+            return False
+        try:
+            os.killpg(self.pid, sig)
+        except OSError as e:
+            if e.errno == errno.ESRCH:
+                # The group is empty, or the job process has not started its
+                # session yet
+                return False
+            if e.errno != errno.EPERM:
+                raise
+        return True
+
+    @staticmethod
+    def _descendant_is_running(process):
+        try:
+            return process.is_running() and \
+                process.status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
@@ -0,0 +1,99 @@
+"""
+Profilers that can be used to run a job's plugin.
+
+Profiling is requested when the job is created (see :ref:`REST-API-Jobs`).
+The profiler output is written next to the job's log file and can be
+downloaded from the server once the job has finished.
+
+Two profilers are available:
+
+* cprofile - Deterministic profiling using cProfile. The output is a pstats
+  file which can be loaded with the pstats module or tools such as snakeviz.
+* sample - A low-overhead statistical profiler which records the stack of the
+  job every few milliseconds of CPU time. The output is in the collapsed stack
+  format used by flame graph tools. This is only available on platforms that
+  support SIGPROF (i.e. not Windows).
+"""
+import collections
+import cProfile
+import signal
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+
+# File extension and mimetype of the output of each profiler
+PROFILE_FILE_TYPES = {
+    CPROFILE: ('pstats', 'application/octet-stream'),
+    SAMPLE: ('folded', 'text/plain')
+}
+
+
+def available_profilers():
+    """
+    :return: The names of the profilers that can be used on this platform
+    :rtype: list of str
+    """
+    profilers = [CPROFILE]
+    if hasattr(signal, 'setitimer') and hasattr(signal, 'SIGPROF'):
+        profilers.append(SAMPLE)
+    return profilers
+
+
+class StackSampler(object):
+    """
+    Statistical profiler which samples the stack of the main thread every
+    interval seconds of CPU time.
+    """
+    def __init__(self, interval=0.005):
+        """
+        :param interval: Seconds of CPU time between samples
+        """
+        self.interval = interval
+        self._stacks = collections.Counter()
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{0} ({1}:{2})'.format(
+                code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        self._stacks[';'.join(reversed(stack))] += 1
+
+    def runcall(self, func, *args, **kwargs):
+        signal.signal(signal.SIGPROF, self._sample)
+        # Restart system calls interrupted by the sampling signal rather than
+        # raising EINTR in the profiled code
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def dump_stats(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self._stacks.most_common():
+                output.write('{0} {1}\n'.format(stack, count))
+
+
+def run_with_profiler(profiler_name, output_path, func, *args, **kwargs):
+    """
+    Call func under the named profiler and write the profile to output_path.
+    The profile is written even if func raises.
+
+    :param profiler_name: One of the names returned by available_profilers
+    :param output_path: Path of the file the profile is written to
+    :return: The value returned by func
+    """
+    if profiler_name == CPROFILE:
+        profiler = cProfile.Profile()
+    elif profiler_name == SAMPLE:
+        profiler = StackSampler()
+    else:
+        raise ValueError("Unknown profiler '{0}'".format(profiler_name))
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(output_path)
@@ -0,0 +1,318 @@
+"""
+Reusing the results of jobs that were run with the same plugin and config.
+
+A plugin whose jobs always give the same result for the same config, such as
+a check or a lookup, can ask for its results to be cached with a
+``CACHE_RESULTS`` attribute, which is either True, to keep them for as long
+as the server keeps results by default, or the number of seconds to keep
+them for::
+
+    CACHE_RESULTS = 60
+
+    def run(config, status):
+        ...
+
+Callers can ask for, or refuse, caching for the jobs they create with the
+``cache`` option (see :ref:`REST-API-Jobs`), which functions decorated with
+``@remotify(__name__, cache=True)`` set.
+
+When such a job is started, the final status of a job that finished with the
+same plugin and config is looked up. If it has not expired, the job finishes
+straight away with that status, without running. If an identical job is
+running, the job waits for it and finishes with its status. Only jobs that
+finish without raising an exception, and are not killed, have their status
+cached. If the job that was waited for fails, the first of the jobs waiting
+for it is run, and the others wait for that one.
+
+The cache keeps the most recently used results, up to a number of them.
+"""
+import collections
+import hashlib
+import threading
+import time
+
+# Default number of results kept and seconds they are kept for
+RESULT_CACHE_MAX_ENTRIES = 1000
+RESULT_CACHE_TTL_S = 300
+
+
+def cache_key(name, config):
+    """
+    :return: A key which is the same for every job of the plugin with an
+        equal config, whatever the order of the keys of its dictionaries
+    """
+    digest = hashlib.sha1()
+    _hash_value(digest, name)
+    _hash_value(digest, config)
+    return digest.hexdigest()
+
+
+def _hash_value(digest, value):
+    if isinstance(value, dict):
+        digest.update('d{0}:'.format(len(value)))
+        for key in sorted(value):
+            _hash_value(digest, key)
+            _hash_value(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update('l{0}:'.format(len(value)))
+        for item in value:
+            _hash_value(digest, item)
+    elif isinstance(value, unicode):
+        encoded = value.encode('utf-8')
+        digest.update('u{0}:'.format(len(encoded)))
+        digest.update(encoded)
+    elif isinstance(value, str):
+        digest.update('s{0}:'.format(len(value)))
+        digest.update(value)
+    else:
+        text = repr(value)
+        digest.update('{0}{1}:'.format(type(value).__name__, len(text)))
+        digest.update(text)
+
+
+class ResultCache(object):
+    """
+    The final statuses of the jobs that finished, by cache key, and the jobs
+    that are running for each key. It is thread safe.
+    """
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES,
+                 ttl_s=RESULT_CACHE_TTL_S):
+        """
+        :param max_entries: Most results kept. The least recently used are
+            dropped first
+        :param ttl_s: Seconds results are kept for, unless the job asks for
+            another time
+        """
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        # Statuses and the times they expire, least recently used first
+        self._results = collections.OrderedDict()
+        # Tasks waiting for the job running for each key
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        """
+        :return: The status cached for the key, or None
+        """
+        with self._lock:
+            return self._get(key)
+
+    def put(self, key, status, ttl_s=None):
+        """
+        Cache a status
+
+        :param ttl_s: Seconds it is kept for. The cache's by default
+        """
+        with self._lock:
+            self._put(key, status, ttl_s)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def submit(self, key, executor, job_kwargs, on_exit, on_status,
+               ttl_s=None):
+        """
+        Start running a job, unless its result is cached or an identical job
+        is running
+
+        :param executor: Runs the job if it has to be run (see
+            :mod:`hoplite.server.jobs.executors`)
+        :param job_kwargs: What is given to the executor
+        :param on_exit: Called without arguments once the job has finished,
+            if it does not finish as it is submitted
+        :param on_status: Called with the status of the job if it is not run
+            and so finishes with the status of another
+        :param ttl_s: Seconds the result of the job is kept for. The cache's
+            by default
+        :return: A task, which has the methods of the tasks of executors
+        """
+        task = CacheTask(
+            self, key, ttl_s, executor, job_kwargs, on_exit, on_status)
+        with self._lock:
+            status = self._get(key)
+            if status is None:
+                if key in self._waiting:
+                    self._waiting[key].append(task)
+                    return task
+                self._waiting[key] = []
+        if status is not None:
+            task._finish_with(status, notify=False)
+        else:
+            task._run()
+        return task
+
+    def _job_ended(self, task, status):
+        """
+        Called once the job run for a key has ended
+
+        :param status: The status the job finished with, or None if it
+            failed or was killed
+        """
+        run_next = None
+        with self._lock:
+            waiting = self._waiting.pop(task.key, [])
+            if status is not None:
+                self._put(task.key, status, task.ttl_s)
+            elif waiting:
+                run_next = waiting.pop(0)
+                self._waiting[task.key] = waiting
+                waiting = []
+        for waiting_task in waiting:
+            waiting_task._finish_with(status)
+        if run_next is not None:
+            run_next._run()
+
+    def _stop_waiting(self, task):
+        """
+        :return: True if the task was waiting for another, and has stopped
+        """
+        with self._lock:
+            waiting = self._waiting.get(task.key, [])
+            if task in waiting:
+                waiting.remove(task)
+                return True
+            return False
+
+    def _get(self, key):
+        entry = self._results.pop(key, None)
+        if entry is None:
+            return None
+        status, expires_at = entry
+        if expires_at <= time.time():
+            return None
+        self._results[key] = entry
+        return status
+
+    def _put(self, key, status, ttl_s):
+        if self.max_entries <= 0:
+            return
+        ttl_s = self.ttl_s if ttl_s is None else ttl_s
+        self._results.pop(key, None)
+        self._results[key] = (status, time.time() + ttl_s)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+
+class _TaskResults(object):
+    """
+    What the job sends its parent, if it was run
+    """
+    def __init__(self, task):
+        self._task = task
+
+    def poll(self):
+        run = self._task._run_task
+        if run is not None:
+            return run.results.poll()
+        return not self._task.is_alive()
+
+    def recv(self):
+        run = self._task._run_task
+        if run is not None:
+            return run.results.recv()
+        raise EOFError
+
+    def close(self):
+        run = self._task._run_task
+        if run is not None:
+            run.results.close()
+
+
+class CacheTask(object):
+    """
+    A job whose result may be cached. It is either run by an executor, or
+    finishes with the status of another job.
+    """
+    def __init__(self, cache, key, ttl_s, executor, job_kwargs, on_exit,
+                 on_status):
+        self.key = key
+        self.ttl_s = ttl_s
+        self.results = _TaskResults(self)
+        self._cache = cache
+        self._executor = executor
+        self._job_kwargs = job_kwargs
+        self._on_exit = on_exit
+        self._on_status = on_status
+        # The task of the executor, once the job is run
+        self._run_task = None
+        self._finishing = False
+        self._finished = False
+        self._lock = threading.Lock()
+
+    @property
+    def pid(self):
+        run = self._run_task
+        return run.pid if run is not None else None
+
+    def is_alive(self):
+        run = self._run_task
+        if run is not None:
+            return run.is_alive()
+        return not self._finished
+
+    def plugin_loaded_at(self):
+        run = self._run_task
+        return run.plugin_loaded_at() if run is not None else None
+
+    def terminate(self):
+        self._cache._stop_waiting(self)
+        with self._lock:
+            run = self._run_task
+            if run is None:
+                # The job is being killed, which records its end
+                self._finished = True
+                return
+        run.terminate()
+
+    def kill(self):
+        run = self._run_task
+        if run is not None:
+            run.kill()
+
+    def alive(self):
+        run = self._run_task
+        if run is not None:
+            return run.alive()
+        return self.is_alive()
+
+    def count_alive(self):
+        run = self._run_task
+        if run is not None:
+            return run.count_alive()
+        return int(self.is_alive())
+
+    def job_ended(self, status):
+        """
+        Called by the job once it has recorded its end
+
+        :param status: The final status of the job, or None if it failed or
+            was killed
+        """
+        if self._run_task is not None:
+            self._cache._job_ended(self, status)
+
+    def _run(self):
+        with self._lock:
+            if not self._finished:
+                self._run_task = self._executor.submit(
+                    self._job_kwargs, on_exit=self._on_exit)
+                return
+        # Killed while it waited, so the identical jobs must not wait for it
+        self._cache._job_ended(self, None)
+
+    def _finish_with(self, status, notify=True):
+        with self._lock:
+            if self._finished or self._finishing:
+                return
+            self._finishing = True
+        # The status is set before the job is seen to have finished
+        self._on_status(status)
+        with self._lock:
+            self._finished = True
+        if notify and self._on_exit is not None:
+            self._on_exit()
@@ -0,0 +1,111 @@
+"""
+The recent changes to the status of a job, so clients that missed updates
+between polls can catch up on them, and so how a job progressed can be seen
+after the fact.
+
+Each change is kept as the patch that made it (see
+:mod:`hoplite.utils.status_patch`) with the version of the job after the
+change and the time it was made. The oldest changes are dropped once there
+are more than max_entries of them, or once they take more than about
+max_bytes, so the memory used by a job's history is bounded no matter how
+often its status changes.
+"""
+import collections
+import time
+
+from hoplite.utils.status_patch import APPEND, SET, UNSET
+
+# Default limits of the history of each job
+HISTORY_MAX_ENTRIES = 1000
+HISTORY_MAX_BYTES = 1024 * 1024
+
+
+def approximate_size(value):
+    """
+    :return: Rough number of bytes the value takes when serialized. This is
+        much cheaper than serializing it.
+    """
+    if isinstance(value, dict):
+        return 2 + sum(
+            approximate_size(key) + approximate_size(item)
+            for key, item in value.iteritems())
+    if isinstance(value, (list, tuple)):
+        return 2 + sum(approximate_size(item) for item in value)
+    if isinstance(value, basestring):
+        return len(value)
+    return 8
+
+
+class StatusHistory(object):
+    """
+    Ring buffer of the changes to a job's status, oldest first. It is not
+    thread safe, the job guards it with its lock.
+    """
+    def __init__(self, max_entries=HISTORY_MAX_ENTRIES,
+                 max_bytes=HISTORY_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Pairs of entries and their approximate sizes
+        self._entries = collections.deque()
+        self._bytes = 0
+        # Version and time of the newest entry that was dropped
+        self.dropped_version = 0
+        self.dropped_at = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, version, patch, at=None):
+        """
+        :param version: Version of the job after the change
+        :param patch: The patch that changed the status
+        :param at: Time of the change, in seconds since the epoch. Now by
+            default
+        """
+        entry = {
+            'version': version,
+            'time': time.time() if at is None else at
+        }
+        for part in (UNSET, SET, APPEND):
+            if part in patch:
+                entry[part] = patch[part]
+        size = approximate_size(patch)
+        self._entries.append((entry, size))
+        self._bytes += size
+        while self._entries and (
+                len(self._entries) > self.max_entries or
+                self._bytes > self.max_bytes):
+            dropped, dropped_size = self._entries.popleft()
+            self._bytes -= dropped_size
+            self.dropped_version = dropped['version']
+            self.dropped_at = dropped['time']
+
+    def find(self, since=None, until=None, after_version=None):
+        """
+        Find the changes made in a range of time, or after a version
+
+        :param since: Only find changes made at or after this time, in
+            seconds since the epoch
+        :param until: Only find changes made before this time
+        :param after_version: Only find changes that made versions after this
+            one
+        :return: The changes, oldest first, and whether changes that would
+            have been found after since and after_version have been dropped
+        """
+        found = []
+        # The newest changes are the ones usually asked for, so the entries
+        # are searched from the newest until they are too old
+        for entry, _ in reversed(self._entries):
+            if after_version is not None and entry['version'] <= after_version:
+                break
+            if since is not None and entry['time'] < since:
+                break
+            if until is None or entry['time'] < until:
+                found.append(entry)
+        found.reverse()
+        truncated = self.dropped_version > 0
+        if after_version is not None:
+            truncated = truncated and self.dropped_version > after_version
+        if since is not None:
+            truncated = truncated and self.dropped_at >= since
+        return found, truncated
@@ -0,0 +1,214 @@
+"""
+Retention of job and remoted function logs.
+
+Every job gets its own log file (plus up to 100 rotated backups) and every
+remoted function call gets another, and nothing else ever removes them. On a
+busy machine the log directories grow to hundreds of thousands of files,
+which slows down every operation on them and eventually fills the disk.
+
+The :class:`LogJanitor` periodically walks the log directories from a
+background thread of the server. Logs that have not been written to for a
+while are compressed with gzip, logs older than the maximum age are deleted,
+and if the logs still take up more than the size quota the oldest ones are
+deleted until they fit. Logs of jobs which have not finished are never
+touched.
+"""
+import errno
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+
+from hoplite.server.jobs.job_log import COMPRESSED_EXTENSION
+from hoplite.utils import server_logging
+
+logger = server_logging.get_server_logger(__name__)
+
+# Job logs, their rotated backups and their compressed versions
+LOG_FILE_PATTERN = re.compile(r'\.log(\.\d+)?(\.gz)?$')
+
+
+class LogFile(object):
+    """
+    A log file found by the janitor
+    """
+    def __init__(self, path, size, modified):
+        self.path = path
+        self.size = size
+        self.modified = modified
+
+    def compressed(self):
+        return self.path.endswith(COMPRESSED_EXTENSION)
+
+
+class LogJanitor(object):
+    """
+    Compresses and deletes old logs from a background thread
+    """
+    def __init__(self, directories=None, max_age_s=30 * 24 * 60 * 60,
+                 max_total_bytes=1024 * 1024 * 1024, compress_after_s=60 * 60,
+                 min_idle_s=5 * 60, interval_s=10 * 60, active_paths=None):
+        """
+        :param directories: Directories searched (recursively) for logs.
+            Defaults to the job and remoted function log directories
+        :param max_age_s: Logs not written to for this many seconds are
+            deleted. None keeps logs regardless of their age
+        :param max_total_bytes: Once the logs take up more than this many bytes
+            the oldest ones are deleted. None disables the quota
+        :param compress_after_s: Logs not written to for this many seconds are
+            compressed. None disables compression
+        :param min_idle_s: Logs written to within this many seconds are left
+            alone, as they may belong to a running job of another server
+            sharing the log directories
+        :param interval_s: Seconds between runs of the janitor
+        :param active_paths: Function returning the paths of the logs that are
+            still in use, such as the logs of jobs that have not finished.
+            Rotated backups and compressed versions of these logs are left
+            alone as well
+        """
+        if directories is None:
+            directories = [
+                server_logging.get_job_log_root(),
+                server_logging.get_remoted_function_log_root()]
+        self.directories = directories
+        self.max_age_s = max_age_s
+        self.max_total_bytes = max_total_bytes
+        self.compress_after_s = compress_after_s
+        self.min_idle_s = min_idle_s
+        self.interval_s = interval_s
+        self._active_paths = active_paths or (lambda: [])
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start cleaning up the logs every interval_s seconds
+        """
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='hoplite-log-janitor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the background thread, waiting for the current run to finish
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def clean(self, now=None):
+        """
+        Compress and delete logs once
+
+        :param now: Time the ages of the logs are measured from. Defaults to
+            the current time
+        :return: Number of logs compressed and deleted
+        :rtype: dict
+        """
+        if now is None:
+            now = time.time()
+        result = {'compressed': 0, 'deleted': 0}
+        active_paths = set(self._active_paths())
+        log_files = [
+            log_file for log_file in self._find_logs()
+            if not self._in_use(log_file, active_paths, now)]
+
+        if self.compress_after_s is not None:
+            for index, log_file in enumerate(log_files):
+                if log_file.compressed() or \
+                        now - log_file.modified < self.compress_after_s:
+                    continue
+                compressed = self._compress(log_file)
+                if compressed is not None:
+                    log_files[index] = compressed
+                    result['compressed'] += 1
+
+        # Oldest first
+        log_files.sort(key=lambda log_file: log_file.modified)
+        total_bytes = sum(log_file.size for log_file in log_files)
+        for log_file in log_files:
+            too_old = self.max_age_s is not None and \
+                now - log_file.modified > self.max_age_s
+            over_quota = self.max_total_bytes is not None and \
+                total_bytes > self.max_total_bytes
+            if not (too_old or over_quota):
+                # Every log after this one is newer
+                break
+            if self._remove(log_file.path):
+                total_bytes -= log_file.size
+                result['deleted'] += 1
+        if result['compressed'] or result['deleted']:
+            logger.info(
+                "Log janitor compressed %s and deleted %s logs",
+                result['compressed'], result['deleted'])
+        return result
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.clean()
+            except Exception:
+                logger.exception("Log janitor failed to clean up logs")
+            self._stop_event.wait(self.interval_s)
+
+    def _find_logs(self):
+        for directory in self.directories:
+            for root, _, file_names in os.walk(directory):
+                for file_name in file_names:
+                    if not LOG_FILE_PATTERN.search(file_name):
+                        continue
+                    path = os.path.join(root, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        # Removed since the directory was listed
+                        continue
+                    yield LogFile(path, stat.st_size, stat.st_mtime)
+
+    def _in_use(self, log_file, active_paths, now):
+        if now - log_file.modified < self.min_idle_s:
+            return True
+        # Rotated backups and compressed versions belong to the same log
+        log_path = LOG_FILE_PATTERN.sub('.log', log_file.path)
+        return log_path in active_paths
+
+    def _compress(self, log_file):
+        """
+        :return: The compressed log, or None if it could not be compressed
+        """
+        compressed_path = log_file.path + COMPRESSED_EXTENSION
+        temp_path = compressed_path + '.tmp'
+        try:
+            with open(log_file.path, 'rb') as source:
+                with gzip.open(temp_path, 'wb') as destination:
+                    shutil.copyfileobj(source, destination)
+            # Keep the age of the log, so it is deleted when it would have
+            # been if it had not been compressed
+            os.utime(temp_path, (log_file.modified, log_file.modified))
+            # Fails on Windows if the log is still open
+            os.remove(log_file.path)
+        except (IOError, OSError):
+            logger.exception("Could not compress %s", log_file.path)
+            self._remove(temp_path)
+            return None
+        os.rename(temp_path, compressed_path)
+        return LogFile(
+            compressed_path, os.path.getsize(compressed_path),
+            log_file.modified)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("Could not delete %s: %s", path, e)
+                return False
+        return True
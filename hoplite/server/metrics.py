@@ -0,0 +1,235 @@
+"""
+Simple in-process metrics for the hoplite server.
+
+Metrics are rendered in the Prometheus text exposition format by the
+:ref:`/metrics <REST-API-Metrics>` endpoint. Only the small subset of the
+format needed by hoplite is implemented, so the prometheus client library is
+not required.
+"""
+import threading
+
+# Buckets are in seconds
+LATENCY_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+DURATION_BUCKETS = (.1, .5, 1, 5, 10, 30, 60, 300, 900, 3600, 14400)
+# Buckets are in bytes
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape_label_value(value):
+    return str(value).replace(
+        '\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = zip(label_names, label_values)
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(name, _escape_label_value(value))
+        for name, value in pairs) + '}'
+
+
+class _Metric(object):
+    metric_type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        """
+        :param name: Name of the metric as shown to Prometheus
+        :param documentation: Text shown in the HELP line of the metric
+        :param label_names: Names of the labels used to partition the metric
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                "Metric {0} expects labels {1}, got {2}".format(
+                    self.name, self.label_names, sorted(labels)))
+        return tuple(labels[name] for name in self.label_names)
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self):
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.documentation),
+            '# TYPE {0} {1}'.format(self.name, self.metric_type)]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return ['{0}{1} {2}'.format(
+            self.name,
+            _format_labels(self.label_names, key),
+            _format_value(value))]
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, such as the number of jobs created
+    """
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down, such as the number of running jobs
+    """
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """
+    Counts observations, such as request latencies, in configurable buckets
+    """
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(),
+                 buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0.0))
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(
+                self._key(labels), ([0] * len(self.buckets), 0.0))
+            return sum(counts)
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append('{0}_bucket{1} {2}'.format(
+                self.name,
+                _format_labels(
+                    self.label_names, key,
+                    ('le', _format_value(upper_bound))),
+                _format_value(cumulative)))
+        labels = _format_labels(self.label_names, key)
+        lines.append('{0}_sum{1} {2}'.format(
+            self.name, labels, _format_value(total)))
+        lines.append('{0}_count{1} {2}'.format(
+            self.name, labels, _format_value(cumulative)))
+        return lines
+
+
+class MetricsRegistry(object):
+    """
+    Holds every metric that is exposed by the server
+    """
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+    def render(self):
+        """
+        :return: All registered metrics in the Prometheus text format
+        :rtype: str
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+JOBS_CREATED = registry.register(Counter(
+    'hoplite_jobs_created_total', 'Number of jobs created.', ['plugin']))
+JOBS_STARTED = registry.register(Counter(
+    'hoplite_jobs_started_total', 'Number of jobs started.', ['plugin']))
+JOBS_FINISHED = registry.register(Counter(
+    'hoplite_jobs_finished_total',
+    'Number of jobs whose process has exited, whatever the outcome.',
+    ['plugin']))
+JOBS_FAILED = registry.register(Counter(
+    'hoplite_jobs_failed_total',
+    'Number of jobs that finished by raising an exception.', ['plugin']))
+JOBS_KILLED = registry.register(Counter(
+    'hoplite_jobs_killed_total', 'Number of jobs that were killed.',
+    ['plugin']))
+JOBS_TIMED_OUT = registry.register(Counter(
+    'hoplite_jobs_timed_out_total',
+    'Number of jobs killed because they ran past their deadline.',
+    ['plugin']))
+JOBS_QUEUED = registry.register(Gauge(
+    'hoplite_jobs_queued', 'Number of jobs created but not yet started.'))
+JOBS_RUNNING = registry.register(Gauge(
+    'hoplite_jobs_running', 'Number of jobs currently running.'))
+JOBS_STORED = registry.register(Gauge(
+    'hoplite_jobs_stored', 'Number of jobs held by the job manager.'))
+JOB_SPAWN_SECONDS = registry.register(Histogram(
+    'hoplite_job_spawn_seconds',
+    'Time taken to spawn the process that runs a job.', ['plugin']))
+JOB_DURATION_SECONDS = registry.register(Histogram(
+    'hoplite_job_duration_seconds',
+    'Time from starting a job until its process was seen to exit.',
+    ['plugin'], buckets=DURATION_BUCKETS))
+JOB_STATUS_UPDATES = registry.register(Counter(
+    'hoplite_job_status_updates_total',
+    'Number of status updates received from running jobs.', ['plugin']))
+JOB_RESULT_CACHE_HITS = registry.register(Counter(
+    'hoplite_job_result_cache_hits_total',
+    'Number of jobs that finished with the cached status of an identical '
+    'job instead of running.', ['plugin']))
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    'hoplite_http_request_duration_seconds',
+    'Time spent handling HTTP requests.',
+    ['blueprint', 'route', 'method']))
+HTTP_RESPONSE_BYTES = registry.register(Histogram(
+    'hoplite_http_response_size_bytes', 'Size of HTTP response bodies.',
+    ['blueprint', 'route', 'method'], buckets=SIZE_BUCKETS))
@@ -0,0 +1,140 @@
+"""
+Runs the hoplite Flask application on tornado's HTTP server.
+
+tornado's WSGIContainer collects the whole response body before writing any
+of it, which makes streamed responses (such as following a job's log)
+impossible and holds large responses in memory. StreamingWSGIContainer
+behaves the same for ordinary responses, but responses without a
+Content-Length header are iterated on a separate thread and written to the
+client chunk by chunk, so the IO loop stays free to serve other requests
+meanwhile.
+"""
+import threading
+
+import tornado
+from tornado import escape, httputil
+from tornado.ioloop import IOLoop
+from tornado.wsgi import WSGIContainer
+
+from hoplite.utils import server_logging
+
+logger = server_logging.get_server_logger(__name__)
+
+
+class StreamingWSGIContainer(WSGIContainer):
+    """
+    WSGIContainer that streams responses which have no Content-Length
+    """
+    def __init__(self, wsgi_application, max_streams=32):
+        """
+        :param wsgi_application: The WSGI application to run
+        :param max_streams: Maximum number of responses streamed at the same
+            time. Further streamed responses wait until one finishes
+        """
+        super(StreamingWSGIContainer, self).__init__(wsgi_application)
+        self._stream_slots = threading.BoundedSemaphore(max_streams)
+
+    def __call__(self, request):
+        data = {}
+        response = []
+
+        def start_response(status, response_headers, exc_info=None):
+            data["status"] = status
+            data["headers"] = response_headers
+            return response.append
+        app_response = self.wsgi_application(
+            WSGIContainer.environ(request), start_response)
+        if not data:
+            raise Exception("WSGI app did not call start_response")
+
+        status_code, reason = data["status"].split(' ', 1)
+        status_code = int(status_code)
+        headers = data["headers"]
+        header_set = set(k.lower() for (k, v) in headers)
+        buffered = status_code == 304 or "content-length" in header_set
+        if buffered:
+            try:
+                response.extend(app_response)
+                body = b"".join(response)
+            finally:
+                if hasattr(app_response, "close"):
+                    app_response.close()
+        else:
+            # Anything written with the write() callable of start_response is
+            # sent before the rest of the body
+            body = b"".join(response)
+        body = escape.utf8(body)
+        if "content-type" not in header_set:
+            headers.append(("Content-Type", "text/html; charset=UTF-8"))
+        if "server" not in header_set:
+            headers.append(("Server", "TornadoServer/%s" % tornado.version))
+
+        start_line = httputil.ResponseStartLine(
+            "HTTP/1.1", status_code, reason)
+        header_obj = httputil.HTTPHeaders()
+        for key, value in headers:
+            header_obj.add(key, value)
+        # tornado uses chunked encoding for responses without a Content-Length
+        request.connection.write_headers(start_line, header_obj, chunk=body)
+        if buffered:
+            request.connection.finish()
+            self._log(status_code, request)
+            return
+        # Daemon threads are used so a stream that never ends (such as a
+        # followed log) does not keep the server from exiting
+        thread = threading.Thread(
+            target=self._stream,
+            args=(IOLoop.current(), request, app_response, status_code))
+        thread.daemon = True
+        thread.start()
+
+    def _stream(self, io_loop, request, app_response, status_code):
+        """
+        Write the body of a response from a separate thread. Writes are done
+        on the IO loop, and each chunk is only written once the previous one
+        has been sent, so slow clients do not make the body pile up in
+        memory.
+        """
+        self._stream_slots.acquire()
+        try:
+            for chunk in app_response:
+                if request.connection.stream.closed():
+                    break
+                if chunk and not self._write(
+                        io_loop, request, escape.utf8(chunk)):
+                    break
+        except Exception:
+            logger.exception("Error while streaming %s", request.uri)
+        finally:
+            if hasattr(app_response, "close"):
+                app_response.close()
+            self._stream_slots.release()
+            io_loop.add_callback(self._finish, request, status_code)
+
+    def _write(self, io_loop, request, chunk):
+        """
+        :return: False if the client has disconnected
+        """
+        written = threading.Event()
+        result = {}
+
+        def write():
+            try:
+                future = request.connection.write(chunk)
+            except Exception as e:
+                result["error"] = e
+                written.set()
+                return
+
+            def done(future):
+                result["error"] = future.exception()
+                written.set()
+            future.add_done_callback(done)
+        io_loop.add_callback(write)
+        written.wait()
+        return result.get("error") is None
+
+    def _finish(self, request, status_code):
+        if not request.connection.stream.closed():
+            request.connection.finish()
+        self._log(status_code, request)
@@ -0,0 +1,91 @@
+"""
+gzip compression of HTTP bodies sent between hoplite clients and servers.
+
+Bodies smaller than :data:`MIN_COMPRESS_BYTES` are sent as they are, since
+compressing them saves little and costs time on both ends. Servers list the
+encodings they accept in request bodies in the Accept-Encoding header of
+their responses (see RFC 7694), so clients only compress requests to servers
+that can decompress them.
+"""
+import zlib
+
+GZIP = 'gzip'
+MIN_COMPRESS_BYTES = 1024
+COMPRESS_LEVEL = 6
+# Decompressed request bodies larger than this are rejected, so a small
+# compressed body can't be used to exhaust the server's memory
+MAX_DECOMPRESSED_BYTES = 1024 * 1024 * 1024
+
+# Tells zlib to write and read a gzip header and trailer
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class DecompressedTooLargeError(ValueError):
+    pass
+
+
+def gzip_compress(data, level=COMPRESS_LEVEL):
+    """
+    :param data: The bytes to compress
+    :return: data compressed in the gzip format
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_compress_stream(chunks, level=COMPRESS_LEVEL):
+    """
+    :param chunks: Iterable of the bytes to compress, such as the body of a
+        streamed response
+    :return: Generator of the chunks compressed in the gzip format. Only
+        chunks zlib has output for are yielded, and the rest when chunks is
+        exhausted
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    try:
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        # Stops the chunks from being produced if the client goes away
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def gzip_decompress(data, max_bytes=MAX_DECOMPRESSED_BYTES):
+    """
+    :param data: Bytes compressed in the gzip format
+    :param max_bytes: Maximum size of the decompressed data
+    :return: The decompressed data
+    :raises DecompressedTooLargeError: if the decompressed data would be larger
+        than max_bytes
+    :raises zlib.error: if data is not valid gzip data
+    """
+    decompressor = zlib.decompressobj(_GZIP_WBITS)
+    decompressed = decompressor.decompress(data, max_bytes + 1)
+    if len(decompressed) > max_bytes:
+        raise DecompressedTooLargeError(
+            "Decompressed body is larger than {0} bytes".format(max_bytes))
+    return decompressed + decompressor.flush()
+
+
+def accepts_gzip(accept_encoding):
+    """
+    :param accept_encoding: Value of an Accept-Encoding header
+    :return: True if the header lists gzip with a non-zero quality
+    """
+    for coding in (accept_encoding or '').split(','):
+        parts = [part.strip() for part in coding.split(';')]
+        if parts[0].lower() != GZIP:
+            continue
+        for parameter in parts[1:]:
+            name, _, value = parameter.partition('=')
+            if name.strip() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
@@ -0,0 +1,194 @@
+"""
+What a running job knows about itself, so the jobs it starts on other
+servers can be stopped together with it.
+
+The job process has a single context, set up by the job wrapper before the
+plugin runs. Every :py:class:`hoplite.client.RemoteJob` created in the
+process (directly, through a remote job manager, or by calling a remoted
+function) is a child of the job:
+
+* A child is given no more time than the job has left before its deadline,
+  as its max_runtime, so it is stopped by its own server even if this one
+  can't reach it
+* When the job is killed, or times out, the job process is sent SIGTERM.
+  JobCancelledError is then raised in the plugin so it can clean up, and once
+  the plugin has returned the context is cancelled, which kills every child
+  the job created
+
+Plugins that run long loops can also poll :py:meth:`JobContext.cancelled` or
+call :py:meth:`JobContext.check_cancelled` themselves.
+
+Jobs run on a thread of the server (see
+:mod:`hoplite.server.jobs.executors`) have a context of their own thread
+instead, which threads they start do not see. Their context is cancelled
+without raising JobCancelledError, so they have to check it.
+
+Outside of a job there is no context, and remote jobs are created as they
+are asked for.
+"""
+import logging
+import signal
+import threading
+import time
+
+from hoplite.exceptions import JobCancelledError, TimeoutError
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+_current = None
+# Jobs run on threads of the server each have a context of their own
+_local = threading.local()
+
+
+def current_context():
+    """
+    :return: The :py:class:`JobContext` of the job running in this thread or
+        process, or None outside of a job
+    """
+    return getattr(_local, 'context', None) or _current
+
+
+def set_current_context(context, thread_only=False):
+    """
+    :param context: The :py:class:`JobContext` of the job running in this
+        process, or None
+    :param thread_only: Set the context of this thread only, for jobs that
+        are run on a thread
+    """
+    global _current
+    if thread_only:
+        _local.context = context
+    else:
+        _current = context
+
+
+class JobContext(object):
+    """
+    The context of the job running in this process
+    """
+    def __init__(self, uuid='', deadline=None):
+        """
+        :param uuid: UUID of the job
+        :param deadline: Time, in seconds since the epoch, by which the job
+            must have finished, or None
+        """
+        self.uuid = uuid
+        self.deadline = deadline
+        self._cancelled = threading.Event()
+        # Set by the SIGTERM handler, which can't take locks: it interrupts
+        # the main thread, which may hold them
+        self._terminated = False
+        self._lock = threading.Lock()
+        self._children = []
+
+    def remaining(self):
+        """
+        :return: Seconds left before the deadline of the job, or None if it
+            has no deadline
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def cancelled(self):
+        """
+        :return: True once the job has been cancelled
+        """
+        return self._terminated or self._cancelled.is_set()
+
+    def check_cancelled(self):
+        """
+        :raises JobCancelledError: if the job has been cancelled
+        """
+        if self.cancelled():
+            raise JobCancelledError(self.uuid)
+
+    def wait(self, timeout=None):
+        """
+        Sleep until the job is cancelled, or the timeout passes
+
+        :return: True if the job has been cancelled
+        """
+        # Event.wait returns None on Python 2.6
+        self._cancelled.wait(timeout)
+        return self.cancelled()
+
+    def child_max_runtime(self, max_runtime=None):
+        """
+        :param max_runtime: The max_runtime asked for a child job, or None
+        :return: The max_runtime to give the child, which is no more than the
+            time this job has left
+        :raises JobCancelledError: if the job has been cancelled
+        :raises TimeoutError: if the job has already run past its deadline
+        """
+        self.check_cancelled()
+        remaining = self.remaining()
+        if remaining is None:
+            return max_runtime
+        if remaining <= 0:
+            raise TimeoutError(self.uuid)
+        if max_runtime is None:
+            return remaining
+        return min(max_runtime, remaining)
+
+    def add_child(self, job):
+        """
+        Kill the remote job when this job is cancelled. If it already has
+        been, the remote job is killed straight away.
+
+        :param job: :py:class:`hoplite.client.RemoteJob` created by this job
+        """
+        with self._lock:
+            if not self.cancelled():
+                self._children.append(job)
+                return
+        self._kill_child(job)
+
+    def cancel(self):
+        """
+        Cancel the job, killing every remote job it created
+
+        :return: False if the job had already been cancelled
+        """
+        with self._lock:
+            if self._cancelled.is_set():
+                return False
+            self._cancelled.set()
+            children, self._children = self._children, []
+        for job in children:
+            self._kill_child(job)
+        return True
+
+    def _kill_child(self, job):
+        try:
+            if not job.finished():
+                job.kill()
+        except Exception:
+            # The job failed, or its server is gone. Either way there is
+            # nothing left to stop.
+            logger.warning(
+                "Could not kill job %s on %s, started by job %s", job.uuid,
+                job.address, self.uuid, exc_info=True)
+
+    def install_signal_handler(self):
+        """
+        Raise JobCancelledError in the main thread when the process is sent
+        SIGTERM. From then on the job counts as cancelled, but its children
+        are only killed by :py:meth:`cancel`, which the job wrapper calls
+        once the plugin has returned, since the handler may have interrupted
+        code holding the lock of the context. Nothing is done outside of the
+        main thread, where signal handlers can't be set.
+
+        :return: The previous handler, to restore once the plugin has run
+        """
+        def on_terminate(signum, frame):
+            # The job process may be sent SIGTERM more than once
+            if not self.cancelled():
+                self._terminated = True
+                raise JobCancelledError(self.uuid)
+        try:
+            return signal.signal(signal.SIGTERM, on_terminate)
+        except ValueError:
+            # Not the main thread
+            return None
@@ -1,10 +1,28 @@
+"""
+Logging for the hoplite server and the jobs it runs.
+
+Log records are not written by the thread that logs them. Every handler
+configured by this module is wrapped in an :class:`AsyncHandler`, which puts
+the record on a queue that is drained by a single writer thread per process,
+so logging never adds disk latency to a request. The logging configuration is
+loaded once per process, and the file of a job's log is only opened when the
+first record is written to it and is closed again by :func:`close_job_logger`
+when the job ends.
+
+Processes that exit without running atexit handlers, such as the processes
+jobs run in, must call :func:`flush` before exiting so no records are lost.
+"""
+import atexit
 import errno
 import logging
 import logging.config
 import logging.handlers
 import os
 import platform
+import Queue
 import string
+import threading
+import uuid
 
 # Tone down logging from the http modules
 log = logging.getLogger('werkzeug')
@@ -14,6 +32,144 @@ log.setLevel(logging.WARNING)
 log = logging.getLogger('tornado')
 log.setLevel(logging.WARNING)
 
+_configure_lock = threading.Lock()
+_configured = False
+
+
+class _LogWriter(object):
+    """
+    Writes records queued by AsyncHandlers from a single background thread.
+    A new queue and thread are created the first time it is used in a forked
+    process, since threads do not survive a fork.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._handlers = set()
+
+    def register(self, handler):
+        with self._lock:
+            self._handlers.add(handler)
+
+    def put(self, item):
+        pid = os.getpid()
+        if self._pid != pid:
+            self._start(pid)
+        self._queue.put(item)
+
+    def flush(self, timeout=5):
+        """
+        Wait for every record queued before the call to be written
+
+        :param timeout: Maximum number of seconds to wait
+        :return: False if the records were not written within the timeout
+        """
+        if self._pid != os.getpid():
+            return True
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        done.wait(timeout)
+        return done.is_set()
+
+    def _start(self, pid):
+        if self._pid is not None and self._pid != pid:
+            # This is a forked process. The writer thread of the parent may
+            # have held these locks when the fork happened, in which case
+            # they would never be released here.
+            self._lock = threading.Lock()
+            for handler in self._handlers:
+                handler.createLock()
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._queue = Queue.Queue()
+            thread = threading.Thread(
+                target=self._run, args=(self._queue,),
+                name='hoplite-log-writer')
+            thread.daemon = True
+            thread.start()
+            self._pid = pid
+
+    def _run(self, queue):
+        while True:
+            item = queue.get()
+            action = item[0]
+            if action == 'record':
+                _, handler, record = item
+                try:
+                    handler.handle(record)
+                except Exception:
+                    handler.handleError(record)
+            elif action == 'close':
+                _, handler = item
+                handler.close()
+                with self._lock:
+                    self._handlers.discard(handler)
+            elif action == 'flush':
+                _, done = item
+                with self._lock:
+                    handlers = list(self._handlers)
+                for handler in handlers:
+                    try:
+                        handler.flush()
+                    except (IOError, ValueError):
+                        # The stream was closed by someone else
+                        pass
+                done.set()
+
+
+_writer = _LogWriter()
+# Registered after the logging module registers logging.shutdown, so this
+# runs first and the writer is done before the handlers are closed
+atexit.register(_writer.flush)
+
+
+class AsyncHandler(logging.Handler):
+    """
+    Hands records to the log writer thread, which passes them on to the
+    wrapped handler
+    """
+    def __init__(self, handler):
+        """
+        :param handler: The handler the records are written with
+        """
+        logging.Handler.__init__(self, handler.level)
+        self.handler = handler
+        _writer.register(handler)
+
+    def prepare(self, record):
+        # Merge the message and its arguments now, as the arguments may be
+        # changed by the time the writer thread gets to the record
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            _writer.put(('record', self.handler, self.prepare(record)))
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        _writer.put(('close', self.handler))
+        logging.Handler.close(self)
+
+
+def flush(timeout=5):
+    """
+    Wait for all queued log records to be written. Must be called before a
+    process exits without running atexit handlers.
+
+    :param timeout: Maximum number of seconds to wait
+    :return: False if the records were not written within the timeout
+    """
+    return _writer.flush(timeout)
+
 
 def get_server_logger(name=""):
     # set up hoplite_logging
@@ -22,68 +178,140 @@ def get_server_logger(name=""):
 
 
 def get_job_logger(name="", uuid=""):
+    """
+    Get the logger of a job. Records are written to the job's log file (see
+    :func:`get_job_file_path`) as well as the server's log. The file is not
+    opened until the first record is written to it. Call
+    :func:`close_job_logger` once the job has ended.
+    """
     logger = _get_base_logger("hoplite.{0}_{1}".format(name, uuid))
+    if logger.handlers:
+        # The job process inherits the logger the server created for the job
+        return logger
 
-    log_file = "{0}_{1}.log".format(name, uuid)
-    log_file_path = log_file
-
-    opsys = platform.system().lower()
-    if opsys == 'windows':
-        log_file_path = os.path.join(r"C:\logs\hoplite\jobs", name)
-        try:
-            os.makedirs(log_file_path)
-        except OSError as e:
-            if not (e.errno == errno.EEXIST and os.path.isdir(log_file_path)):
-                raise
-        log_file_path = os.path.join(log_file_path, log_file)
-    elif opsys == 'linux' or opsys == 'darwin':
-        log_file_path = os.path.join(
-            os.path.expanduser('~'), '.hoplite', 'jobs', name)
-        try:
-            os.makedirs(log_file_path)
-        except OSError as e:
-            if not (e.errno == errno.EEXIST and os.path.isdir(log_file_path)):
-                raise
-        log_file_path = os.path.join(log_file_path, log_file)
+    log_file_path = get_job_file_path(name, uuid, "log")
 
     fh = logging.handlers.RotatingFileHandler(
         filename=log_file_path,
         maxBytes=2097152,
-        backupCount=100)
+        backupCount=100,
+        delay=True)
     fh.setLevel(logging.DEBUG)
     # Add context info
     formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     fh.setFormatter(formatter)
-    logger.addHandler(fh)
+    logger.addHandler(AsyncHandler(fh))
 
     return logger
 
 
-def _get_base_logger(name=""):
-    opsys = platform.system().lower()
-    if opsys == 'windows':
-        log_file_path = os.path.join(r"C:\logs\hoplite\hoplite")
-    elif opsys == 'linux' or opsys == 'darwin':
-        log_file_path = os.path.join(
-            os.path.expanduser('~'), '.hoplite', 'hoplite')
-    else:
-        raise NotImplementedError()
+def close_job_logger(logger):
+    """
+    Close the log file of a job and forget its logger. Records logged with
+    the logger afterwards are only written to the server's log.
+
+    :param logger: A logger returned by :func:`get_job_logger`
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logging.Logger.manager.loggerDict.pop(logger.name, None)
+
+
+def get_job_file_path(name="", uuid="", extension="log"):
+    """
+    Get the path of a file belonging to a job, such as its log file or its
+    profiler output. Files for all jobs running the same plugin are kept in
+    the same directory. The directory is created if it doesn't exist.
+
+    :param name: Name of the plugin (module) the job runs
+    :param uuid: UUID of the job
+    :param extension: Extension of the file, without the leading dot
+    :return: The full path of the file
+    """
+    file_name = "{0}_{1}.{2}".format(name, uuid, extension)
 
-    # Create the directory if it doesn't exist
     try:
-        os.makedirs(log_file_path)
+        directory = os.path.join(get_job_log_root(), name)
+    except NotImplementedError:
+        return file_name
+    try:
+        os.makedirs(directory)
     except OSError as e:
-        if not (e.errno == errno.EEXIST and os.path.isdir(log_file_path)):
+        if not (e.errno == errno.EEXIST and os.path.isdir(directory)):
             raise
+    return os.path.join(directory, file_name)
 
-    logging.config.fileConfig(
-        os.path.join(
-            os.path.split(__file__)[0], "default{0}.cfg".format(opsys)),
-        disable_existing_loggers=False
-    )
-    logger = logging.getLogger(name)
-    return logger
+
+def get_job_log_root():
+    """
+    :return: The directory holding the directories of job files, one per
+        plugin
+    :raises NotImplementedError: on unsupported platforms
+    """
+    return _get_log_root('jobs')
+
+
+def get_remoted_function_log_root():
+    """
+    :return: The directory holding the logs of remoted function calls
+    :raises NotImplementedError: on unsupported platforms
+    """
+    return _get_log_root('remoted_functions')
+
+
+def _get_log_root(kind):
+    opsys = platform.system().lower()
+    if opsys == 'windows':
+        return os.path.join(r"C:\logs\hoplite", kind)
+    elif opsys == 'linux' or opsys == 'darwin':
+        return os.path.join(os.path.expanduser('~'), '.hoplite', kind)
+    raise NotImplementedError()
+
+
+def _get_base_logger(name=""):
+    _configure()
+    return logging.getLogger(name)
+
+
+def _configure():
+    """
+    Load the logging configuration the first time it is needed in this
+    process and make all of its handlers asynchronous
+    """
+    global _configured
+    if _configured:
+        return
+    with _configure_lock:
+        if _configured:
+            return
+        opsys = platform.system().lower()
+        if opsys == 'windows':
+            log_file_path = os.path.join(r"C:\logs\hoplite\hoplite")
+        elif opsys == 'linux' or opsys == 'darwin':
+            log_file_path = os.path.join(
+                os.path.expanduser('~'), '.hoplite', 'hoplite')
+        else:
+            raise NotImplementedError()
+
+        # Create the directory if it doesn't exist
+        try:
+            os.makedirs(log_file_path)
+        except OSError as e:
+            if not (e.errno == errno.EEXIST and os.path.isdir(log_file_path)):
+                raise
+
+        logging.config.fileConfig(
+            os.path.join(
+                os.path.split(__file__)[0], "default{0}.cfg".format(opsys)),
+            disable_existing_loggers=False
+        )
+        for logger in (logging.getLogger(), logging.getLogger('hoplite')):
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                logger.addHandler(AsyncHandler(handler))
+        _configured = True
 
 
 def add_remote_function_logging_handlers(function_namespace, timestamp, filename=None):
@@ -121,34 +349,21 @@ def get_log_filename(function_namespace, timestamp):
     namespace_split = string.split(function_namespace, '.')
     function_name = namespace_split.pop()
     folder_hierarchy = os.path.join(*namespace_split)
-    opsys = platform.system().lower()
-    if opsys == 'windows':
-        log_root_path = os.path.join(r'C:\logs\hoplite\remoted_functions')
-    elif opsys == 'linux' or opsys == 'darwin':
-        log_root_path = os.path.join(
-            os.path.expanduser('~'), '.hoplite', 'remoted_functions')
-    else:
-        raise NotImplementedError()
-    log_root_path = os.path.join(log_root_path, folder_hierarchy)
+    log_root_path = os.path.join(
+        get_remoted_function_log_root(), folder_hierarchy)
     # Create the directory if it doesn't exist
     try:
         os.makedirs(log_root_path)
     except OSError as e:
         if not (e.errno == errno.EEXIST and os.path.isdir(log_root_path)):
             raise
-    # Handle the case where multiple instances of the same function are called
-    # within a single second. This would otherwise result in the same filename
-    # being used multiple times
-    extension_num = 1
-    log_file_name = os.path.join(
-        log_root_path, timestamp + ' ' + function_name + ".log")
-    while os.path.isfile(log_file_name):
-        log_file_name = os.path.join(
-            log_root_path,
-            timestamp + ' ' + function_name + '_' + str(extension_num) + ".log")
-        extension_num += 1
-
-    return log_file_name
+    # Multiple instances of the same function can be called within a single
+    # second. A random suffix keeps their names apart without having to look
+    # for a free name in a directory that may hold a great many files.
+    return os.path.join(
+        log_root_path,
+        '{0} {1}_{2}.log'.format(
+            timestamp, function_name, uuid.uuid4().hex[:12]))
 
 
 def get_formatter_verbose():
@@ -0,0 +1,115 @@
+"""
+Partial updates of job statuses, sent with :http:patch:`/jobs/(uuid)`.
+
+A patch is a dictionary with up to three keys, which are applied in this
+order:
+
+* ``unset`` - List of the keys to remove from the status
+* ``set`` - Dictionary of the values to set, by key
+* ``append`` - Dictionary of the lists of items to append to the list at
+  each key. Missing lists are created
+
+Only the keys that change are sent and touched, so the cost of an update
+depends on the size of the change rather than the size of the status.
+"""
+from hoplite.exceptions import InvalidStatusUpdateError
+
+SET = 'set'
+UNSET = 'unset'
+APPEND = 'append'
+
+
+def make_patch(values=None, unset=None, append=None):
+    """
+    :param dict values: Values to set, by key
+    :param unset: Keys to remove
+    :param dict append: Lists of items to append, by key
+    :return: The patch, without the parts that are empty
+    :raises InvalidStatusUpdateError: if a part has the wrong type
+    """
+    patch = {}
+    if values:
+        if not isinstance(values, dict):
+            raise InvalidStatusUpdateError(
+                "'{0}' must be a dictionary".format(SET))
+        patch[SET] = values
+    if unset:
+        if isinstance(unset, (basestring, dict)) or \
+                not hasattr(unset, '__iter__'):
+            raise InvalidStatusUpdateError(
+                "'{0}' must be a list of keys".format(UNSET))
+        patch[UNSET] = list(unset)
+    if append:
+        if not isinstance(append, dict) or \
+                not all(isinstance(items, list) for items in append.values()):
+            raise InvalidStatusUpdateError(
+                "'{0}' must be a dictionary of lists".format(APPEND))
+        patch[APPEND] = append
+    return patch
+
+
+def check_patch(status, patch):
+    """
+    Check that the patch can be applied to the status
+
+    :raises InvalidStatusUpdateError: if the patch appends to a value which
+        is not a list
+    """
+    for key in patch.get(APPEND, {}):
+        if key in patch.get(SET, {}):
+            value = patch[SET][key]
+        elif key in patch.get(UNSET, ()):
+            continue
+        else:
+            value = status.get(key, [])
+        if not isinstance(value, list):
+            raise InvalidStatusUpdateError(
+                "Can't append to '{0}', it is not a list".format(key))
+
+
+def apply_patch(status, patch):
+    """
+    Apply the patch to the status in place. The patch must have been checked
+    with :func:`check_patch`.
+
+    Lists are appended to by replacing them, since they may also be held by
+    earlier patches or by readers of the status.
+    """
+    for key in patch.get(UNSET, ()):
+        status.pop(key, None)
+    status.update(patch.get(SET, {}))
+    for key, items in patch.get(APPEND, {}).items():
+        status[key] = status.get(key, []) + items
+
+
+def merge_patches(first, second):
+    """
+    Merge the second patch into the first, so that applying the result has
+    the same effect as applying both patches in turn
+
+    :param first: Patch, which is changed in place
+    :param second: Patch to apply after the first
+    :return: first
+    """
+    values = first.setdefault(SET, {})
+    unset = first.setdefault(UNSET, [])
+    append = first.setdefault(APPEND, {})
+    for key in second.get(UNSET, ()):
+        values.pop(key, None)
+        append.pop(key, None)
+        if key not in unset:
+            unset.append(key)
+    for key, value in second.get(SET, {}).items():
+        if key in unset:
+            unset.remove(key)
+        append.pop(key, None)
+        values[key] = value
+    for key, items in second.get(APPEND, {}).items():
+        if key in values:
+            values[key] = list(values[key]) + items
+        else:
+            append.setdefault(key, []).extend(items)
+    for part in (SET, UNSET, APPEND):
+        if not first[part]:
+            del first[part]
+    return first
@@ -20,7 +20,8 @@ def hoplite_plugins():
 setup(
     name="hoplite",
     version="15.0.0.dev21",
-    packages=find_packages(exclude='tests'),
+    packages=find_packages(
+        exclude=['tests', 'tests.*', 'benchmarks', 'benchmarks.*']),
     license='MIT',
     install_requires=['flask>=0.10.1',
                       'requests>=2.2.0',
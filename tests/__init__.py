@@ -1,11 +1,11 @@
 from unittest2 import TestCase
-from .utils import FlaskTestCaseMixin, StatusCodeTestMixin
+from .utils import FlaskTestCaseMixin, StatusCodeTestMixin, WaitTestMixin
 from hoplite.builtin_plugins.install_python_package_job import install_package_with_pip, uninstall_package_with_pip
 from hoplite.api.root import reload_site_packages
 from tests.paths import TEST_PACKAGE_PATH
 
 
-class HopliteTestCase(TestCase):
+class HopliteTestCase(TestCase, WaitTestMixin):
     def setUp(self):
         """
         This imports the test_jobs_package, which is required by many tests
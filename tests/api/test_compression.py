@@ -0,0 +1,96 @@
+from flask import json
+
+from hoplite.api.helpers import job_manager
+from hoplite.serializer import hoplite_dumps
+from hoplite.utils.compression import gzip_compress, gzip_decompress
+from tests.api import HopliteApiTestCase
+
+
+class CompressionApiTestCase(HopliteApiTestCase):
+    def setUp(self):
+        super(CompressionApiTestCase, self).setUp()
+        self.manager = job_manager
+        self.name = self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME
+
+    def _create_large_job(self):
+        return self.manager.create_job(
+            self.name, {'paths': ['path {0}'.format(i) for i in range(500)]})
+
+    def test_large_response_is_compressed(self):
+        job = self._create_large_job()
+        r = self.client.get(
+            '/jobs/{0}'.format(job.uuid),
+            headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertOkJson(r)
+        self.assertEquals(r.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', r.headers['Vary'])
+        self.assertEquals(int(r.headers['Content-Length']), len(r.get_data()))
+        r_job = json.loads(gzip_decompress(r.get_data()))
+        self.assertEquals(r_job['config'], job.config)
+
+    def test_response_is_not_compressed_unless_accepted(self):
+        job = self._create_large_job()
+        r = self.client.get(
+            '/jobs/{0}'.format(job.uuid), headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertOkJson(r)
+        self.assertNotIn('Content-Encoding', r.headers)
+        self.assertEquals(json.loads(r.get_data())['config'], job.config)
+
+    def test_small_response_is_not_compressed(self):
+        r = self.client.get('/job_plugins', headers={'Accept-Encoding': 'gzip'})
+        self.assertOk(r)
+        self.assertNotIn('Content-Encoding', r.headers)
+
+    def test_accepted_encodings_are_advertised(self):
+        r = self.client.get('/job_plugins')
+        self.assertEquals(r.headers['Accept-Encoding'], 'gzip')
+
+    def test_post_compressed_job(self):
+        data = {"name": self.name, "config": {"something": "yay" * 1000}}
+        r = self.client.post(
+            '/jobs', data=gzip_compress(hoplite_dumps(data)),
+            content_type='application/json',
+            headers={'Content-Encoding': 'gzip'})
+        self.assertOk(r)
+        self.assertEquals(json.loads(r.get_data())["config"], data["config"])
+
+    def test_put_compressed_status(self):
+        job = self.manager.create_job(self.name, {})
+        status_update = {"status": {"log": "line\n" * 1000}, "api_key": job._api_key}
+        r = self.client.put(
+            "/jobs/{0}".format(job.uuid),
+            data=gzip_compress(hoplite_dumps(status_update)),
+            content_type='application/json',
+            headers={'Content-Encoding': 'gzip'})
+        self.assertOk(r)
+        self.assertEquals(job.status(), status_update["status"])
+
+    def test_invalid_compressed_body_is_rejected(self):
+        r = self.client.post(
+            '/jobs', data='not gzip', content_type='application/json',
+            headers={'Content-Encoding': 'gzip'})
+        self.assertEquals(r.status_code, 400)
+
+    def test_unsupported_content_encoding_is_rejected(self):
+        r = self.client.post(
+            '/jobs', data='{}', content_type='application/json',
+            headers={'Content-Encoding': 'br'})
+        self.assertEquals(r.status_code, 415)
+
+    def test_streamed_job_listing_is_compressed(self):
+        jobs = [self._create_large_job() for _ in range(3)]
+        r = self.client.get('/jobs', headers={'Accept-Encoding': 'gzip'})
+        self.assertOk(r)
+        self.assertEquals(r.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', r.headers['Vary'])
+        self.assertNotIn('Content-Length', r.headers)
+        r_jobs = json.loads(gzip_decompress(r.get_data()))["jobs"]
+        self.assertEquals(
+            sorted(job['uuid'] for job in r_jobs), sorted(job.uuid for job in jobs))
+
+    def test_streamed_job_listing_is_not_compressed_unless_accepted(self):
+        job = self._create_large_job()
+        r = self.client.get('/jobs', headers={'Accept-Encoding': 'identity'})
+        self.assertOk(r)
+        self.assertNotIn('Content-Encoding', r.headers)
+        self.assertEquals(json.loads(r.get_data())["jobs"][0]['uuid'], job.uuid)
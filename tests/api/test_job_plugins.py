@@ -18,10 +18,16 @@ class JobPluginsApiTestCase(HopliteApiTestCase):
         # Test that all test builtin_plugins are returned
         body = json.loads(r.get_data())
         job_plugins = body["job_plugins"]
-        self.assertEquals(len(job_plugins), 4)
+        self.assertEquals(len(job_plugins), 10)
         expected = [self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME,
                     self.test_jobs_module.constants.CREATE_FILE_JOB_NAME,
                     self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME,
-                    self.test_jobs_module.constants.JOB_FAILED_EXCEPTION_JOB_NAME]
+                    self.test_jobs_module.constants.JOB_FAILED_EXCEPTION_JOB_NAME,
+                    self.test_jobs_module.constants.SPAWN_PROCESS_JOB_NAME,
+                    self.test_jobs_module.constants.WAIT_FOR_CANCEL_JOB_NAME,
+                    self.test_jobs_module.constants.THREAD_EXECUTOR_JOB_NAME,
+                    self.test_jobs_module.constants.BUSY_WAIT_JOB_NAME,
+                    self.test_jobs_module.constants.PLUGIN_RESOURCES_JOB_NAME,
+                    self.test_jobs_module.constants.COUNT_RUNS_JOB_NAME]
 
         self.assertEquals(sorted(job_plugins), sorted(expected))
\ No newline at end of file
@@ -1,7 +1,15 @@
+import gzip
+import os
+import pstats
+import shutil
+import tempfile
+
+from hoplite.serializer import hoplite_bson_dumps, hoplite_bson_loads
 from hoplite.utils import server_logging
 from tests.api import HopliteApiTestCase
 from flask import json
 from hoplite.api.helpers import job_manager
+import threading
 import time
 
 logger = server_logging.get_server_logger(__name__)
@@ -28,6 +36,93 @@ class JobsApiTestCase(HopliteApiTestCase):
                     self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME]
         self.assertEquals(sorted(names), sorted(expected))
 
+    def test_get_jobs_is_streamed_in_creation_order(self):
+        jobs = [self._create_job() for _ in range(5)]
+        r = self.client.get('/jobs')
+        self.assertOkJson(r)
+        self.assertTrue(r.is_streamed)
+        r_jobs = json.loads(r.get_data())
+        self.assertEquals([job["uuid"] for job in r_jobs["jobs"]], [job.uuid for job in jobs])
+        self.assertIsNone(r_jobs["next_cursor"])
+
+    def test_get_jobs_pages(self):
+        jobs = [self._create_job() for _ in range(5)]
+        uuids = []
+        cursor = None
+        pages = 0
+        while True:
+            query = '?limit=2' if cursor is None else '?limit=2&cursor={0}'.format(cursor)
+            page = json.loads(self.client.get('/jobs' + query).get_data())
+            uuids.extend(job["uuid"] for job in page["jobs"])
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEquals(pages, 3)
+        self.assertEquals(uuids, [job.uuid for job in jobs])
+
+    def test_get_jobs_filters(self):
+        constants = self.test_jobs_module.constants
+        queued = self._create_job()
+        failed = self._create_job(constants.THROW_AN_EXCEPTION_JOB_NAME, running=True)
+        while failed.running():
+            time.sleep(.01)
+        r = self.client.get('/jobs?state=failed')
+        self.assertEquals([job["uuid"] for job in json.loads(r.get_data())["jobs"]], [failed.uuid])
+        r = self.client.get('/jobs?state=queued,failed&name={0}'.format(constants.WAIT_10_SECONDS_JOB_NAME))
+        self.assertEquals([job["uuid"] for job in json.loads(r.get_data())["jobs"]], [queued.uuid])
+        r = self.client.get('/jobs?created_since={0!r}'.format(failed.created_at))
+        self.assertEquals([job["uuid"] for job in json.loads(r.get_data())["jobs"]], [failed.uuid])
+
+    def test_get_jobs_fields(self):
+        job = self._create_job()
+        r = self.client.get('/jobs?fields=uuid,state')
+        self.assertEquals(json.loads(r.get_data())["jobs"], [{"uuid": job.uuid, "state": "queued"}])
+
+    def test_get_jobs_invalid_query_returns_400(self):
+        self.assertEquals(self.client.get('/jobs?state=sleeping').status_code, 400)
+        self.assertEquals(self.client.get('/jobs?limit=0').status_code, 400)
+        self.assertEquals(self.client.get('/jobs?cursor=abc').status_code, 400)
+        self.assertEquals(self.client.get('/jobs?created_since=yesterday').status_code, 400)
+
+    def test_post_job_statuses_returns_changed_jobs(self):
+        first = self._create_job()
+        second = self._create_job()
+        r = self.jpost('/jobs/status', data={"jobs": [first.uuid, second.uuid, "nosuchuuid"]})
+        self.assertOkJson(r)
+        result = json.loads(r.get_data())
+        self.assertEquals(sorted(job["uuid"] for job in result["jobs"]), sorted([first.uuid, second.uuid]))
+        self.assertEquals(result["missing"], ["nosuchuuid"])
+        versions = dict((job["uuid"], job["version"]) for job in result["jobs"])
+        self.assertEquals(json.loads(self.jpost('/jobs/status', data={"jobs": versions}).get_data())["jobs"], [])
+        second.update_status(second._api_key, {"progress": 50})
+        r = self.jpost('/jobs/status', data={"jobs": versions, "fields": ["status"]})
+        self.assertEquals(
+            json.loads(r.get_data())["jobs"],
+            [{"uuid": second.uuid, "version": versions[second.uuid] + 1, "status": {"progress": 50}}])
+
+    def test_post_job_statuses_waits_for_a_change(self):
+        job = self._create_job()
+        timer = threading.Timer(.2, job.update_status, (job._api_key, {"progress": 50}))
+        timer.start()
+        start_time = time.time()
+        r = self.jpost('/jobs/status', data={"jobs": {job.uuid: job.version}, "wait": 10})
+        self.assertTrue(r.is_streamed)
+        self.assertEquals(json.loads(r.get_data())["jobs"][0]["status"], {"progress": 50})
+        self.assertLess(time.time() - start_time, 5)
+        timer.join()
+
+    def test_post_job_statuses_times_out(self):
+        job = self._create_job()
+        start_time = time.time()
+        r = self.jpost('/jobs/status', data={"jobs": {job.uuid: job.version}, "wait": .2})
+        self.assertEquals(json.loads(r.get_data())["jobs"], [])
+        self.assertGreaterEqual(time.time() - start_time, .2)
+
+    def test_post_job_statuses_invalid_request_returns_400(self):
+        self.assertEquals(self.jpost('/jobs/status', data={"jobs": "uuid"}).status_code, 400)
+        self.assertEquals(self.jpost('/jobs/status', data={"jobs": [], "wait": "long"}).status_code, 400)
+
     def test_post_jobs_blank_config(self):
         data = {"name": self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME}
         r = self.jpost('/jobs', data=data)
@@ -68,6 +163,138 @@ class JobsApiTestCase(HopliteApiTestCase):
         r = self.jput("/jobs/{0}".format(job.uuid), data=status_update)
         self.assertEquals(job.status(), { "my_status": "is good" })
 
+    def test_patch_job_status(self):
+        job = self._create_job()
+        job.update_status(job._api_key, {"a": 1, "b": 2, "log": ["one"]})
+        patch = {"set": {"c": 3}, "unset": ["b"], "append": {"log": ["two"]}, "api_key": job._api_key}
+        r = self.jpatch("/jobs/{0}".format(job.uuid), data=patch)
+        self.assertOk(r)
+        self.assertEquals(json.loads(r.get_data()), {"uuid": job.uuid, "version": job.version})
+        self.assertEquals(job.status(), {"a": 1, "c": 3, "log": ["one", "two"]})
+
+    def test_patch_job_status_bson(self):
+        job = self._create_job()
+        patch = {"set": {"my_status": "is good"}, "api_key": job._api_key}
+        r = self.client.patch(
+            "/jobs/{0}".format(job.uuid), data=hoplite_bson_dumps(patch), content_type='application/bson')
+        self.assertOk(r)
+        self.assertEquals(job.status(), {"my_status": "is good"})
+
+    def test_patch_job_status_errors(self):
+        job = self._create_job()
+        job.update_status(job._api_key, {"a": 1})
+        r = self.jpatch("/jobs/{0}".format(job.uuid), data={"append": {"a": [2]}, "api_key": job._api_key})
+        self.assertBadRequest(r)
+        r = self.jpatch("/jobs/{0}".format(job.uuid), data={"unset": "a", "api_key": job._api_key})
+        self.assertBadRequest(r)
+        r = self.jpatch("/jobs/{0}".format(job.uuid), data={"set": {"a": 2}, "api_key": "wrong"})
+        self.assertForbidden(r)
+        r = self.jpatch("/jobs/does-not-exist", data={"set": {"a": 2}, "api_key": job._api_key})
+        self.assertNotFound(r)
+        self.assertEquals(job.status(), {"a": 1})
+
+    def test_get_job_history(self):
+        job = self._create_job()
+        job.update_status(job._api_key, {"progress": 1})
+        job.update_status(job._api_key, {"progress": 2})
+        r = self.client.get("/jobs/{0}/history".format(job.uuid))
+        self.assertOk(r)
+        history = json.loads(r.get_data())
+        self.assertEquals(history["version"], job.version)
+        self.assertFalse(history["truncated"])
+        self.assertEquals([entry["set"] for entry in history["history"]], [{"progress": 1}, {"progress": 2}])
+        r = self.client.get("/jobs/{0}/history?after_version={1}".format(
+            job.uuid, history["history"][0]["version"]))
+        self.assertEquals([entry["set"] for entry in json.loads(r.get_data())["history"]], [{"progress": 2}])
+        since = history["history"][1]["time"]
+        r = self.client.get("/jobs/{0}/history?since={1!r}".format(job.uuid, since))
+        self.assertEquals([entry["set"] for entry in json.loads(r.get_data())["history"]], [{"progress": 2}])
+
+    def test_get_job_history_errors(self):
+        job = self._create_job()
+        self.assertBadRequest(self.client.get("/jobs/{0}/history?since=yesterday".format(job.uuid)))
+        self.assertNotFound(self.client.get("/jobs/does-not-exist/history"))
+
+    def test_post_jobs_with_max_runtime(self):
+        data = {"name": self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME, "config": {}, "max_runtime": 60}
+        r = self.jpost('/jobs', data=data)
+        self.assertOk(r)
+        r_job = json.loads(r.get_data())
+        self.assertEquals(r_job["max_runtime"], 60)
+        self.assertFalse(r_job["timed_out"])
+        data["max_runtime"] = "a minute"
+        self.assertBadRequest(self.jpost('/jobs', data=data))
+
+    def test_post_jobs_with_executor(self):
+        data = {"name": self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME, "config": {}, "executor": "thread"}
+        r = self.jpost('/jobs', data=data)
+        self.assertOk(r)
+        self.assertEquals(json.loads(r.get_data())["executor"], "thread")
+        data["executor"] = "fiber"
+        self.assertBadRequest(self.jpost('/jobs', data=data))
+
+    def test_post_jobs_with_cache(self):
+        data = {"name": self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME, "config": {}, "cache": 30}
+        r = self.jpost('/jobs', data=data)
+        self.assertOk(r)
+        self.assertEquals(json.loads(r.get_data())["cached"], False)
+        data["cache"] = "always"
+        self.assertBadRequest(self.jpost('/jobs', data=data))
+
+    def test_post_jobs_with_idempotency_key_returns_the_same_job(self):
+        data = {"name": self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME, "config": {}}
+        first = self.jpost('/jobs', data=data, headers={'Idempotency-Key': 'key'})
+        second = self.jpost('/jobs', data=data, headers={'Idempotency-Key': 'key'})
+        self.assertOk(first)
+        self.assertOk(second)
+        self.assertEquals(json.loads(first.get_data())["uuid"], json.loads(second.get_data())["uuid"])
+        self.assertEquals(len(self.manager.all_jobs()), 1)
+        data["config"] = {"other": True}
+        r = self.jpost('/jobs', data=data, headers={'Idempotency-Key': 'key'})
+        self.assertStatusCode(r, 422)
+        self.assertBadRequest(self.jpost('/jobs', data=data, headers={'Idempotency-Key': 'k' * 256}))
+
+    def test_post_jobs_bson(self):
+        data = {"name": self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME, "config": {"something": "yay"}}
+        r = self.client.post(
+            '/jobs', data=hoplite_bson_dumps(data), content_type='application/bson',
+            headers={'Accept': 'application/bson, application/json;q=0.9'})
+        self.assertOk(r)
+        self.assertContentType(r, 'application/bson')
+        r_job = hoplite_bson_loads(r.get_data())
+        self.assertEquals(data["name"], r_job["name"])
+        self.assertEquals(data["config"], r_job["config"])
+        self.assertEquals(r.headers['Vary'], 'Accept, Accept-Encoding')
+
+    def test_put_job_updates_status_bson(self):
+        job = self._create_job()
+        status_update = {"status": {"my_status": "is good"}, "api_key": job._api_key}
+        self.client.put(
+            "/jobs/{0}".format(job.uuid), data=hoplite_bson_dumps(status_update), content_type='application/bson')
+        self.assertEquals(job.status(), {"my_status": "is good"})
+
+    def test_large_integer_in_bson_status_is_plain_json(self):
+        job = self._create_job()
+        status_update = {"status": {"bytes": 2 ** 40}, "api_key": job._api_key}
+        self.client.put(
+            "/jobs/{0}".format(job.uuid), data=hoplite_bson_dumps(status_update), content_type='application/bson')
+        self.assertIs(type(job.status()["bytes"]), long)
+        r = self.client.get('/jobs/{0}'.format(job.uuid))
+        self.assertOkJson(r)
+        self.assertNotIn("$numberLong", r.get_data())
+        self.assertEquals(json.loads(r.get_data())["status"], {"bytes": 2 ** 40})
+
+    def test_get_job_falls_back_to_json_if_not_bson(self):
+        job = self._create_job(config={"too big for bson": 2 ** 70})
+        r = self.client.get('/jobs/{0}'.format(job.uuid), headers={'Accept': 'application/bson'})
+        self.assertOkJson(r)
+        self.assertEquals(json.loads(r.get_data())["config"], {"too big for bson": 2 ** 70})
+
+    def test_get_job_is_json_by_default(self):
+        job = self._create_job()
+        self.assertOkJson(self.client.get('/jobs/{0}'.format(job.uuid), headers={'Accept': '*/*'}))
+        self.assertOkJson(self.client.get('/jobs/{0}'.format(job.uuid)))
+
     def test_get_jobs_running(self):
         e_job_uuid = []
         jobs = []
@@ -116,6 +343,16 @@ class JobsApiTestCase(HopliteApiTestCase):
         self.assertEquals(r_body["error"], "Job UUID: {0} you cannot start a job more than once".format(job.uuid))
         self._terminate_all_jobs()
 
+    def test_put_start_job_with_idempotency_key_can_be_repeated(self):
+        job = self._create_job()
+        for _ in range(2):
+            r = self.client.put('/jobs/{0}/start'.format(job.uuid), headers={'Idempotency-Key': 'key'})
+            self.assertOk(r)
+            self.assertTrue(json.loads(r.get_data())["started"])
+        self.assertTrue(job.running())
+        self.assertForbidden(self.client.put('/jobs/{0}/start'.format(job.uuid)))
+        self._terminate_all_jobs()
+
     def test_put_start_job_error_if_job_does_not_exist(self):
         r = self.client.put('/jobs/{0}/start'.format(3288283))
         self.assertNotFound(r)
@@ -191,6 +428,49 @@ class JobsApiTestCase(HopliteApiTestCase):
         self.assertNotFound(r)
         self.assertEquals(json.loads(r.get_data())["error"], "Job with UUID: 8b7fea59-2c0d-4afa-8109-2bc0a26ec865 does not exist")
 
+    def test_post_job_bad_profiler_returns_400(self):
+        data = {"name": self.test_jobs_module.constants.CREATE_FILE_JOB_NAME, "profiler": "not_a_profiler"}
+        r = self.jpost('/jobs', data=data)
+        self.assertBadRequest(r)
+        self.assertIn("Profiler 'not_a_profiler' is not available", json.loads(r.get_data())["error"])
+
+    def test_get_job_profile(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = {"file_to_create": os.path.join(temp_dir, "temp.txt")}
+            data = {"name": self.test_jobs_module.constants.CREATE_FILE_JOB_NAME, "config": config,
+                    "running": True, "profiler": "cprofile"}
+            r_job = json.loads(self.jpost('/jobs', data=data).get_data())
+            self.assertEquals(r_job["profiler"], "cprofile")
+            job = self.manager.get_job(r_job["uuid"])
+            while job.running():
+                time.sleep(.01)
+            r = self.client.get('/jobs/{0}/profile'.format(job.uuid))
+            self.assertOk(r)
+            profile_path = os.path.join(temp_dir, "job.pstats")
+            with open(profile_path, 'wb') as profile_file:
+                profile_file.write(r.get_data())
+            # Raises if the profile is not a valid pstats file
+            pstats.Stats(profile_path)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_job_profile_from_header(self):
+        data = {"name": self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME, "running": True}
+        r = self.jpost('/jobs', data=data, headers={'X-Hoplite-Profiler': 'sample'})
+        job = self.manager.get_job(json.loads(r.get_data())["uuid"])
+        while job.running():
+            time.sleep(.01)
+        r = self.client.get('/jobs/{0}/profile'.format(job.uuid))
+        self.assertOk(r)
+        self.assertContentType(r, 'text/plain; charset=utf-8')
+
+    def test_get_job_profile_without_profiler_returns_404(self):
+        job = self._create_job()
+        r = self.client.get('/jobs/{0}/profile'.format(job.uuid))
+        self.assertNotFound(r)
+        self.assertEquals(json.loads(r.get_data())["error"], "Job UUID: {0} was not run with a profiler".format(job.uuid))
+
     def _create_job(self, name=None, config={}, running=False):
         if name is None:
             name = self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME
@@ -200,3 +480,77 @@ class JobsApiTestCase(HopliteApiTestCase):
         jobs = self.manager.all_jobs()
         for job in jobs:
             job.kill()
+
+    def _run_job_with_log(self):
+        data = {"name": self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME, "running": True}
+        job = self.manager.get_job(json.loads(self.jpost('/jobs', data=data).get_data())["uuid"])
+        while job.running():
+            time.sleep(.01)
+        server_logging.flush()
+        with open(job.log_path, 'rb') as log_file:
+            return job, log_file.read()
+
+    def test_get_job_log(self):
+        job, log = self._run_job_with_log()
+        self.assertIn("Finished with except type", log)
+        r = self.client.get('/jobs/{0}/log'.format(job.uuid))
+        self.assertOk(r)
+        self.assertEquals(r.get_data(), log)
+        self.assertEquals(r.headers['Accept-Ranges'], 'bytes')
+        self.assertEquals(r.headers['X-Hoplite-Log-Size'], str(len(log)))
+
+    def test_get_job_log_offset_and_length(self):
+        job, log = self._run_job_with_log()
+        r = self.client.get('/jobs/{0}/log?offset=5&length=10'.format(job.uuid))
+        self.assertOk(r)
+        self.assertEquals(r.get_data(), log[5:15])
+        self.assertEquals(r.headers['X-Hoplite-Log-Offset'], '5')
+
+    def test_get_job_log_negative_offset(self):
+        job, log = self._run_job_with_log()
+        r = self.client.get('/jobs/{0}/log?offset=-10'.format(job.uuid))
+        self.assertOk(r)
+        self.assertEquals(r.get_data(), log[-10:])
+
+    def test_get_job_log_range(self):
+        job, log = self._run_job_with_log()
+        r = self.client.get('/jobs/{0}/log'.format(job.uuid), headers={'Range': 'bytes=10-19'})
+        self.assertStatusCode(r, 206)
+        self.assertEquals(r.get_data(), log[10:20])
+        self.assertEquals(r.headers['Content-Range'], 'bytes 10-19/{0}'.format(len(log)))
+
+    def test_get_job_log_unsatisfiable_range(self):
+        job, log = self._run_job_with_log()
+        r = self.client.get('/jobs/{0}/log'.format(job.uuid), headers={'Range': 'bytes={0}-'.format(len(log) + 10)})
+        self.assertStatusCode(r, 416)
+        self.assertEquals(r.headers['Content-Range'], 'bytes */{0}'.format(len(log)))
+
+    def test_follow_job_log_of_finished_job(self):
+        job, log = self._run_job_with_log()
+        r = self.client.get('/jobs/{0}/log?follow=true'.format(job.uuid))
+        self.assertOk(r)
+        self.assertEquals(r.get_data(), log)
+
+    def test_follow_job_log_of_job_not_started_returns_409(self):
+        job = self._create_job()
+        r = self.client.get('/jobs/{0}/log?follow=true'.format(job.uuid))
+        self.assertStatusCode(r, 409)
+
+    def test_get_compressed_job_log(self):
+        job, log = self._run_job_with_log()
+        with open(job.log_path, 'rb') as log_file:
+            with gzip.open(job.log_path + '.gz', 'wb') as compressed:
+                shutil.copyfileobj(log_file, compressed)
+        os.remove(job.log_path)
+        r = self.client.get('/jobs/{0}/log?offset=-10'.format(job.uuid))
+        self.assertOk(r)
+        self.assertEquals(r.get_data(), log[-10:])
+        self.assertEquals(r.headers['X-Hoplite-Log-Size'], str(len(log)))
+        r = self.client.get('/jobs/{0}/log?follow=true'.format(job.uuid))
+        self.assertEquals(r.get_data(), log)
+        os.remove(job.log_path + '.gz')
+
+    def test_get_job_log_before_job_writes_returns_404(self):
+        job = self._create_job()
+        r = self.client.get('/jobs/{0}/log'.format(job.uuid))
+        self.assertNotFound(r)
@@ -0,0 +1,45 @@
+from hoplite.api.helpers import job_manager
+from hoplite.server import metrics
+from tests.api import HopliteApiTestCase
+
+
+class MetricsApiTestCase(HopliteApiTestCase):
+    def setUp(self):
+        super(MetricsApiTestCase, self).setUp()
+        self.manager = job_manager
+        metrics.registry.clear()
+
+    def test_get_metrics_is_prometheus_text(self):
+        r = self.client.get('/metrics')
+        self.assertOk(r)
+        self.assertContentType(r, 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('# TYPE hoplite_jobs_created_total counter', r.get_data())
+
+    def test_job_lifecycle_is_counted(self):
+        name = self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME
+        self.manager.create_job(name, {})
+        job = self.manager.create_job(name, {}, True, port=5001)
+        self.wait_for(lambda: not job.running(), "the job to finish", timeout_s=5)
+        lines = self.client.get('/metrics').get_data().splitlines()
+        self.assertIn(
+            'hoplite_jobs_created_total{{plugin="{0}"}} 2.0'.format(name),
+            lines)
+        self.assertIn(
+            'hoplite_jobs_started_total{{plugin="{0}"}} 1.0'.format(name),
+            lines)
+        self.assertIn(
+            'hoplite_jobs_finished_total{{plugin="{0}"}} 1.0'.format(name),
+            lines)
+        self.assertIn(
+            'hoplite_jobs_failed_total{{plugin="{0}"}} 1.0'.format(name),
+            lines)
+        self.assertIn('hoplite_jobs_queued 1.0', lines)
+        self.assertIn('hoplite_jobs_running 0.0', lines)
+        self.assertIn('hoplite_jobs_stored 2.0', lines)
+
+    def test_request_latency_is_recorded_per_route(self):
+        self.client.get('/job_plugins')
+        self.assertEqual(
+            metrics.HTTP_REQUEST_SECONDS.count(
+                blueprint='job_plugins', route='/job_plugins', method='GET'),
+            1)
@@ -0,0 +1,58 @@
+import imp
+import os
+
+import unittest2
+
+from benchmarks.main import (
+    BENCHMARK_PLUGIN_PATH,
+    get_bench_options_parser,
+    percentile,
+    summarize_latencies)
+from hoplite.client.status_updater import MockStatusUpdater
+
+
+class TestBenchmarkStatistics(unittest2.TestCase):
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile(values, 0), 1)
+
+    def test_percentile_of_nothing_is_none(self):
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize_latencies(self):
+        summary = summarize_latencies([.3, .1, .2, .4])
+        self.assertEqual(summary['count'], 4)
+        self.assertEqual(summary['min'], .1)
+        self.assertEqual(summary['max'], .4)
+        self.assertAlmostEqual(summary['mean'], .25)
+        self.assertEqual(summary['p50'], .2)
+        self.assertEqual(summary['p99'], .4)
+
+
+class TestBenchmarkOptions(unittest2.TestCase):
+    def test_defaults_run_every_benchmark(self):
+        args = get_bench_options_parser().parse_args([])
+        self.assertEqual(
+            args.benchmarks,
+            ['get_jobs', 'job_throughput', 'remotify_latency', 'serializer',
+             'status_updates'])
+
+    def test_select_benchmarks(self):
+        args = get_bench_options_parser().parse_args(
+            ['--benchmarks', 'get_jobs', '--job-counts', '5', '50'])
+        self.assertEqual(args.benchmarks, ['get_jobs'])
+        self.assertEqual(args.job_counts, [5, 50])
+
+
+class TestBenchmarkJob(unittest2.TestCase):
+    def test_run_reports_status_updates(self):
+        # The plugin is only installed while the benchmarks run
+        benchmark_job = imp.load_source('benchmark_job', os.path.join(
+            BENCHMARK_PLUGIN_PATH, 'hoplite_benchmark_plugin', 'benchmark_job.py'))
+        status = MockStatusUpdater()
+        benchmark_job.run({'status_updates': 3}, status)
+        self.assertEqual(status.status['status_updates'], 3)
+        self.assertIn('elapsed', status.status)
@@ -0,0 +1,33 @@
+import unittest2
+
+from benchmarks.soak import check_growth, get_soak_options_parser
+
+
+class TestCheckGrowth(unittest2.TestCase):
+    def setUp(self):
+        self.first = {'rss_bytes': 1000, 'open_fds': 10, 'stored_jobs': 5}
+
+    def test_growth_within_thresholds_passes(self):
+        last = {'rss_bytes': 1500, 'open_fds': 12, 'stored_jobs': 5000}
+        failures = check_growth(self.first, last, {
+            'rss_bytes': 1000, 'open_fds': 2, 'stored_jobs': None})
+        self.assertEqual(failures, [])
+
+    def test_growth_past_threshold_fails(self):
+        last = {'rss_bytes': 1500, 'open_fds': 50, 'stored_jobs': 5}
+        failures = check_growth(self.first, last, {
+            'rss_bytes': 1000, 'open_fds': 2, 'stored_jobs': None})
+        self.assertEqual(len(failures), 1)
+        self.assertIn('open_fds', failures[0])
+
+    def test_missing_samples_are_not_checked(self):
+        first = {'open_fds': None}
+        last = {'open_fds': 100}
+        self.assertEqual(check_growth(first, last, {'open_fds': 0}), [])
+
+
+class TestSoakOptions(unittest2.TestCase):
+    def test_stored_jobs_not_checked_by_default(self):
+        args = get_soak_options_parser().parse_args([])
+        self.assertIsNone(args.max_stored_jobs_growth)
+        self.assertEqual(args.jobs, 100000)
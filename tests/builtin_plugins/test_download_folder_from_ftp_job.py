@@ -5,7 +5,7 @@ import tempfile
 from pyftpdlib.authorizers import DummyAuthorizer
 from pyftpdlib.handlers import FTPHandler
 from pyftpdlib.servers import FTPServer
-from hoplite.builtin_plugins.download_folder_from_ftp_job import run
+from hoplite.builtin_plugins.download_folder_from_ftp_job import run, setup, teardown
 from hoplite.builtin_plugins.constants import DownloadFolderFromFtpJobConstants as FtpKeys
 from hoplite.client.status_updater import MockStatusUpdater
 import threading
@@ -174,6 +174,19 @@ class TestDownloadFolderFromFTPJob(unittest2.TestCase):
         second_mod_date = os.stat(os.path.join(self.temp_dir, "test_file_1.txt"))[-2]
         self.assertGreaterEqual(second_mod_date, first_mod_date)
 
+    def test_sessions_are_reused(self):
+        sessions = setup()
+        run(self.config, MockStatusUpdater(), sessions)
+        self.assertEqual(len(sessions), 1)
+        session = sessions.values()[0]
+        shutil.rmtree(self.temp_dir)
+        os.mkdir(self.temp_dir)
+        run(self.config, MockStatusUpdater(), sessions)
+        self._validate_directory(self.temp_dir)
+        self.assertIs(sessions.values()[0], session)
+        teardown(sessions)
+        self.assertEqual(sessions, {})
+
     def _validate_directory(self, directory):
         file_1_path = os.path.join(directory, "test_file_1.txt")
         file_2_path = os.path.join(directory, "test_directory_1", "test_file_2.txt")
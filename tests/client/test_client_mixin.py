@@ -1,9 +1,12 @@
-from hoplite.client.helpers import ClientMixin
+from hoplite.client import helpers
+from hoplite.client.helpers import ClientMixin, loads_response
 import unittest2
-from hoplite.serializer import hoplite_dumps
+from hoplite.serializer import hoplite_bson_dumps, hoplite_bson_loads, hoplite_dumps
+from hoplite.utils.compression import gzip_decompress
 from httmock import HTTMock, urlmatch, response, all_requests
 from tests.utils import StatusCodeTestMixin
 from hoplite.exceptions import InternalServerError
+import requests.exceptions
 
 DATA = {"status": "ok"}
 
@@ -42,6 +45,39 @@ def delete(url, request):
             and request.body == hoplite_dumps(DATA):
         return response(200)
 
+@urlmatch(netloc='localhost:5002', path='\/test$')
+def bson_server(url, request):
+    headers = {'content-type': 'application/bson'}
+    if request.method == 'GET':
+        return response(200, hoplite_bson_dumps(DATA), headers)
+    if request.headers['content-type'] == 'application/bson':
+        return response(200, hoplite_bson_dumps(hoplite_bson_loads(request.body)), headers)
+    return response(200, request.body, {'content-type': 'application/json'})
+
+@urlmatch(netloc='localhost:5003', path='\/test$')
+def gzip_server(url, request):
+    body = request.body
+    if request.headers.get('content-encoding', None) == 'gzip':
+        body = gzip_decompress(body)
+    headers = {'content-type': 'application/json', 'accept-encoding': 'gzip',
+               'x-request-encoding': request.headers.get('content-encoding', '')}
+    return response(200, body, headers)
+
+def flaky_server(failures):
+    """
+    :return: A handler that fails to connect the given number of times, and
+        the methods of the requests it was sent
+    """
+    methods = []
+
+    @urlmatch(netloc='localhost:5004', path='\/test$')
+    def handler(url, request):
+        methods.append(request.method)
+        if len(methods) <= failures:
+            raise requests.exceptions.ConnectionError("Connection refused")
+        return response(200, hoplite_dumps(DATA), {'content-type': 'application/json'})
+    return handler, methods
+
 def return_500(url, request):
     response(500)
 
@@ -54,6 +90,9 @@ class HopliteClientTestCase(StatusCodeTestMixin, HopliteTestCase):
 class TestClientMixin(HopliteClientTestCase):
     def setUp(self):
         self.mixin = ClientMixin()
+        self.mixin.retry_backoff_s = 0
+        helpers._bson_servers.clear()
+        helpers._gzip_servers.clear()
 
     def test_jget(self):
         with HTTMock(get):
@@ -80,6 +119,98 @@ class TestClientMixin(HopliteClientTestCase):
             r = self.mixin.jdelete("http://localhost:5001/test", data=DATA)
             self.assertOk(r)
 
+    def test_bson_is_accepted(self):
+        @urlmatch(netloc='localhost:5001', path='\/test$')
+        def check_accept(url, request):
+            if request.headers['accept'] == 'application/bson, application/json;q=0.9':
+                return response(200)
+        with HTTMock(check_accept):
+            self.assertOk(self.mixin.jget("http://localhost:5001/test"))
+
+    def test_bson_is_sent_once_server_answers_with_bson(self):
+        with HTTMock(bson_server):
+            first = self.mixin.jpost("http://localhost:5002/test", data=DATA)
+            self.assertEquals(first.headers['content-type'], 'application/json')
+            self.assertEquals(loads_response(first), DATA)
+            self.mixin.jget("http://localhost:5002/test")
+            second = self.mixin.jpost("http://localhost:5002/test", data=DATA)
+            self.assertEquals(second.headers['content-type'], 'application/bson')
+            self.assertEquals(loads_response(second), DATA)
+
+    def test_json_is_sent_if_data_is_not_bson(self):
+        helpers._bson_servers.add(('http', 'localhost:5002'))
+        with HTTMock(bson_server):
+            r = self.mixin.jpost("http://localhost:5002/test", data={"big": 2 ** 70})
+            self.assertEquals(r.headers['content-type'], 'application/json')
+            self.assertEquals(loads_response(r), {"big": 2 ** 70})
+
+    def test_large_body_is_compressed_once_server_accepts_gzip(self):
+        data = {"paths": ["path {0}".format(i) for i in range(500)]}
+        with HTTMock(gzip_server):
+            first = self.mixin.jpost("http://localhost:5003/test", data=data)
+            self.assertEquals(first.headers['x-request-encoding'], '')
+            second = self.mixin.jpost("http://localhost:5003/test", data=data)
+            self.assertEquals(second.headers['x-request-encoding'], 'gzip')
+            self.assertEquals(loads_response(second), data)
+
+    def test_small_body_is_not_compressed(self):
+        helpers._gzip_servers.add(('http', 'localhost:5003'))
+        with HTTMock(gzip_server):
+            r = self.mixin.jput("http://localhost:5003/test", data=DATA)
+            self.assertEquals(r.headers['x-request-encoding'], '')
+            self.assertEquals(loads_response(r), DATA)
+
+    def test_idempotent_requests_are_retried(self):
+        for request in (self.mixin.jget, self.mixin.jput, self.mixin.jdelete):
+            handler, methods = flaky_server(2)
+            with HTTMock(handler):
+                self.assertOk(request("http://localhost:5004/test"))
+            self.assertEquals(len(methods), 3)
+
+    def test_retries_give_up(self):
+        handler, methods = flaky_server(10)
+        with HTTMock(handler):
+            self.assertRaises(
+                requests.exceptions.ConnectionError, self.mixin.jget, "http://localhost:5004/test")
+        self.assertEquals(len(methods), 1 + self.mixin.retries)
+
+    def test_post_is_only_retried_with_idempotency_key(self):
+        handler, methods = flaky_server(1)
+        with HTTMock(handler):
+            self.assertRaises(
+                requests.exceptions.ConnectionError, self.mixin.jpost, "http://localhost:5004/test", data=DATA)
+        self.assertEquals(methods, ['POST'])
+        handler, methods = flaky_server(1)
+        with HTTMock(handler):
+            r = self.mixin.jpost(
+                "http://localhost:5004/test", data=DATA, headers={'Idempotency-Key': 'key'})
+        self.assertOk(r)
+        self.assertEquals(methods, ['POST', 'POST'])
+
+    def test_patch_is_not_retried(self):
+        handler, methods = flaky_server(1)
+        with HTTMock(handler):
+            self.assertRaises(
+                requests.exceptions.ConnectionError, self.mixin.jpatch, "http://localhost:5004/test", data=DATA)
+        self.assertEquals(methods, ['PATCH'])
+
+    def test_retry_can_be_chosen(self):
+        handler, methods = flaky_server(1)
+        with HTTMock(handler):
+            self.assertOk(self.mixin.jpost("http://localhost:5004/test", data=DATA, retry=True))
+        handler, methods = flaky_server(1)
+        with HTTMock(handler):
+            self.assertRaises(
+                requests.exceptions.ConnectionError, self.mixin.jget, "http://localhost:5004/test", retry=False)
+
+    def test_content_type_is_sent_with_other_headers(self):
+        @urlmatch(netloc='localhost:5001', path='\/test$')
+        def check_headers(url, request):
+            if _request_has_json_content_type(request) and request.headers['x-test'] == 'yes':
+                return response(200)
+        with HTTMock(check_headers):
+            self.assertOk(self.mixin.jpost("http://localhost:5001/test", data=DATA, headers={'X-Test': 'yes'}))
+
     def raises_on_500_status_code(self):
         with HTTMock(return_500):
             self.assertRaises(InternalServerError, self.mixin.jget("localhost"))
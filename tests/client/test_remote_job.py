@@ -1,14 +1,19 @@
 import bson
 import datetime
+import json
 from httmock import urlmatch, HTTMock, response
 import pickle
 import re
+import requests.exceptions
 import sys
+import time
 from tblib import pickling_support
 import unittest2
 
 from hoplite.client.remote_job import RemoteJob
-from hoplite.exceptions import JobFailedError, JobDoesNotExistError, TimeoutError, ConnectionError
+from hoplite.exceptions import (
+    JobFailedError, JobDoesNotExistError, TimeoutError, ConnectionError, JobCancelledError)
+from hoplite.utils.job_context import JobContext, set_current_context
 from hoplite.utils import server_logging
 from hoplite.serializer import hoplite_dumps
 
@@ -49,6 +54,8 @@ job_dict_2 = {
     "finished": True
 }
 
+job_dict_timed_out = dict(job_dict_2, killed=True, timed_out=True)
+
 job_dict_name_something = {
     "uuid": "correctuuid",
     "name": "something",
@@ -97,19 +104,34 @@ exception_bubble_up_job = {
     }
 }
 
+def predates_bulk_status(handler):
+    """
+    Has a handler of /jobs/<uuid> answer POST /jobs/status like a server that
+    does not support bulk status queries, so jobs are polled one at a time
+    """
+    def handle(url, request):
+        if url.path == '/jobs/status':
+            return response(404)
+        return handler(url, request)
+    return handle
+
 @urlmatch(path='\/jobs\/\w+$')
+@predates_bulk_status
 def get_with_bubbled_up_exception(url, request):
     return response(200, hoplite_dumps(exception_bubble_up_job), {'content-type': 'application/json'})
 
 @urlmatch(path='\/jobs\/\w+$')
+@predates_bulk_status
 def get_with_exception(url, request):
     return response(200, hoplite_dumps(excepted_job), {'content-type': 'application/json'})
 
 @urlmatch(path='\/jobs\/\w+$')
+@predates_bulk_status
 def get_specific_job(url, request):
     return response(200, hoplite_dumps(job_dict), {'content-type': 'application/json'})
 
 @urlmatch(netloc="localhost:5001", path='\/jobs\/\w+$')
+@predates_bulk_status
 def get_specific_job_404(url, request):
     return response(404)
 
@@ -124,10 +146,17 @@ def post_jobs_400(url, request):
         return response(400, hoplite_dumps({"error": "Job not found"}), {'content-type': 'application/json'})
 
 @urlmatch(path='\/jobs\/\w+$')
+@predates_bulk_status
 def get_specific_job_named_something(url, request):
     return response(200, hoplite_dumps(job_dict_name_something), {'content-type': 'application/json'})
 
 @urlmatch(path='\/jobs\/\w+$')
+@predates_bulk_status
+def get_specific_job_timed_out(url, request):
+    return response(200,  hoplite_dumps(job_dict_timed_out), {'content-type': 'application/json'})
+
+@urlmatch(path='\/jobs\/\w+$')
+@predates_bulk_status
 def get_specific_job_running_false_finished_true(url, request):
     return response(200,  hoplite_dumps(job_dict_2), {'content-type': 'application/json'})
 
@@ -142,6 +171,24 @@ def kill_job(url, request):
         return response(200,  hoplite_dumps(killed_dict), {'content-type': 'application/json'})
 
 
+@urlmatch(path='\/jobs\/\w+\/log$')
+def get_job_log(url, request):
+    return response(200, 'log for ' + url.query, {'content-type': 'text/plain'})
+
+@urlmatch(path='\/jobs\/\w+\/log$')
+def get_job_log_404(url, request):
+    return response(404, hoplite_dumps({"error": "No log"}), {'content-type': 'application/json'})
+
+@urlmatch(path='\/jobs\/\w+\/history$')
+def get_job_history(url, request):
+    history = {"uuid": "correctuuid", "version": 3, "truncated": False,
+               "history": [{"version": 3, "time": 10.0, "set": {"query": url.query}}]}
+    return response(200, hoplite_dumps(history), {'content-type': 'application/json'})
+
+@urlmatch(path='\/jobs\/\w+\/history$')
+def get_job_history_404(url, request):
+    return response(404, hoplite_dumps({"error": "No job"}), {'content-type': 'application/json'})
+
 class TestRemoteJob(unittest2.TestCase):
     def setUp(self):
         with HTTMock(get_specific_job):
@@ -207,6 +254,106 @@ class TestRemoteJob(unittest2.TestCase):
         with HTTMock(get_specific_job_running_false_finished_true):
             self.assertTrue(self.job.join())
 
+    def test_join_raises_timeouterror_if_server_timed_out_job(self):
+        with HTTMock(get_specific_job_timed_out):
+            self.assertTrue(self.job.timed_out(force=True))
+            self.assertRaises(TimeoutError, self.job.join)
+
+    def test_init_sends_max_runtime_and_deadline(self):
+        bodies = []
+
+        @urlmatch(path='/jobs$')
+        def record_post_jobs(url, request):
+            bodies.append(json.loads(request.body))
+            return response(200, hoplite_dumps(job_dict_name_something), {'content-type': 'application/json'})
+        with HTTMock(record_post_jobs, get_specific_job_named_something):
+            job = RemoteJob("localhost", 5002, "something", max_runtime=30, deadline=1500000000.5)
+        self.assertEquals(bodies[0]["max_runtime"], 30)
+        self.assertEquals(bodies[0]["deadline"], 1500000000.5)
+        self.assertFalse(job.timed_out())
+
+    def test_init_sends_executor(self):
+        bodies = []
+
+        @urlmatch(path='/jobs$')
+        def record_post_jobs(url, request):
+            bodies.append(json.loads(request.body))
+            return response(200, hoplite_dumps(job_dict_name_something), {'content-type': 'application/json'})
+        with HTTMock(record_post_jobs, get_specific_job_named_something):
+            RemoteJob("localhost", 5002, "something", executor="thread")
+            RemoteJob("localhost", 5002, "something")
+        self.assertEquals(bodies[0]["executor"], "thread")
+        self.assertNotIn("executor", bodies[1])
+
+    def test_init_sends_cache(self):
+        bodies = []
+
+        @urlmatch(path='/jobs$')
+        def record_post_jobs(url, request):
+            bodies.append(json.loads(request.body))
+            return response(200, hoplite_dumps(job_dict_name_something), {'content-type': 'application/json'})
+        with HTTMock(record_post_jobs, get_specific_job_named_something):
+            RemoteJob("localhost", 5002, "something", cache=True)
+            RemoteJob("localhost", 5002, "something")
+        self.assertEquals(bodies[0]["cache"], True)
+        self.assertNotIn("cache", bodies[1])
+
+    def test_init_retries_create_with_same_idempotency_key(self):
+        keys = []
+
+        @urlmatch(path='/jobs$')
+        def flaky_post_jobs(url, request):
+            keys.append(request.headers['Idempotency-Key'])
+            if len(keys) == 1:
+                raise requests.exceptions.ConnectionError("Connection reset")
+            return response(200, hoplite_dumps(job_dict_name_something), {'content-type': 'application/json'})
+        with HTTMock(flaky_post_jobs, get_specific_job_named_something):
+            job = RemoteJob("localhost", 5002, "something")
+        self.assertEquals(job.uuid, "correctuuid")
+        self.assertEquals(len(keys), 2)
+        self.assertEquals(keys[0], keys[1])
+
+    def test_start_sends_idempotency_key(self):
+        keys = []
+
+        @urlmatch(path='\/jobs\/\w+\/start$')
+        def record_start_job(url, request):
+            keys.append(request.headers.get('Idempotency-Key', None))
+            return response(200, hoplite_dumps(started_dict), {'content-type': 'application/json'})
+        with HTTMock(get_specific_job, record_start_job):
+            self.assertTrue(self.job.start())
+        self.assertIsNotNone(keys[0])
+
+    def test_jobs_created_in_job_context_are_bounded_by_its_deadline(self):
+        bodies = []
+        kills = []
+
+        @urlmatch(path='/jobs$')
+        def record_post_jobs(url, request):
+            bodies.append(json.loads(request.body))
+            return response(200, hoplite_dumps(job_dict_name_something), {'content-type': 'application/json'})
+
+        @urlmatch(path='\/jobs\/\w+\/kill$')
+        def record_kill_job(url, request):
+            kills.append(url.path)
+            return response(200, hoplite_dumps(killed_dict), {'content-type': 'application/json'})
+        context = JobContext("parent", deadline=time.time() + 20)
+        set_current_context(context)
+        try:
+            with HTTMock(record_post_jobs, record_kill_job, get_specific_job_named_something):
+                RemoteJob("localhost", 5002, "something", max_runtime=60)
+                RemoteJob("localhost", 5002, "something", max_runtime=10)
+                context.cancel()
+                self.assertRaises(JobCancelledError, RemoteJob, "localhost", 5002, "something")
+        finally:
+            set_current_context(None)
+        self.assertLessEqual(bodies[0]["max_runtime"], 20)
+        self.assertGreater(bodies[0]["max_runtime"], 0)
+        self.assertEquals(bodies[1]["max_runtime"], 10)
+        # Both children were killed with their parent, and no job was created once it was cancelled
+        self.assertEquals(len(bodies), 2)
+        self.assertEquals(kills, ['/jobs/correctuuid/kill', '/jobs/correctuuid/kill'])
+
     def test_join_raises_timeouteror(self):
         with HTTMock(get_specific_job_named_something):
             self.assertRaises(TimeoutError, self.job.join, 0)
@@ -236,4 +383,20 @@ class TestRemoteJob(unittest2.TestCase):
                 self.assertEqual(e.type_string, exception_info["type"])
                 self.assertEqual(e.msg, exception_info["message"])
 
+    def test_get_log(self):
+        with HTTMock(get_job_log):
+            self.assertEqual(self.job.get_log(-10, 5), 'log for length=5&offset=-10')
+
+    def test_get_log_raises_if_not_found(self):
+        with HTTMock(get_job_log_404):
+            self.assertRaises(JobDoesNotExistError, self.job.get_log)
+
+    def test_get_status_history(self):
+        with HTTMock(get_job_history):
+            history = self.job.get_status_history(after_version=2)
+        self.assertEqual(history["history"], [{"version": 3, "time": 10.0, "set": {"query": "after_version=2"}}])
+        self.assertFalse(history["truncated"])
 
+    def test_get_status_history_raises_if_not_found(self):
+        with HTTMock(get_job_history_404):
+            self.assertRaises(JobDoesNotExistError, self.job.get_status_history)
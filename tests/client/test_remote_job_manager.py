@@ -6,7 +6,7 @@ import unittest2
 
 from hoplite.builtin_plugins.constants import DOWNLOAD_NETWORK_FOLDER_JOB_NAME, DOWNLOAD_FOLDER_FROM_FTP_JOB_NAME
 from hoplite.client.remote_job_manager import RemoteJobManager
-from hoplite.exceptions import InternalServerError
+from hoplite.exceptions import InternalServerError, InvalidJobOptionError
 from hoplite.public_api import wait_for_hoplite
 from hoplite.serializer import hoplite_dumps
 from hoplite.server.jobs.job_manager import JobDoesNotExistError
@@ -68,6 +68,7 @@ class TestRemoteDaemonManager(unittest2.TestCase):
 
     def test_get_job_plugins(self):
         job_plugins = self.manager.get_job_plugins()
+        # The builtin plugins and the benchmark job
         self.assertEquals(len(job_plugins), 7)
         actual = job_plugins
         self.assertIn(DOWNLOAD_FOLDER_FROM_FTP_JOB_NAME, actual)
@@ -84,6 +85,13 @@ class TestRemoteDaemonManager(unittest2.TestCase):
             jobs = self.manager.get_running_jobs()
             self.assertEqual(len(jobs), 1)
 
+    def test_get_jobs(self):
+        jobs = [self.manager.create_job(DOWNLOAD_NETWORK_FOLDER_JOB_NAME, {}) for _ in range(3)]
+        r_jobs = list(self.manager.get_jobs(state="queued", fields=["uuid"], page_size=2))
+        self.assertEquals(r_jobs, [{"uuid": job.uuid} for job in jobs])
+        self.assertEquals(list(self.manager.get_jobs(state=["running", "failed"])), [])
+        self.assertRaises(InvalidJobOptionError, list, self.manager.get_jobs(state="sleeping"))
+
     def test_reload_site_packages(self):
         done = self.manager.reload_site_packages()
         self.assertTrue(done)
@@ -0,0 +1,133 @@
+from httmock import urlmatch, HTTMock, response
+import unittest2
+
+from hoplite.client.remote_job import RemoteJob
+from hoplite.client.status_multiplexer import get_multiplexer
+from hoplite.exceptions import InternalServerError, JobDoesNotExistError
+from hoplite.serializer import hoplite_dumps, hoplite_loads
+
+
+def job_dict(uuid, version, finished=False):
+    return {
+        "uuid": uuid,
+        "name": "test_plugins.wait_10_seconds",
+        "config": {},
+        "status": {"version": version},
+        "running": not finished,
+        "finished": finished,
+        "version": version
+    }
+
+
+class FakeServer(object):
+    """
+    Serves GET /jobs/<uuid> and POST /jobs/status for a set of jobs. Bulk
+    status queries are answered with bulk_status_code if it is not 200
+    """
+    def __init__(self, netloc, jobs, bulk_status_code=200):
+        self.jobs = jobs
+        self.requests = []
+        self.bulk_status_code = bulk_status_code
+
+        @urlmatch(netloc=netloc, path='\/jobs\/\w+$')
+        def handler(url, request):
+            if request.method == 'POST' and url.path == '/jobs/status':
+                return self._bulk_status(request)
+            uuid = url.path.split('/')[-1]
+            self.requests.append(('GET', uuid))
+            if uuid not in self.jobs:
+                return response(404)
+            return response(
+                200, hoplite_dumps(self.jobs[uuid]),
+                {'content-type': 'application/json'})
+        self.handler = handler
+
+    def _bulk_status(self, request):
+        body = hoplite_loads(request.body)
+        self.requests.append(('POST', body))
+        if self.bulk_status_code != 200:
+            return response(self.bulk_status_code)
+        changed = [
+            job for uuid, job in sorted(self.jobs.items())
+            if uuid in body["jobs"] and job["version"] != body["jobs"][uuid]]
+        missing = [uuid for uuid in body["jobs"] if uuid not in self.jobs]
+        return response(
+            200, hoplite_dumps({"jobs": changed, "missing": missing}),
+            {'content-type': 'application/json'})
+
+
+class TestStatusMultiplexer(unittest2.TestCase):
+    def setUp(self):
+        self.server = FakeServer(
+            "localhost:5004",
+            {"uuid1": job_dict("uuid1", 1), "uuid2": job_dict("uuid2", 1), "uuid3": job_dict("uuid3", 1)})
+
+    def test_jobs_of_a_server_are_polled_together(self):
+        with HTTMock(self.server.handler):
+            jobs = [RemoteJob("localhost:5004", uuid=uuid) for uuid in ("uuid1", "uuid2", "uuid3")]
+            del self.server.requests[:]
+            self.server.jobs["uuid2"] = job_dict("uuid2", 2, finished=True)
+            self.assertFalse(jobs[0].finished(force=True))
+            # The other jobs were updated by the same request
+            self.assertTrue(jobs[1].finished())
+            self.assertFalse(jobs[2].finished())
+        self.assertEquals(
+            self.server.requests,
+            [('POST', {"jobs": {"uuid1": 1, "uuid2": 1, "uuid3": 1}})])
+
+    def test_finished_jobs_are_not_polled(self):
+        self.server.jobs["uuid2"] = job_dict("uuid2", 2, finished=True)
+        with HTTMock(self.server.handler):
+            jobs = [RemoteJob("localhost:5004", uuid=uuid) for uuid in ("uuid1", "uuid2", "uuid3")]
+            del self.server.requests[:]
+            jobs[0].status(force=True)
+        self.assertEquals(
+            self.server.requests,
+            [('POST', {"jobs": {"uuid1": 1, "uuid3": 1}})])
+
+    def test_single_job_is_polled_on_its_own(self):
+        with HTTMock(self.server.handler):
+            job = RemoteJob("localhost:5004", uuid="uuid1")
+            job.status(force=True)
+        self.assertEquals(self.server.requests, [('GET', 'uuid1'), ('GET', 'uuid1')])
+        self.assertEquals(get_multiplexer("http://localhost:5004").jobs(), [job])
+
+    def test_missing_job_raises(self):
+        with HTTMock(self.server.handler):
+            job = RemoteJob("localhost:5004", uuid="uuid1")
+            other = RemoteJob("localhost:5004", uuid="uuid2")
+            del self.server.jobs["uuid1"]
+            self.assertRaises(JobDoesNotExistError, job.status, True)
+            other.status(force=True)
+
+    def test_server_without_bulk_status_is_polled_one_job_at_a_time(self):
+        server = FakeServer(
+            "localhost:5007",
+            {"uuid1": job_dict("uuid1", 1), "uuid2": job_dict("uuid2", 1)},
+            bulk_status_code=404)
+        with HTTMock(server.handler):
+            jobs = [RemoteJob("localhost:5007", uuid=uuid) for uuid in ("uuid1", "uuid2")]
+            jobs[0].status(force=True)
+        # Bulk status is only tried once, when the second job is created
+        self.assertEquals(
+            server.requests,
+            [('GET', 'uuid1'), ('POST', {"jobs": {"uuid1": 1, "uuid2": None}}), ('GET', 'uuid2'),
+             ('GET', 'uuid1')])
+
+    def test_server_error_raises(self):
+        server = FakeServer(
+            "localhost:5008",
+            {"uuid1": job_dict("uuid1", 1), "uuid2": job_dict("uuid2", 1)})
+        with HTTMock(server.handler):
+            jobs = [RemoteJob("localhost:5008", uuid=uuid) for uuid in ("uuid1", "uuid2")]
+            server.bulk_status_code = 503
+            self.assertRaises(InternalServerError, jobs[0].status, True)
+            server.bulk_status_code = 200
+            del server.requests[:]
+            server.jobs["uuid2"] = job_dict("uuid2", 2, finished=True)
+            jobs[0].status(force=True)
+            # The error did not make the multiplexer give up on bulk status
+            self.assertTrue(jobs[1].finished())
+        self.assertEquals(
+            server.requests,
+            [('POST', {"jobs": {"uuid1": 1, "uuid2": 1}})])
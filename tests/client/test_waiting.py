@@ -0,0 +1,94 @@
+from httmock import HTTMock
+import threading
+import time
+import unittest2
+
+from hoplite.client import wait, RemoteJob, ALL_COMPLETED, FIRST_COMPLETED, FIRST_EXCEPTION
+from tests.client.test_status_multiplexer import FakeServer, job_dict
+
+
+class TestWait(unittest2.TestCase):
+    def setUp(self):
+        self.server = FakeServer(
+            "localhost:5005",
+            {"uuid1": job_dict("uuid1", 1), "uuid2": job_dict("uuid2", 1)})
+        self.other_server = FakeServer(
+            "localhost:5006", {"uuid3": job_dict("uuid3", 1)})
+        self.mock = HTTMock(self.server.handler, self.other_server.handler)
+        self.mock.__enter__()
+        self.jobs = [
+            RemoteJob("localhost:5005", uuid="uuid1"),
+            RemoteJob("localhost:5005", uuid="uuid2"),
+            RemoteJob("localhost:5006", uuid="uuid3")]
+
+    def tearDown(self):
+        self.mock.__exit__(None, None, None)
+
+    def _finish_later(self, server, uuid, delay=.3, failed=False):
+        def finish():
+            job = job_dict(uuid, 2, finished=True)
+            if failed:
+                job["status"]["exception"] = {"message": "failed"}
+            server.jobs[uuid] = job
+        timer = threading.Timer(delay, finish)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def test_all_completed(self):
+        self._finish_later(self.server, "uuid1")
+        self._finish_later(self.server, "uuid2", delay=.5)
+        self._finish_later(self.other_server, "uuid3", delay=.1)
+        done, not_done = wait(self.jobs, timeout=10)
+        self.assertEquals(done, set(self.jobs))
+        self.assertEquals(not_done, set())
+
+    def test_first_completed(self):
+        self._finish_later(self.other_server, "uuid3")
+        done, not_done = wait(self.jobs, return_when=FIRST_COMPLETED, timeout=10)
+        self.assertEquals(done, set([self.jobs[2]]))
+        self.assertEquals(not_done, set(self.jobs[:2]))
+
+    def test_first_exception(self):
+        self._finish_later(self.server, "uuid1")
+        self._finish_later(self.server, "uuid2", delay=.6, failed=True)
+        done, not_done = wait(self.jobs, return_when=FIRST_EXCEPTION, timeout=10)
+        self.assertEquals(done, set(self.jobs[:2]))
+        self.assertEquals(not_done, set([self.jobs[2]]))
+
+    def test_timeout(self):
+        start_time = time.time()
+        done, not_done = wait(self.jobs, return_when=ALL_COMPLETED, timeout=.5)
+        self.assertGreaterEqual(time.time() - start_time, .5)
+        self.assertEquals(done, set())
+        self.assertEquals(not_done, set(self.jobs))
+
+    def test_jobs_of_a_server_are_polled_together(self):
+        self._finish_later(self.server, "uuid1", delay=.5)
+        self._finish_later(self.server, "uuid2", delay=.5)
+        self._finish_later(self.other_server, "uuid3", delay=.5)
+        del self.server.requests[:]
+        wait(self.jobs, timeout=10)
+        self.assertTrue(all(method == 'POST' for method, _ in self.server.requests))
+
+    def test_invalid_return_when(self):
+        self.assertRaises(ValueError, wait, self.jobs, return_when="SOMETIMES")
+
+    def test_repeated_waits_share_a_poller(self):
+        for _ in range(5):
+            wait(self.jobs, return_when=FIRST_COMPLETED, timeout=.1)
+        pollers = [thread for thread in threading.enumerate() if thread.name == 'hoplite-wait']
+        # At most one for each server
+        self.assertLessEqual(len(pollers), 2)
+
+    def test_server_without_bulk_status(self):
+        server = FakeServer(
+            "localhost:5009",
+            {"uuid4": job_dict("uuid4", 1), "uuid5": job_dict("uuid5", 1)},
+            bulk_status_code=404)
+        with HTTMock(server.handler):
+            jobs = [RemoteJob("localhost:5009", uuid=uuid) for uuid in ("uuid4", "uuid5")]
+            # Not the first job, which would be polled anyway
+            self._finish_later(server, "uuid5")
+            done, not_done = wait(jobs, return_when=FIRST_COMPLETED, timeout=10)
+        self.assertEquals(done, set([jobs[1]]))
+        self.assertEquals(not_done, set([jobs[0]]))
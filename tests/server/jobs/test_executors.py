@@ -0,0 +1,243 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from hoplite.client.status_updater import MockStatusUpdater
+from hoplite.server.jobs.executors import ProcessExecutor, ProcessPoolExecutor, ThreadExecutor
+from tests import HopliteTestCase
+
+
+class ExecutorTestCase(HopliteTestCase):
+    def setUp(self):
+        super(ExecutorTestCase, self).setUp()
+        self.constants = self.test_jobs_module.constants
+        self.temp_dir = tempfile.mkdtemp()
+        self.tasks = []
+
+    def tearDown(self):
+        for task in self.tasks:
+            if task.is_alive():
+                task.terminate()
+                task.kill()
+        shutil.rmtree(self.temp_dir)
+        super(ExecutorTestCase, self).tearDown()
+
+    def _submit(self, executor, name, config, on_exit=None):
+        task = executor.submit({
+            'entry_point_name': name,
+            'config': config,
+            'status_updater': MockStatusUpdater(),
+            'entry_point_group_name': 'hoplite.test_jobs',
+            'uuid': 'uuid-{0}'.format(len(self.tasks))
+        }, on_exit=on_exit)
+        self.tasks.append(task)
+        return task
+
+    def _wait_until_finished(self, task):
+        self.wait_for(lambda: not task.is_alive(), "the task to finish")
+
+    def _read_output(self, path, **expected):
+        def written():
+            if not os.path.exists(path):
+                return False
+            with open(path) as output:
+                data = json.load(output)
+            return all(data[key] == value for key, value in expected.items())
+        self.wait_for(written, "the job to write {0}".format(expected))
+
+    def _run_resources_job(self, executor, name, **config):
+        output_path = os.path.join(self.temp_dir, name + ".json")
+        config.update({
+            "output_file": output_path,
+            "teardown_file": os.path.join(self.temp_dir, "teardown.txt")
+        })
+        task = self._submit(executor, self.constants.PLUGIN_RESOURCES_JOB_NAME, config)
+        self._wait_until_finished(task)
+        with open(output_path) as output:
+            return json.load(output)
+
+    def _teardowns(self):
+        path = os.path.join(self.temp_dir, "teardown.txt")
+        if not os.path.exists(path):
+            return 0
+        with open(path) as teardown_file:
+            return len(teardown_file.readlines())
+
+    def _exception_type(self, task):
+        exception_info = task.results.recv()
+        while 'type' not in exception_info:
+            exception_info = exception_info['previous_exception']
+        return exception_info['type']
+
+
+class TestProcessExecutor(ExecutorTestCase):
+    def test_resources_are_set_up_for_each_job(self):
+        executor = ProcessExecutor()
+        self.assertEquals(self._run_resources_job(executor, "first")["jobs"], 1)
+        self.assertEquals(self._teardowns(), 1)
+        self.assertEquals(self._run_resources_job(executor, "second")["jobs"], 1)
+        self.assertEquals(self._teardowns(), 2)
+
+
+class TestThreadExecutor(ExecutorTestCase):
+    def test_runs_job_on_thread(self):
+        executor = ThreadExecutor(2)
+        output_path = os.path.join(self.temp_dir, "output.txt")
+        exited = threading.Event()
+        task = self._submit(
+            executor, self.constants.THREAD_EXECUTOR_JOB_NAME, {"output_file": output_path}, exited.set)
+        self._wait_until_finished(task)
+        self.assertTrue(exited.wait(10))
+        with open(output_path) as output:
+            self.assertEquals(output.read(), "hoplite-job-thread")
+        self.assertIsNotNone(task.plugin_loaded_at())
+        self.assertFalse(task.alive())
+        # No exception was raised
+        self.assertTrue(task.results.poll())
+        self.assertRaises(EOFError, task.results.recv)
+
+    def test_exceptions_are_returned(self):
+        executor = ThreadExecutor(2)
+        task = self._submit(executor, self.constants.THROW_AN_EXCEPTION_JOB_NAME, {})
+        self._wait_until_finished(task)
+        self.assertEquals(self._exception_type(task), str(TypeError))
+
+    def test_terminate_cancels_job(self):
+        executor = ThreadExecutor(2)
+        output_path = os.path.join(self.temp_dir, "output.json")
+        task = self._submit(executor, self.constants.WAIT_FOR_CANCEL_JOB_NAME, {"output_file": output_path})
+        self._read_output(output_path, cancelled=False)
+        task.terminate()
+        self._read_output(output_path, cancelled=True)
+        self._wait_until_finished(task)
+
+    def test_kill_raises_in_thread(self):
+        executor = ThreadExecutor(2)
+        output_path = os.path.join(self.temp_dir, "output.txt")
+        task = self._submit(executor, self.constants.BUSY_WAIT_JOB_NAME, {})
+        time.sleep(.2)
+        task.terminate()
+        # The plugin does not check its context
+        time.sleep(.2)
+        self.assertTrue(task.is_alive())
+        task.kill()
+        self._wait_until_finished(task)
+        # The thread is reused
+        task = self._submit(executor, self.constants.THREAD_EXECUTOR_JOB_NAME, {"output_file": output_path})
+        self._wait_until_finished(task)
+        self.assertTrue(os.path.exists(output_path))
+
+    def test_jobs_wait_for_a_free_thread(self):
+        executor = ThreadExecutor(1)
+        output_path = os.path.join(self.temp_dir, "output.json")
+        first = self._submit(executor, self.constants.WAIT_FOR_CANCEL_JOB_NAME, {"output_file": output_path})
+        self._read_output(output_path, cancelled=False)
+        second_path = os.path.join(self.temp_dir, "second.txt")
+        second = self._submit(executor, self.constants.THREAD_EXECUTOR_JOB_NAME, {"output_file": second_path})
+        time.sleep(.2)
+        self.assertTrue(second.is_alive())
+        self.assertFalse(os.path.exists(second_path))
+        first.terminate()
+        self._wait_until_finished(second)
+        self.assertTrue(os.path.exists(second_path))
+
+    def test_terminate_removes_waiting_job(self):
+        executor = ThreadExecutor(1)
+        output_path = os.path.join(self.temp_dir, "output.json")
+        first = self._submit(executor, self.constants.WAIT_FOR_CANCEL_JOB_NAME, {"output_file": output_path})
+        self._read_output(output_path, cancelled=False)
+        second_path = os.path.join(self.temp_dir, "second.txt")
+        second = self._submit(executor, self.constants.THREAD_EXECUTOR_JOB_NAME, {"output_file": second_path})
+        second.terminate()
+        self.assertFalse(second.is_alive())
+        first.terminate()
+        self._wait_until_finished(first)
+        time.sleep(.2)
+        self.assertFalse(os.path.exists(second_path))
+
+    def test_resources_are_kept_until_shutdown(self):
+        executor = ThreadExecutor(1)
+        self.assertEquals(self._run_resources_job(executor, "first")["jobs"], 1)
+        self.assertEquals(self._run_resources_job(executor, "second")["jobs"], 2)
+        self.assertEquals(self._teardowns(), 0)
+        executor.shutdown(timeout=10)
+        self.assertEquals(self._teardowns(), 1)
+        # The pool starts a new thread for jobs run after it was shut down
+        self.assertEquals(self._run_resources_job(executor, "third")["jobs"], 1)
+        executor.shutdown(timeout=10)
+        self.assertEquals(self._teardowns(), 2)
+
+    def test_resources_are_dropped_when_job_fails(self):
+        executor = ThreadExecutor(1)
+        self._run_resources_job(executor, "first")
+        self.assertEquals(self._run_resources_job(executor, "second", fail=True)["jobs"], 2)
+        self.assertEquals(self._teardowns(), 1)
+        self.assertEquals(self._run_resources_job(executor, "third")["jobs"], 1)
+        executor.shutdown(timeout=10)
+
+
+class TestProcessPoolExecutor(ExecutorTestCase):
+    def test_workers_are_reused(self):
+        executor = ProcessPoolExecutor(1)
+        first = self._submit(
+            executor, self.constants.CREATE_FILE_JOB_NAME,
+            {"file_to_create": os.path.join(self.temp_dir, "first.txt")})
+        self._wait_until_finished(first)
+        second = self._submit(
+            executor, self.constants.CREATE_FILE_JOB_NAME,
+            {"file_to_create": os.path.join(self.temp_dir, "second.txt")})
+        self._wait_until_finished(second)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "first.txt")))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "second.txt")))
+        self.assertEquals(first.pid, second.pid)
+        self.assertNotEquals(first.pid, os.getpid())
+        self.assertIsNotNone(second.plugin_loaded_at())
+
+    def test_exceptions_are_returned(self):
+        executor = ProcessPoolExecutor(1)
+        task = self._submit(executor, self.constants.THROW_AN_EXCEPTION_JOB_NAME, {})
+        self._wait_until_finished(task)
+        self.assertEquals(self._exception_type(task), str(TypeError))
+
+    def test_terminate_cancels_job_and_keeps_worker(self):
+        executor = ProcessPoolExecutor(1)
+        output_path = os.path.join(self.temp_dir, "output.json")
+        task = self._submit(executor, self.constants.WAIT_FOR_CANCEL_JOB_NAME, {"output_file": output_path})
+        self._read_output(output_path, cancelled=False)
+        task.terminate()
+        self._read_output(output_path, cancelled=True)
+        self._wait_until_finished(task)
+        next_task = self._submit(
+            executor, self.constants.CREATE_FILE_JOB_NAME,
+            {"file_to_create": os.path.join(self.temp_dir, "next.txt")})
+        self._wait_until_finished(next_task)
+        self.assertEquals(task.pid, next_task.pid)
+
+    def test_kill_replaces_worker(self):
+        executor = ProcessPoolExecutor(1)
+        pid_path = os.path.join(self.temp_dir, "child.pid")
+        task = self._submit(
+            executor, self.constants.SPAWN_PROCESS_JOB_NAME, {"pid_file": pid_path, "ignore_sigterm": True})
+        self.wait_for(lambda: os.path.exists(pid_path) and open(pid_path).read(), "the child process")
+        task.kill()
+        self._wait_until_finished(task)
+        next_task = self._submit(
+            executor, self.constants.CREATE_FILE_JOB_NAME,
+            {"file_to_create": os.path.join(self.temp_dir, "next.txt")})
+        self._wait_until_finished(next_task)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "next.txt")))
+        self.assertNotEquals(task.pid, next_task.pid)
+
+    def test_resources_are_kept_until_shutdown(self):
+        executor = ProcessPoolExecutor(1)
+        first = self._run_resources_job(executor, "first")
+        second = self._run_resources_job(executor, "second")
+        self.assertEquals(first["jobs"], 1)
+        self.assertEquals(second["jobs"], 2)
+        self.assertEquals(first["pid"], second["pid"])
+        self.assertEquals(self._teardowns(), 0)
+        executor.shutdown(timeout=10)
+        self.assertEquals(self._teardowns(), 1)
@@ -2,7 +2,9 @@ import time
 
 from hoplite.builtin_plugins.constants import DOWNLOAD_NETWORK_FOLDER_JOB_NAME
 from hoplite.utils import server_logging
+from hoplite.exceptions import InvalidStatusUpdateError
 from hoplite.server.jobs.job import Job, JobNotStartedError, NotAuthorizedError
+from hoplite.utils.status_patch import make_patch
 from tests import HopliteTestCase
 
 logger = server_logging.get_server_logger(__name__)
@@ -44,6 +46,43 @@ class TestJob(HopliteTestCase):
         self.assertFalse(d["running"])
         self.assertFalse(d["finished"])
 
+    def test_state(self):
+        self.assertEquals(self.job.state(), "queued")
+        job = Job("No ID", self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME, {}, "api_key", entry_point_group_name='hoplite.test_jobs')
+        job.start()
+        while job.running():
+            time.sleep(.01)
+        self.assertEquals(job.state(), "failed")
+        self.job.start()
+        self.assertEquals(self.job.state(), "running")
+        self.job.kill()
+        self.assertEquals(self.job.state(), "killed")
+
+    def test_to_dict_fields(self):
+        self.assertEquals(self.job.to_dict(["uuid", "state", "unknown"]), {"uuid": "{3939}", "state": "queued"})
+
+    def test_to_dict_lifecycle_timestamps_before_start(self):
+        d = self.job.to_dict()
+        self.assertIsNotNone(d["created_at"])
+        self.assertIsNone(d["start_requested_at"])
+        self.assertIsNone(d["process_spawned_at"])
+        self.assertIsNone(d["plugin_loaded_at"])
+        self.assertIsNone(d["first_status_at"])
+        self.assertIsNone(d["finished_at"])
+
+    def test_lifecycle_timestamps_are_ordered(self):
+        job = Job("No ID", self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME, {}, "api_key", entry_point_group_name='hoplite.test_jobs')
+        job.start()
+        job.update_status("api_key", {"state": "running"})
+        while job.running():
+            time.sleep(.01)
+        d = job.to_dict()
+        self.assertLessEqual(d["created_at"], d["start_requested_at"])
+        self.assertLessEqual(d["start_requested_at"], d["process_spawned_at"])
+        self.assertLessEqual(d["start_requested_at"], d["plugin_loaded_at"])
+        self.assertLessEqual(d["plugin_loaded_at"], d["finished_at"])
+        self.assertLessEqual(d["start_requested_at"], d["first_status_at"])
+
     def test_returns_exception_information_in_status(self):
         config = {}
         job = Job("666", self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME, config, "api_key", entry_point_group_name='hoplite.test_jobs')
@@ -61,6 +100,13 @@ class TestJob(HopliteTestCase):
         self.assertEqual(exc_info["message"], "THE SKY IS FALLING!!")
         self.assertIsNotNone(traceback)
 
+    def test_run_deadline(self):
+        self.assertIsNone(self.job.run_deadline())
+        job = Job("{3940}", DOWNLOAD_NETWORK_FOLDER_JOB_NAME, {}, "temp", max_runtime=10, deadline=2000000000)
+        self.assertEquals(job.run_deadline(), 2000000000)
+        job.start_requested_at = 1000000000
+        self.assertEquals(job.run_deadline(), 1000000010)
+
     def test_returns_status(self):
         self.assertEqual(self.job.status(), {})
 
@@ -76,6 +122,42 @@ class TestJob(HopliteTestCase):
     def test_update_status_raises_on_invalid_api_key(self):
         self.assertRaises(NotAuthorizedError, self.job.update_status, "", {"Not": "Authorized"})
 
+    def test_patch_status(self):
+        self.job.update_status(self.job._api_key, {"a": 1, "b": 2, "log": ["one"]})
+        version = self.job.version
+        self.job.patch_status(self.job._api_key, make_patch({"c": 3}, ["b"], {"log": ["two"]}))
+        self.assertEquals(self.job.status(), {"a": 1, "c": 3, "log": ["one", "two"]})
+        self.assertEquals(self.job.version, version + 1)
+
+    def test_patch_status_does_not_change_earlier_statuses(self):
+        self.job.update_status(self.job._api_key, {"log": ["one"]})
+        earlier = self.job.status()
+        self.job.patch_status(self.job._api_key, make_patch(unset=["a"], append={"log": ["two"]}))
+        self.assertEquals(earlier, {"log": ["one"]})
+
+    def test_patch_status_raises_on_append_to_non_list(self):
+        self.job.update_status(self.job._api_key, {"a": 1})
+        version = self.job.version
+        self.assertRaises(
+            InvalidStatusUpdateError, self.job.patch_status, self.job._api_key, make_patch(append={"a": [2]}))
+        self.assertEquals(self.job.status(), {"a": 1})
+        self.assertEquals(self.job.version, version)
+
+    def test_status_history(self):
+        self.job.update_status(self.job._api_key, {"a": 1})
+        self.job.patch_status(self.job._api_key, make_patch(unset=["a"], append={"log": ["one"]}))
+        history, truncated = self.job.status_history()
+        self.assertFalse(truncated)
+        self.assertEquals(
+            [dict((key, entry[key]) for key in entry if key != "time") for entry in history],
+            [{"version": 1, "set": {"a": 1}}, {"version": 2, "unset": ["a"], "append": {"log": ["one"]}}])
+        self.assertEquals(self.job.version, 2)
+        history, _ = self.job.status_history(after_version=1)
+        self.assertEquals([entry["version"] for entry in history], [2])
+
+    def test_patch_status_raises_on_invalid_api_key(self):
+        self.assertRaises(NotAuthorizedError, self.job.patch_status, "", make_patch({"Not": "Authorized"}))
+
     def test_kill(self):
         job = Job("No ID", self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME, { "No": "Config" }, "temp_api_key")
         logger.info("Starting job")
@@ -0,0 +1,373 @@
+import json
+import os
+import shutil
+import signal
+import tempfile
+import time
+
+import unittest2
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from hoplite.exceptions import IdempotencyKeyReusedError, InvalidJobOptionError, JobAlreadyStartedError
+from hoplite.plugin_manager import EntryPointManager
+from hoplite.server.jobs.job_manager import JobManager
+from hoplite.server.jobs.process_tree import HAS_PROCESS_GROUPS
+from tests import HopliteTestCase
+
+
+class TestJobManager(HopliteTestCase):
+    def setUp(self):
+        super(TestJobManager, self).setUp()
+        self.manager = JobManager(EntryPointManager('hoplite.test_jobs'))
+        self.constants = self.test_jobs_module.constants
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for job in self.manager.all_jobs():
+            if job.started():
+                job.kill()
+        shutil.rmtree(self.temp_dir)
+        super(TestJobManager, self).tearDown()
+
+    def _create_file_job(self, running=True):
+        path = os.path.join(self.temp_dir, str(self.manager.count_jobs()))
+        return self.manager.create_job(
+            self.constants.CREATE_FILE_JOB_NAME, {"file_to_create": path},
+            running, port=5001)
+
+    def _wait_for_count(self, state, count):
+        self.wait_for(
+            lambda: self.manager.count_jobs(state) == count, "{0} {1} jobs".format(count, state))
+
+    def test_jobs_are_indexed_by_state(self):
+        queued = self._create_file_job(running=False)
+        waiting = self.manager.create_job(
+            self.constants.WAIT_10_SECONDS_JOB_NAME, {}, True, port=5001)
+        self.assertEquals(list(self.manager.find_jobs(states=["queued"])), [queued])
+        self.assertEquals(list(self.manager.find_jobs(states=["running"])), [waiting])
+        waiting.kill()
+        self.assertEquals(list(self.manager.find_jobs(states=["killed"])), [waiting])
+        self.assertEquals(self.manager.count_jobs("running"), 0)
+
+    def test_jobs_are_killed_at_their_deadline(self):
+        start_time = time.time()
+        by_runtime = self.manager.create_job(
+            self.constants.WAIT_10_SECONDS_JOB_NAME, {}, True, port=5001, max_runtime=.5)
+        by_deadline = self.manager.create_job(
+            self.constants.WAIT_10_SECONDS_JOB_NAME, {}, True, port=5001, deadline=time.time() + .5)
+        untimed = self.manager.create_job(
+            self.constants.WAIT_10_SECONDS_JOB_NAME, {}, True, port=5001)
+        self._wait_for_count("killed", 2)
+        self.assertLess(time.time() - start_time, 5)
+        self.assertTrue(by_runtime.timed_out())
+        self.assertTrue(by_deadline.timed_out())
+        self.assertEquals(by_runtime.to_dict(["state", "timed_out"]), {"state": "killed", "timed_out": True})
+        self.assertFalse(untimed.timed_out())
+        self.assertEquals(untimed.state(), "running")
+
+    def _start_spawn_process_job(self, ignore_sigterm, runtime=10):
+        pid_path = os.path.join(self.temp_dir, "child.pid")
+        job = self.manager.create_job(
+            self.constants.SPAWN_PROCESS_JOB_NAME,
+            {"pid_file": pid_path, "ignore_sigterm": ignore_sigterm, "runtime": runtime}, True, port=5001)
+        self.wait_for(
+            lambda: os.path.exists(pid_path) and open(pid_path).read(),
+            "the job to start its child process")
+        return job, int(open(pid_path).read())
+
+    def _wait_for_kill_status(self, job, kill_status):
+        self.wait_for(
+            lambda: job.kill_status() == kill_status, "the kill to be {0}".format(kill_status))
+
+    def _assert_process_exited(self, pid):
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return
+        # An orphan which has exited may not have been reaped yet
+        if psutil is not None and psutil.Process(pid).status() == psutil.STATUS_ZOMBIE:
+            return
+        self.fail("Process {0} is still running".format(pid))
+
+    def test_kill_terminates_processes_started_by_job(self):
+        job, child_pid = self._start_spawn_process_job(ignore_sigterm=False)
+        job.kill()
+        self.assertEquals(job.kill_status(), "terminating")
+        self._wait_for_kill_status(job, "terminated")
+        self.assertEquals(job.to_dict(["kill_status", "surviving_processes"]),
+                          {"kill_status": "terminated", "surviving_processes": 0})
+        self._assert_process_exited(child_pid)
+
+    def test_kill_escalates_after_grace_period(self):
+        self.manager.kill_grace_period_s = .5
+        job, child_pid = self._start_spawn_process_job(ignore_sigterm=True)
+        start_time = time.time()
+        job.kill()
+        self._wait_for_kill_status(job, "killed")
+        self.assertGreaterEqual(time.time() - start_time, .5)
+        if psutil is not None:
+            # The child ignored SIGTERM, so it was still running
+            self.assertGreaterEqual(job.surviving_processes(), 1)
+        self._assert_process_exited(child_pid)
+
+    # Without psutil the process left could not be told from a zombie
+    @unittest2.skipUnless(HAS_PROCESS_GROUPS and psutil is not None, "Process groups or psutil are not available")
+    def test_processes_left_by_finished_job_are_watched_until_they_exit(self):
+        job, child_pid = self._start_spawn_process_job(ignore_sigterm=False, runtime=0)
+        self._wait_until_finished(job)
+        # The job counts as live while the process it left is running
+        self.assertTrue(job.processes_alive())
+        self.assertIn(job.log_path, self.manager.active_log_paths())
+        os.kill(child_pid, signal.SIGKILL)
+        self.wait_for(
+            lambda: job.log_path not in self.manager.active_log_paths(), "the process left by the job to be reaped")
+        self.assertFalse(job.processes_alive())
+        # Killing the finished job signals nothing, as the ID of its process
+        # group may have been reused
+        job.kill()
+        self._wait_for_kill_status(job, "terminated")
+
+    def _read_output(self, path, **expected):
+        written = []
+
+        def read():
+            if not os.path.exists(path):
+                return False
+            with open(path) as output:
+                data = json.load(output)
+            written[:] = [data]
+            return all(data[key] == value for key, value in expected.items())
+        self.wait_for(read, "the job to write {0}".format(expected))
+        return written[0]
+
+    def test_job_context_has_deadline_and_is_cancelled_on_kill(self):
+        output_path = os.path.join(self.temp_dir, "output.json")
+        job = self.manager.create_job(
+            self.constants.WAIT_FOR_CANCEL_JOB_NAME, {"output_file": output_path}, True, port=5001,
+            max_runtime=30)
+        data = self._read_output(output_path, cancelled=False)
+        self.assertGreater(data["remaining"], 0)
+        self.assertLessEqual(data["remaining"], 30)
+        job.kill()
+        self._read_output(output_path, cancelled=True)
+        self._wait_for_kill_status(job, "terminated")
+
+    def _wait_until_finished(self, job):
+        self.wait_for(job.finished, "the job to finish")
+
+    def test_plugins_choose_their_executor(self):
+        output_path = os.path.join(self.temp_dir, "output.txt")
+        job = self.manager.create_job(
+            self.constants.THREAD_EXECUTOR_JOB_NAME, {"output_file": output_path}, True, port=5001)
+        self._wait_until_finished(job)
+        self.assertEquals(job.to_dict(["executor", "state"]), {"executor": "thread", "state": "finished"})
+        with open(output_path) as output:
+            self.assertEquals(output.read(), "hoplite-job-thread")
+
+    def test_requested_executor_is_used(self):
+        output_path = os.path.join(self.temp_dir, "output.txt")
+        job = self.manager.create_job(
+            self.constants.THREAD_EXECUTOR_JOB_NAME, {"output_file": output_path}, True, port=5001,
+            executor="pooled-process")
+        self._wait_until_finished(job)
+        self.assertEquals(job.executor, "pooled-process")
+        with open(output_path) as output:
+            self.assertNotEquals(output.read(), "hoplite-job-thread")
+        job = self.manager.create_job(self.constants.WAIT_10_SECONDS_JOB_NAME, {}, port=5001)
+        self.assertEquals(job.executor, "process")
+
+    def test_profiled_jobs_run_in_a_process(self):
+        job = self.manager.create_job(
+            self.constants.THREAD_EXECUTOR_JOB_NAME, {}, port=5001, executor="thread", profiler="cprofile")
+        self.assertEquals(job.executor, "process")
+
+    def test_invalid_executors_are_rejected(self):
+        self.assertRaises(
+            InvalidJobOptionError, self.manager.create_job,
+            self.constants.WAIT_10_SECONDS_JOB_NAME, {}, executor="fiber")
+
+    def test_shutdown_tears_down_plugin_resources(self):
+        teardown_path = os.path.join(self.temp_dir, "teardown.txt")
+        for executor in ("thread", "pooled-process"):
+            job = self.manager.create_job(
+                self.constants.PLUGIN_RESOURCES_JOB_NAME,
+                {"output_file": os.path.join(self.temp_dir, "output.json"), "teardown_file": teardown_path},
+                True, port=5001, executor=executor)
+            self._wait_until_finished(job)
+        self.assertFalse(os.path.exists(teardown_path))
+        self.manager.shutdown(timeout=10)
+        with open(teardown_path) as teardown_file:
+            self.assertEquals(len(teardown_file.readlines()), 2)
+
+    def _runs(self, runs_path):
+        if not os.path.exists(runs_path):
+            return 0
+        with open(runs_path) as runs_file:
+            return len(runs_file.readlines())
+
+    def test_cached_results_are_reused(self):
+        runs_path = os.path.join(self.temp_dir, "runs.txt")
+        first = self.manager.create_job(self.constants.COUNT_RUNS_JOB_NAME, {"runs_file": runs_path}, True, port=5001)
+        self._wait_until_finished(first)
+        second = self.manager.create_job(self.constants.COUNT_RUNS_JOB_NAME, {"runs_file": runs_path}, True, port=5001)
+        self.assertEquals(second.to_dict(["state", "cached"]), {"state": "finished", "cached": True})
+        self.assertFalse(first.cached())
+        self.assertEquals(self._runs(runs_path), 1)
+        # Jobs with another config, or that refuse the cache, are run
+        other = self.manager.create_job(
+            self.constants.COUNT_RUNS_JOB_NAME, {"runs_file": runs_path, "seconds": 0.01}, True, port=5001)
+        uncached = self.manager.create_job(
+            self.constants.COUNT_RUNS_JOB_NAME, {"runs_file": runs_path}, True, port=5001, cache=False)
+        self._wait_until_finished(other)
+        self._wait_until_finished(uncached)
+        self.assertFalse(other.cached())
+        self.assertFalse(uncached.cached())
+        self.assertEquals(self._runs(runs_path), 3)
+
+    def test_identical_jobs_are_run_once(self):
+        runs_path = os.path.join(self.temp_dir, "runs.txt")
+        config = {"runs_file": runs_path, "seconds": 0.5}
+        jobs = [self.manager.create_job(self.constants.COUNT_RUNS_JOB_NAME, config, True, port=5001)
+                for _ in range(3)]
+        self.assertEquals([job.state() for job in jobs], ["running"] * 3)
+        for job in jobs:
+            self._wait_until_finished(job)
+        self.assertEquals([job.cached() for job in jobs], [False, True, True])
+        self.assertEquals(self._runs(runs_path), 1)
+
+    def test_identical_job_is_run_if_the_one_it_waits_for_is_killed(self):
+        runs_path = os.path.join(self.temp_dir, "runs.txt")
+        config = {"runs_file": runs_path, "seconds": 0.5}
+        first = self.manager.create_job(self.constants.COUNT_RUNS_JOB_NAME, config, True, port=5001)
+        second = self.manager.create_job(self.constants.COUNT_RUNS_JOB_NAME, config, True, port=5001)
+        first.kill()
+        self._wait_until_finished(second)
+        self.assertFalse(second.cached())
+        self.assertEquals(second.state(), "finished")
+
+    def test_failed_jobs_are_not_cached(self):
+        first = self.manager.create_job(self.constants.THROW_AN_EXCEPTION_JOB_NAME, {}, True, port=5001, cache=True)
+        self._wait_until_finished(first)
+        second = self.manager.create_job(self.constants.THROW_AN_EXCEPTION_JOB_NAME, {}, True, port=5001, cache=60)
+        self._wait_until_finished(second)
+        self.assertEquals([first.state(), second.state()], ["failed", "failed"])
+        self.assertFalse(second.cached())
+
+    def test_invalid_cache_options_are_rejected(self):
+        for cache in ("yes", 0, -5):
+            self.assertRaises(
+                InvalidJobOptionError, self.manager.create_job,
+                self.constants.COUNT_RUNS_JOB_NAME, {}, cache=cache)
+
+    def test_create_with_idempotency_key_returns_the_job_created_with_it(self):
+        name = self.constants.WAIT_10_SECONDS_JOB_NAME
+        first = self.manager.create_job(name, {"a": 1}, port=5001, idempotency_key="key")
+        second = self.manager.create_job(name, {"a": 1}, port=5001, idempotency_key="key")
+        self.assertIs(first, second)
+        self.assertEquals(self.manager.count_jobs(), 1)
+        other = self.manager.create_job(name, {"a": 1}, port=5001, idempotency_key="other-key")
+        self.assertIsNot(other, first)
+        self.assertRaises(
+            IdempotencyKeyReusedError, self.manager.create_job, name, {"a": 2}, port=5001, idempotency_key="key")
+        # Keys are forgotten with the jobs
+        self.manager._clear()
+        third = self.manager.create_job(name, {"a": 2}, port=5001, idempotency_key="key")
+        self.assertIsNot(third, first)
+
+    def test_expired_idempotency_keys_are_forgotten(self):
+        self.manager.idempotency_keys.ttl_s = 0
+        name = self.constants.WAIT_10_SECONDS_JOB_NAME
+        first = self.manager.create_job(name, {}, port=5001, idempotency_key="key")
+        second = self.manager.create_job(name, {}, port=5001, idempotency_key="key")
+        self.assertIsNot(first, second)
+
+    def test_start_with_idempotency_key_starts_the_job_once(self):
+        job = self._create_file_job(running=False)
+        self.manager.start_job(job.uuid, idempotency_key="start-key")
+        self.assertTrue(job.started())
+        self.assertIs(self.manager.start_job(job.uuid, idempotency_key="start-key"), job)
+        self.assertRaises(JobAlreadyStartedError, self.manager.start_job, job.uuid)
+        self.assertRaises(JobAlreadyStartedError, self.manager.start_job, job.uuid, idempotency_key="new-key")
+        other = self._create_file_job(running=False)
+        self.assertRaises(IdempotencyKeyReusedError, self.manager.start_job, other.uuid, idempotency_key="start-key")
+
+    def test_invalid_idempotency_keys_are_rejected(self):
+        for key in ("", "k" * 256):
+            self.assertRaises(
+                InvalidJobOptionError, self.manager.create_job,
+                self.constants.WAIT_10_SECONDS_JOB_NAME, {}, idempotency_key=key)
+
+    def test_kill_cancels_job_run_on_thread(self):
+        output_path = os.path.join(self.temp_dir, "output.json")
+        job = self.manager.create_job(
+            self.constants.WAIT_FOR_CANCEL_JOB_NAME, {"output_file": output_path}, True, port=5001,
+            executor="thread")
+        self._read_output(output_path, cancelled=False)
+        job.kill()
+        self._read_output(output_path, cancelled=True)
+        self._wait_for_kill_status(job, "terminated")
+        self.assertEquals(job.state(), "killed")
+
+    def test_invalid_deadlines_are_rejected(self):
+        for options in ({"max_runtime": 0}, {"max_runtime": "1"}, {"deadline": -1}, {"deadline": True}):
+            self.assertRaises(
+                InvalidJobOptionError, self.manager.create_job,
+                self.constants.WAIT_10_SECONDS_JOB_NAME, {}, **options)
+        self.assertEquals(self.manager.count_jobs(), 0)
+
+    def test_reaper_records_finished_jobs(self):
+        jobs = [self._create_file_job() for _ in range(3)]
+        # Nothing else checks on the jobs, so the reaper moves them
+        self._wait_for_count("finished", 3)
+        self.assertEquals(list(self.manager.find_jobs(states=["finished"])), jobs)
+        self.assertEquals(self.manager.active_log_paths(), [])
+
+    def test_find_jobs_by_name_and_creation_time(self):
+        first = self._create_file_job(running=False)
+        waiting = self.manager.create_job(
+            self.constants.WAIT_10_SECONDS_JOB_NAME, {}, port=5001)
+        second = self._create_file_job(running=False)
+        self.assertEquals(
+            list(self.manager.find_jobs(name=self.constants.CREATE_FILE_JOB_NAME)),
+            [first, second])
+        self.assertEquals(
+            list(self.manager.find_jobs(created_since=waiting.created_at)),
+            [waiting, second])
+        self.assertEquals(
+            list(self.manager.find_jobs(after=waiting.sequence)), [second])
+
+    def test_find_jobs_by_states_and_name(self):
+        wait_name = self.constants.WAIT_10_SECONDS_JOB_NAME
+        first = self._create_file_job(running=False)
+        running = self.manager.create_job(wait_name, {}, True, port=5001)
+        second = self._create_file_job(running=False)
+        queued = self.manager.create_job(wait_name, {}, port=5001)
+        self.assertEquals(
+            list(self.manager.find_jobs(states=["queued", "running"])), [first, running, second, queued])
+        self.assertEquals(
+            list(self.manager.find_jobs(states=["queued", "running"], name=wait_name)), [running, queued])
+        self.assertEquals(
+            list(self.manager.find_jobs(states=["queued", "running"], name=wait_name, after=running.sequence)),
+            [queued])
+        self.assertEquals(
+            list(self.manager.find_jobs(states=["queued"], created_since=second.created_at)), [second, queued])
+        self.assertEquals(list(self.manager.find_jobs(states=["finished"], name=wait_name)), [])
+        running.kill()
+        self.assertEquals(
+            list(self.manager.find_jobs(states=["queued", "running"], name=wait_name)), [queued])
+        self.assertEquals(list(self.manager.find_jobs(states=["killed"], name=wait_name)), [running])
+
+    def test_finished_jobs_do_not_leak_file_descriptors(self):
+        if not os.path.isdir('/proc/self/fd'):
+            self.skipTest("Open file descriptors can't be listed")
+        self._create_file_job()
+        self._wait_for_count("finished", 1)
+        open_fds = len(os.listdir('/proc/self/fd'))
+        for _ in range(5):
+            self._create_file_job()
+        self._wait_for_count("finished", 6)
+        self.assertEquals(len(os.listdir('/proc/self/fd')), open_fds)
@@ -1,9 +1,11 @@
+import json
 import os
 import shutil
 import types
 
 from hoplite.utils import server_logging
 from hoplite.server.jobs.job_wrapper import job_wrapper
+from hoplite.server.jobs.plugin_resources import PluginResources
 from hoplite.client.status_updater import MockStatusUpdater
 from multiprocessing import Pipe
 import tempfile
@@ -27,6 +29,19 @@ class TestJobWrapper(HopliteTestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_job_wrapper_imports_plugin_module_by_name(self):
+        temp_dir = tempfile.mkdtemp()
+        temp_file = os.path.join(temp_dir, "temp.txt")
+        to_job, to_self = Pipe()
+        # The plugin is not looked up among the entry points of the group
+        job_wrapper(to_self, "not_an_entry_point", {"file_to_create": temp_file}, MockStatusUpdater(),
+                    entry_point_group_name="hoplite.no_such_group",
+                    plugin_module_name=self.test_jobs_module.constants.CREATE_FILE_JOB_MODULE)
+        try:
+            self.assertTrue(os.path.isfile(temp_file))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_job_wrapper_fills_pipe_with_exception_info(self):
         module_name = self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME
         config = {}
@@ -67,4 +82,20 @@ class TestJobWrapper(HopliteTestCase):
             raise e
         finally:
             to_job.close()
-            to_self.close()
\ No newline at end of file
+            to_self.close()
+    def test_job_wrapper_passes_resources_to_run(self):
+        temp_dir = tempfile.mkdtemp()
+        output_file = os.path.join(temp_dir, "output.json")
+        config = {"output_file": output_file}
+        module_name = self.test_jobs_module.constants.PLUGIN_RESOURCES_JOB_NAME
+        resources = PluginResources()
+        to_job, to_self = Pipe()
+        try:
+            for jobs in (1, 2):
+                job_wrapper(to_self, module_name, config, MockStatusUpdater(),
+                            entry_point_group_name="hoplite.test_jobs", resources=resources)
+                with open(output_file) as output:
+                    self.assertEqual(json.load(output)["jobs"], jobs)
+            self.assertEqual(len(resources), 1)
+        finally:
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,74 @@
+import types
+
+import unittest2
+
+from hoplite.server.jobs.plugin_resources import PluginResources, uses_resources
+
+
+def make_plugin(name, torn_down, setup=True):
+    module = types.ModuleType(name)
+    if setup:
+        module.setup = lambda: {"module": module}
+        module.teardown = torn_down.append
+    module.run = lambda config, status, resources=None: None
+    return module
+
+
+class TestPluginResources(unittest2.TestCase):
+    def setUp(self):
+        self.torn_down = []
+        self.resources = PluginResources()
+
+    def test_uses_resources(self):
+        self.assertTrue(uses_resources(make_plugin("plugin", self.torn_down)))
+        self.assertFalse(uses_resources(make_plugin("plugin", self.torn_down, setup=False)))
+
+    def test_resources_are_set_up_once(self):
+        module = make_plugin("plugin", self.torn_down)
+        first = self.resources.get(module)
+        self.assertIs(first["module"], module)
+        self.assertIs(self.resources.get(module), first)
+        self.assertEqual(len(self.resources), 1)
+        self.assertEqual(self.torn_down, [])
+
+    def test_discard(self):
+        module = make_plugin("plugin", self.torn_down)
+        first = self.resources.get(module)
+        self.resources.discard(module)
+        self.assertEqual(self.torn_down, [first])
+        self.assertIsNot(self.resources.get(module), first)
+        # Discarding a plugin without resources does nothing
+        self.resources.discard(make_plugin("other", self.torn_down))
+        self.assertEqual(len(self.torn_down), 1)
+
+    def test_reloaded_plugin_is_set_up_again(self):
+        module = make_plugin("plugin", self.torn_down)
+        first = self.resources.get(module)
+        reloaded = make_plugin("plugin", self.torn_down)
+        second = self.resources.get(reloaded)
+        self.assertIs(second["module"], reloaded)
+        self.assertEqual(self.torn_down, [first])
+
+    def test_teardown_all(self):
+        first = self.resources.get(make_plugin("first", self.torn_down))
+        second = self.resources.get(make_plugin("second", self.torn_down))
+        self.resources.teardown_all()
+        self.assertItemsEqual(self.torn_down, [first, second])
+        self.assertEqual(len(self.resources), 0)
+
+    def test_teardown_is_optional(self):
+        module = make_plugin("plugin", self.torn_down)
+        del module.teardown
+        self.resources.get(module)
+        self.resources.teardown_all()
+        self.assertEqual(len(self.resources), 0)
+
+    def test_teardown_errors_are_logged(self):
+        module = make_plugin("plugin", self.torn_down)
+
+        def teardown(resources):
+            raise ValueError("Could not close")
+        module.teardown = teardown
+        self.resources.get(module)
+        self.resources.teardown_all()
+        self.assertEqual(len(self.resources), 0)
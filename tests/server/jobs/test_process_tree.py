@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+
+import unittest2
+
+from hoplite.server.jobs.process_tree import HAS_PROCESS_GROUPS, ProcessTree, start_session
+from tests.utils import WaitTestMixin
+
+# Starts a grandchild in the same group and waits for it
+LEADER = """
+import os
+import subprocess
+import sys
+subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']).wait()
+"""
+
+# Starts a grandchild in the same group and exits without waiting for it
+ORPHANING_LEADER = """
+import subprocess
+import sys
+subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+"""
+
+
+@unittest2.skipUnless(HAS_PROCESS_GROUPS, "Process groups are not supported")
+class TestProcessTree(unittest2.TestCase, WaitTestMixin):
+    def setUp(self):
+        self.leader = subprocess.Popen([sys.executable, '-c', LEADER], preexec_fn=start_session)
+        self.tree = ProcessTree(self.leader.pid)
+
+    def tearDown(self):
+        self.tree.kill()
+        if self.leader.poll() is None:
+            self.leader.kill()
+            self.leader.wait()
+
+    def _wait_until_gone(self, tree=None, leader=None):
+        tree = tree or self.tree
+        leader = leader or self.leader
+        self.wait_for(lambda: not tree.alive(leader.poll() is None), "the processes to exit")
+
+    def test_terminate_stops_every_process(self):
+        self.assertTrue(self.tree.alive(True))
+        self.tree.terminate()
+        self._wait_until_gone()
+        self.assertEquals(self.tree.count_alive(False), 0)
+
+    def test_kill_stops_every_process(self):
+        self.tree.kill()
+        self._wait_until_gone()
+        # The group is not signalled again once it is empty
+        self.assertFalse(self.tree.alive(False))
+
+    def _record_group_signals(self):
+        signals = []
+        killpg = os.killpg
+
+        def record(pgid, sig):
+            signals.append(sig)
+            killpg(pgid, sig)
+        os.killpg = record
+        self.addCleanup(setattr, os, 'killpg', killpg)
+        return signals
+
+    def test_empty_group_is_not_signalled_once_the_job_has_exited(self):
+        leader = subprocess.Popen([sys.executable, '-c', 'pass'], preexec_fn=start_session)
+        leader.wait()
+        tree = ProcessTree(leader.pid)
+        tree.job_exited()
+        # The group ID may belong to another process by now
+        signals = self._record_group_signals()
+        tree.terminate()
+        tree.kill()
+        self.assertFalse(tree.alive(False))
+        self.assertEquals(signals, [])
+
+    def test_processes_left_by_the_job_are_stopped(self):
+        leader = subprocess.Popen([sys.executable, '-c', ORPHANING_LEADER], preexec_fn=start_session)
+        leader.wait()
+        tree = ProcessTree(leader.pid)
+        self.addCleanup(tree.kill)
+        tree.job_exited()
+        self.assertTrue(tree.alive(False))
+        tree.terminate()
+        self._wait_until_gone(tree, leader)
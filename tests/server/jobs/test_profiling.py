@@ -0,0 +1,56 @@
+import os
+import pstats
+import shutil
+import tempfile
+import unittest2
+
+from hoplite.server.jobs.profiling import (
+    available_profilers,
+    run_with_profiler,
+    CPROFILE,
+    SAMPLE)
+
+
+def busy_function(iterations):
+    total = 0
+    for i in xrange(iterations):
+        total += i * i
+    return total
+
+
+def raising_function():
+    raise TypeError("THE SKY IS FALLING!!")
+
+
+class TestProfiling(unittest2.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.temp_dir, "profile")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_cprofile_writes_pstats(self):
+        ret = run_with_profiler(CPROFILE, self.output_path, busy_function, 1000)
+        self.assertEqual(ret, busy_function(1000))
+        stats = pstats.Stats(self.output_path)
+        function_names = [key[2] for key in stats.stats.keys()]
+        self.assertIn('busy_function', function_names)
+
+    def test_sampler_writes_collapsed_stacks(self):
+        if SAMPLE not in available_profilers():
+            self.skipTest("Sampling profiler is not available on this platform")
+        run_with_profiler(SAMPLE, self.output_path, busy_function, 3000000)
+        with open(self.output_path) as profile:
+            lines = profile.read().splitlines()
+        self.assertGreater(len(lines), 0)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertIn('busy_function', stack)
+        self.assertGreater(int(count), 0)
+
+    def test_profile_is_written_when_function_raises(self):
+        self.assertRaises(TypeError, run_with_profiler, CPROFILE, self.output_path, raising_function)
+        self.assertTrue(os.path.isfile(self.output_path))
+
+    def test_unknown_profiler_raises(self):
+        self.assertRaises(ValueError, run_with_profiler, "unknown", self.output_path, busy_function, 1)
@@ -0,0 +1,138 @@
+import time
+
+import unittest2
+
+from hoplite.server.jobs.result_cache import ResultCache, cache_key
+
+
+class FakeTask(object):
+    def __init__(self, on_exit):
+        self.on_exit = on_exit
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+
+class FakeExecutor(object):
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, job_kwargs, on_exit=None):
+        task = FakeTask(on_exit)
+        self.tasks.append(task)
+        return task
+
+
+class FakeJob(object):
+    def __init__(self):
+        self.status = None
+        self.exited = False
+
+    def on_status(self, status):
+        self.status = status
+
+    def on_exit(self):
+        self.exited = True
+
+
+class TestCacheKey(unittest2.TestCase):
+    def test_key_ignores_order_of_dictionaries(self):
+        self.assertEqual(
+            cache_key("plugin", {"a": 1, "b": {"c": [1, 2], "d": None}}),
+            cache_key("plugin", {"b": {"d": None, "c": [1, 2]}, "a": 1}))
+
+    def test_key_depends_on_plugin_and_config(self):
+        keys = set([
+            cache_key("plugin", {"a": 1}),
+            cache_key("other", {"a": 1}),
+            cache_key("plugin", {"a": "1"}),
+            cache_key("plugin", {"a": 1.0}),
+            cache_key("plugin", {"a": [1]}),
+            cache_key("plugin", {"a": True}),
+            cache_key("plugin", {"a1": ""}),
+            cache_key("plugin", {})
+        ])
+        self.assertEqual(len(keys), 8)
+
+
+class TestResultCache(unittest2.TestCase):
+    def setUp(self):
+        self.cache = ResultCache(max_entries=2, ttl_s=60)
+        self.executor = FakeExecutor()
+
+    def _submit(self, key="key", ttl_s=None):
+        job = FakeJob()
+        task = self.cache.submit(key, self.executor, {}, job.on_exit, job.on_status, ttl_s=ttl_s)
+        return job, task
+
+    def test_least_recently_used_results_are_dropped(self):
+        self.cache.put("a", {"value": "a"})
+        self.cache.put("b", {"value": "b"})
+        self.cache.get("a")
+        self.cache.put("c", {"value": "c"})
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), {"value": "a"})
+        self.assertEqual(self.cache.get("c"), {"value": "c"})
+
+    def test_results_expire(self):
+        self.cache.put("a", {"value": "a"}, ttl_s=0.01)
+        self.cache.put("b", {"value": "b"})
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), {"value": "b"})
+
+    def test_cached_result_finishes_job(self):
+        self.cache.put("key", {"value": 1})
+        job, task = self._submit()
+        self.assertEqual(job.status, {"value": 1})
+        self.assertFalse(task.is_alive())
+        self.assertEqual(self.executor.tasks, [])
+        self.assertRaises(EOFError, task.results.recv)
+
+    def test_result_of_job_is_cached(self):
+        job, task = self._submit(ttl_s=0.01)
+        self.assertEqual(len(self.executor.tasks), 1)
+        self.assertIsNone(job.status)
+        task.job_ended({"value": 1})
+        self.assertEqual(self.cache.get("key"), {"value": 1})
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_identical_jobs_wait(self):
+        first, first_task = self._submit()
+        second, second_task = self._submit()
+        other, _ = self._submit("other")
+        self.assertEqual(len(self.executor.tasks), 2)
+        self.assertTrue(second_task.is_alive())
+        first_task.job_ended({"value": 1})
+        self.assertEqual(second.status, {"value": 1})
+        self.assertTrue(second.exited)
+        self.assertFalse(second_task.is_alive())
+        self.assertIsNone(other.status)
+
+    def test_next_identical_job_is_run_if_job_fails(self):
+        first, first_task = self._submit()
+        second, second_task = self._submit()
+        third, third_task = self._submit()
+        first_task.job_ended(None)
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(len(self.executor.tasks), 2)
+        self.assertIsNone(second.status)
+        self.assertTrue(third_task.is_alive())
+        second_task.job_ended({"value": 2})
+        self.assertEqual(third.status, {"value": 2})
+
+    def test_killed_waiting_job_is_not_run(self):
+        first, first_task = self._submit()
+        second, second_task = self._submit()
+        third, third_task = self._submit()
+        second_task.terminate()
+        self.assertFalse(second_task.is_alive())
+        first_task.job_ended(None)
+        self.assertEqual(len(self.executor.tasks), 2)
+        third_task.terminate()
+        self.assertTrue(self.executor.tasks[1].terminated)
+        self.assertIsNone(second.status)
+        self.assertFalse(second.exited)
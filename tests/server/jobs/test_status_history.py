@@ -0,0 +1,44 @@
+import unittest2
+
+from hoplite.server.jobs.status_history import StatusHistory, approximate_size
+
+
+class TestStatusHistory(unittest2.TestCase):
+    def test_find(self):
+        history = StatusHistory()
+        for version in range(1, 6):
+            history.record(version, {"set": {"progress": version}}, at=100 + version)
+        entries, truncated = history.find()
+        self.assertEquals([entry["version"] for entry in entries], [1, 2, 3, 4, 5])
+        self.assertEquals(entries[0], {"version": 1, "time": 101, "set": {"progress": 1}})
+        self.assertFalse(truncated)
+        entries, _ = history.find(after_version=3)
+        self.assertEquals([entry["version"] for entry in entries], [4, 5])
+        entries, _ = history.find(since=102, until=104)
+        self.assertEquals([entry["version"] for entry in entries], [2, 3])
+
+    def test_oldest_entries_are_dropped(self):
+        history = StatusHistory(max_entries=3)
+        for version in range(1, 6):
+            history.record(version, {"append": {"log": [version]}}, at=100 + version)
+        self.assertEquals(len(history), 3)
+        entries, truncated = history.find()
+        self.assertEquals([entry["version"] for entry in entries], [3, 4, 5])
+        self.assertTrue(truncated)
+        self.assertTrue(history.find(after_version=1)[1])
+        self.assertFalse(history.find(after_version=2)[1])
+        self.assertTrue(history.find(since=102)[1])
+        self.assertFalse(history.find(since=103)[1])
+
+    def test_memory_is_capped(self):
+        history = StatusHistory(max_bytes=1000)
+        for version in range(1, 11):
+            history.record(version, {"set": {"log": "x" * 300}})
+        self.assertEquals(len(history), 3)
+        history.record(11, {"set": {"log": "x" * 2000}})
+        self.assertEquals(len(history), 0)
+        self.assertTrue(history.find(after_version=10)[1])
+
+    def test_approximate_size(self):
+        self.assertEquals(approximate_size("abc"), 3)
+        self.assertEquals(approximate_size({"ab": ["cd", 1]}), 2 + 2 + 2 + 2 + 8)
@@ -1,14 +1,27 @@
 import json
+import pickle
+import threading
 
 from httmock import urlmatch, HTTMock, response
-from hoplite.client.status_updater import StatusUpdater
-from hoplite.exceptions import JobDoesNotExistError
+from hoplite.client.status_updater import BufferedStatusUpdater, StatusUpdater
+from hoplite.serializer import hoplite_bson_loads
+from hoplite.utils.compression import gzip_decompress
+from hoplite.exceptions import InvalidStatusUpdateError, JobDoesNotExistError
+from tests.utils import WaitTestMixin
 import unittest2
 
 
+def _loads_body(request):
+    body = request.body
+    if request.headers.get('content-encoding', None) == 'gzip':
+        body = gzip_decompress(body)
+    if request.headers['content-type'] == 'application/bson':
+        return hoplite_bson_loads(body)
+    return json.loads(body)
+
 @urlmatch(path='\/jobs\/someuuid$')
 def update_status(url, request):
-    if json.loads(request.body)["api_key"] == "apikeyhere":
+    if _loads_body(request)["api_key"] == "apikeyhere":
         return response(200)
     return response(404)
 
@@ -23,3 +36,152 @@ class TestStatusUpdater(unittest2.TestCase):
             status = StatusUpdater('localhost:5001', "someuuid", "wrongapikey")
             self.assertRaises(JobDoesNotExistError, status.update, {"some": "status"})
 
+    def test_update_sends_bson(self):
+        bodies = []
+
+        @urlmatch(path='\/jobs\/someuuid$')
+        def record_update(url, request):
+            bodies.append((request.headers['content-type'], _loads_body(request)))
+            return response(200)
+        with HTTMock(record_update):
+            status = StatusUpdater('localhost:5001', "someuuid", "apikeyhere")
+            status.update({"some": "status"})
+            status.update({"not bson": 2 ** 70})
+        self.assertEquals(bodies[0], ('application/bson', {"api_key": "apikeyhere", "set": {"some": "status"}}))
+        self.assertEquals(bodies[1][0], 'application/json')
+        self.assertEquals(bodies[1][1]["set"], {"not bson": 2 ** 70})
+
+    def test_update_compresses_large_status(self):
+        encodings = []
+
+        @urlmatch(path='\/jobs\/someuuid$')
+        def record_update(url, request):
+            encodings.append(request.headers.get('content-encoding', None))
+            self.assertEquals(_loads_body(request)["set"], status.status)
+            return response(200)
+        with HTTMock(record_update):
+            status = StatusUpdater('localhost:5001', "someuuid", "apikeyhere")
+            status.update({"some": "status"})
+            status.update({"log": "line\n" * 1000})
+        self.assertEquals(encodings, [None, 'gzip'])
+
+    def test_update_sends_changed_keys(self):
+        bodies = []
+
+        @urlmatch(path='\/jobs\/someuuid$')
+        def record_update(url, request):
+            self.assertEquals(request.method, 'PATCH')
+            bodies.append(_loads_body(request))
+            return response(200)
+        with HTTMock(record_update):
+            status = StatusUpdater('localhost:5001', "someuuid", "apikeyhere")
+            status.status.update({"args": "large", "items": [1]})
+            status.update(status.status)
+            status.status.update({"result": "done"})
+            status.update(status.status)
+            status.status["items"].append(2)
+            status.update(status.status)
+            status.update(status.status)
+        self.assertEquals(
+            [body["set"] for body in bodies],
+            [{"args": "large", "items": [1]}, {"result": "done"}, {"items": [1, 2]}])
+
+    def test_patch(self):
+        bodies = []
+
+        @urlmatch(path='\/jobs\/someuuid$')
+        def record_update(url, request):
+            bodies.append(_loads_body(request))
+            return response(200)
+        with HTTMock(record_update):
+            status = StatusUpdater('localhost:5001', "someuuid", "apikeyhere")
+            status.update({"a": 1, "b": 2})
+            status.patch(values={"c": 3}, unset=["b"], append={"log": ["one"]})
+            self.assertRaises(InvalidStatusUpdateError, status.patch, append={"a": [2]})
+            self.assertEquals(status.status, {"a": 1, "c": 3, "log": ["one"]})
+            # Removed keys are sent again once they are set
+            status.update({"b": 2})
+        del bodies[1]["api_key"]
+        self.assertEquals(bodies[1], {"set": {"c": 3}, "unset": ["b"], "append": {"log": ["one"]}})
+        self.assertEquals(bodies[2]["set"], {"b": 2})
+        self.assertEquals(len(bodies), 3)
+
+
+class TestBufferedStatusUpdater(unittest2.TestCase, WaitTestMixin):
+    def setUp(self):
+        self.updates = []
+
+        @urlmatch(path='\/jobs\/someuuid$')
+        def record_update(url, request):
+            body = _loads_body(request)
+            if body["api_key"] != "apikeyhere":
+                return response(404)
+            del body["api_key"]
+            self.updates.append(body)
+            return response(200)
+        self.mock = HTTMock(record_update)
+        self.mock.__enter__()
+        self.addCleanup(self.mock.__exit__, None, None, None)
+
+    def test_rapid_updates_are_merged(self):
+        status = BufferedStatusUpdater('localhost:5001', "someuuid", "apikeyhere", flush_interval_s=10)
+        status.update({"started": True})
+        for i in range(100):
+            status.update({"progress": i})
+        status.flush()
+        self.assertLessEqual(len(self.updates), 2)
+        merged = {}
+        for update in self.updates:
+            merged.update(update["set"])
+        self.assertEquals(merged, {"started": True, "progress": 99})
+        self.assertEquals(status.status, {"progress": 99})
+
+    def test_patches_are_merged(self):
+        status = BufferedStatusUpdater('localhost:5001', "someuuid", "apikeyhere", flush_interval_s=10)
+        status.update({"a": 1}, flush=True)
+        for i in range(10):
+            status.patch(append={"log": [i]})
+        status.patch(unset=["a"], flush=True)
+        self.assertEquals(self.updates, [{"set": {"a": 1}}, {"unset": ["a"], "append": {"log": range(10)}}])
+        self.assertEquals(status.status, {"log": range(10)})
+
+    def test_updates_are_sent_in_the_background(self):
+        status = BufferedStatusUpdater('localhost:5001', "someuuid", "apikeyhere", flush_interval_s=.05)
+        status.update({"progress": 1})
+        self.wait_for(lambda: self.updates, "the update to be sent", timeout_s=5)
+        self.assertEquals(self.updates, [{"set": {"progress": 1}}])
+
+    def test_update_with_flush_is_sent_immediately(self):
+        status = BufferedStatusUpdater('localhost:5001', "someuuid", "apikeyhere", flush_interval_s=10)
+        status.update({"progress": 1})
+        status.update({"result": "done"}, flush=True)
+        self.assertEquals(self.updates[-1], {"set": {"progress": 1, "result": "done"}})
+
+    def test_failed_update_is_raised_by_flush(self):
+        status = BufferedStatusUpdater('localhost:5001', "someuuid", "wrongapikey")
+        status.update({"some": "status"})
+        self.assertRaises(JobDoesNotExistError, status.flush)
+        status.flush()
+
+    def test_can_be_pickled(self):
+        status = BufferedStatusUpdater('localhost:5001', "someuuid", "apikeyhere")
+        status.update({"some": "status"}, flush=True)
+        copy = pickle.loads(pickle.dumps(status))
+        copy.update({"other": "status"}, flush=True)
+        self.assertEquals(self.updates, [{"set": {"some": "status"}}, {"set": {"other": "status"}}])
+
+    def test_close_stops_thread(self):
+        # Updaters of other tests may not have been closed
+        running = set(threading.enumerate())
+        updaters = [BufferedStatusUpdater('localhost:5001', "someuuid", "apikeyhere") for _ in range(20)]
+        for i, status in enumerate(updaters):
+            status.update({"progress": i})
+            status.flush()
+            status.close()
+        threads = [thread for thread in threading.enumerate()
+                   if thread.name == 'hoplite-status-updater' and thread not in running]
+        self.assertEquals(threads, [])
+        # Updates after closing are still sent
+        updaters[0].update({"progress": "again"}, flush=True)
+        self.assertEquals(self.updates[-1], {"set": {"progress": "again"}})
+        updaters[0].close()
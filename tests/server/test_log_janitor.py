@@ -0,0 +1,110 @@
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import unittest2
+
+from hoplite.server.log_janitor import LogJanitor
+
+DAY = 24 * 60 * 60
+
+
+class TestLogJanitor(unittest2.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.now = 100 * DAY
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_log(self, name, age_s, contents='log\n'):
+        path = os.path.join(self.temp_dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as log_file:
+            log_file.write(contents)
+        os.utime(path, (self.now - age_s, self.now - age_s))
+        return path
+
+    def get_janitor(self, **kwargs):
+        options = {
+            'directories': [self.temp_dir],
+            'max_age_s': 30 * DAY,
+            'max_total_bytes': None,
+            'compress_after_s': DAY,
+            'min_idle_s': 60
+        }
+        options.update(kwargs)
+        return LogJanitor(**options)
+
+    def test_old_logs_are_compressed(self):
+        path = self.write_log('plugin/plugin_uuid.log', 2 * DAY, 'a' * 1000)
+        result = self.get_janitor().clean(self.now)
+        self.assertEqual(result, {'compressed': 1, 'deleted': 0})
+        self.assertFalse(os.path.exists(path))
+        with gzip.open(path + '.gz') as compressed:
+            self.assertEqual(compressed.read(), 'a' * 1000)
+        self.assertEqual(os.path.getmtime(path + '.gz'), self.now - 2 * DAY)
+
+    def test_rotated_and_remoted_function_logs_are_compressed(self):
+        rotated = self.write_log('plugin/plugin_uuid.log.3', 2 * DAY)
+        remoted = self.write_log('module/2016-01-01 00-00-00 foo_1a2b.log', 2 * DAY)
+        self.get_janitor().clean(self.now)
+        self.assertTrue(os.path.exists(rotated + '.gz'))
+        self.assertTrue(os.path.exists(remoted + '.gz'))
+
+    def test_recent_logs_are_not_compressed(self):
+        path = self.write_log('plugin/plugin_uuid.log', DAY / 2)
+        self.assertEqual(self.get_janitor().clean(self.now), {'compressed': 0, 'deleted': 0})
+        self.assertTrue(os.path.exists(path))
+
+    def test_other_files_are_left_alone(self):
+        path = self.write_log('plugin/plugin_uuid.pstats', 60 * DAY)
+        self.get_janitor().clean(self.now)
+        self.assertTrue(os.path.exists(path))
+
+    def test_logs_older_than_max_age_are_deleted(self):
+        old = self.write_log('plugin/plugin_old.log.gz', 31 * DAY)
+        new = self.write_log('plugin/plugin_new.log.gz', 29 * DAY)
+        result = self.get_janitor().clean(self.now)
+        self.assertEqual(result['deleted'], 1)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+
+    def test_oldest_logs_are_deleted_when_over_quota(self):
+        oldest = self.write_log('plugin/plugin_1.log', 300, 'a' * 100)
+        older = self.write_log('plugin/plugin_2.log', 200, 'a' * 100)
+        newest = self.write_log('plugin/plugin_3.log', 100, 'a' * 100)
+        janitor = self.get_janitor(max_total_bytes=250, compress_after_s=None)
+        self.assertEqual(janitor.clean(self.now)['deleted'], 1)
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(older))
+        self.assertTrue(os.path.exists(newest))
+
+    def test_logs_in_use_are_left_alone(self):
+        path = self.write_log('plugin/plugin_uuid.log', 60 * DAY)
+        rotated = self.write_log('plugin/plugin_uuid.log.1', 60 * DAY)
+        janitor = self.get_janitor(active_paths=lambda: [path])
+        self.assertEqual(janitor.clean(self.now), {'compressed': 0, 'deleted': 0})
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(os.path.exists(rotated))
+
+    def test_recently_written_logs_are_left_alone(self):
+        path = self.write_log('plugin/plugin_uuid.log', 30, 'a' * 100)
+        janitor = self.get_janitor(max_total_bytes=10, compress_after_s=10)
+        self.assertEqual(janitor.clean(self.now), {'compressed': 0, 'deleted': 0})
+        self.assertTrue(os.path.exists(path))
+
+    def test_start_and_stop(self):
+        path = self.write_log('plugin/plugin_uuid.log', 0)
+        os.utime(path, (0, 0))
+        janitor = self.get_janitor()
+        janitor.start()
+        for _ in range(500):
+            if not os.path.exists(path):
+                break
+            time.sleep(.01)
+        janitor.stop(5)
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(janitor._thread)
@@ -14,11 +14,17 @@ class TestJobManager(HopliteTestCase):
 
     def test_available_jobs(self):
         job_list = self.manager.available_job_plugins()
-        self.assertEquals(len(job_list), 4)
+        self.assertEquals(len(job_list), 10)
         expected = [self.test_jobs_module.constants.THROW_AN_EXCEPTION_JOB_NAME,
                     self.test_jobs_module.constants.CREATE_FILE_JOB_NAME,
                     self.test_jobs_module.constants.WAIT_10_SECONDS_JOB_NAME,
-                    self.test_jobs_module.constants.JOB_FAILED_EXCEPTION_JOB_NAME]
+                    self.test_jobs_module.constants.JOB_FAILED_EXCEPTION_JOB_NAME,
+                    self.test_jobs_module.constants.SPAWN_PROCESS_JOB_NAME,
+                    self.test_jobs_module.constants.WAIT_FOR_CANCEL_JOB_NAME,
+                    self.test_jobs_module.constants.THREAD_EXECUTOR_JOB_NAME,
+                    self.test_jobs_module.constants.BUSY_WAIT_JOB_NAME,
+                    self.test_jobs_module.constants.PLUGIN_RESOURCES_JOB_NAME,
+                    self.test_jobs_module.constants.COUNT_RUNS_JOB_NAME]
         self.assertEquals(sorted(job_list), sorted(expected))
 
     def test_job_info_raises_on_invalid_id(self):
@@ -0,0 +1,49 @@
+import unittest2
+
+from hoplite.server.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+class TestMetrics(unittest2.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_renders_per_label(self):
+        counter = self.registry.register(
+            Counter('jobs_total', 'Jobs.', ['plugin']))
+        counter.inc(plugin='a')
+        counter.inc(plugin='a')
+        counter.inc(3, plugin='b')
+        lines = self.registry.render().splitlines()
+        self.assertEqual(lines[0], '# HELP jobs_total Jobs.')
+        self.assertEqual(lines[1], '# TYPE jobs_total counter')
+        self.assertIn('jobs_total{plugin="a"} 2.0', lines)
+        self.assertIn('jobs_total{plugin="b"} 3.0', lines)
+
+    def test_counter_requires_declared_labels(self):
+        counter = Counter('jobs_total', 'Jobs.', ['plugin'])
+        self.assertRaises(ValueError, counter.inc, name='a')
+
+    def test_gauge_without_labels(self):
+        gauge = self.registry.register(Gauge('running', 'Running jobs.'))
+        gauge.set(4)
+        self.assertIn('running 4.0', self.registry.render().splitlines())
+
+    def test_label_values_are_escaped(self):
+        counter = self.registry.register(Counter('c', 'C.', ['plugin']))
+        counter.inc(plugin='a"b\\c')
+        self.assertIn(r'c{plugin="a\"b\\c"} 1.0',
+                      self.registry.render().splitlines())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.register(
+            Histogram('latency', 'Latency.', ['route'], buckets=(1, 5)))
+        histogram.observe(0.5, route='/jobs')
+        histogram.observe(3, route='/jobs')
+        histogram.observe(10, route='/jobs')
+        lines = self.registry.render().splitlines()
+        self.assertIn('latency_bucket{route="/jobs",le="1.0"} 1.0', lines)
+        self.assertIn('latency_bucket{route="/jobs",le="5.0"} 2.0', lines)
+        self.assertIn('latency_bucket{route="/jobs",le="+Inf"} 3.0', lines)
+        self.assertIn('latency_sum{route="/jobs"} 13.5', lines)
+        self.assertIn('latency_count{route="/jobs"} 3.0', lines)
+        self.assertEqual(histogram.count(route='/jobs'), 3)
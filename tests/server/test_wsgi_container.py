@@ -0,0 +1,58 @@
+import threading
+
+from tornado.testing import AsyncHTTPTestCase
+
+from hoplite.server.wsgi_container import StreamingWSGIContainer
+
+
+class TestStreamingWSGIContainer(AsyncHTTPTestCase):
+    def setUp(self):
+        self.release_stream = threading.Event()
+        super(TestStreamingWSGIContainer, self).setUp()
+
+    def get_app(self):
+        return StreamingWSGIContainer(self.wsgi_app)
+
+    def wsgi_app(self, environ, start_response):
+        if environ['PATH_INFO'] == '/buffered':
+            start_response('200 OK', [('Content-Length', '5')])
+            return ['hello']
+        if environ['PATH_INFO'] == '/slow':
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return self.slow_body()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return (str(i) for i in range(5))
+
+    def slow_body(self):
+        yield 'first'
+        self.release_stream.wait(5)
+        yield 'second'
+
+    def test_buffered_response(self):
+        response = self.fetch('/buffered')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, 'hello')
+
+    def test_streamed_response(self):
+        response = self.fetch('/streamed')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, '01234')
+        self.assertEqual(response.headers['Transfer-Encoding'], 'chunked')
+
+    def test_stream_does_not_block_other_requests(self):
+        chunks = []
+
+        def on_chunk(chunk):
+            chunks.append(chunk)
+            if chunk == 'first':
+                # The stream is waiting, other requests are still served
+                self.http_client.fetch(
+                    self.get_url('/buffered'), self.stop)
+
+        self.http_client.fetch(
+            self.get_url('/slow'), self.stop, streaming_callback=on_chunk)
+        response = self.wait()
+        self.assertEqual(response.body, 'hello')
+        self.release_stream.set()
+        self.wait()
+        self.assertEqual(chunks, ['first', 'second'])
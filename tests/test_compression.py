@@ -0,0 +1,48 @@
+import unittest2
+
+from hoplite.utils.compression import (
+    DecompressedTooLargeError,
+    accepts_gzip,
+    gzip_compress,
+    gzip_compress_stream,
+    gzip_decompress)
+
+
+class TestCompression(unittest2.TestCase):
+    def test_round_trip(self):
+        data = 'some data ' * 1000
+        compressed = gzip_compress(data)
+        self.assertLess(len(compressed), len(data))
+        self.assertEquals(gzip_decompress(compressed), data)
+
+    def test_stream_round_trip(self):
+        chunks = ['chunk {0} '.format(i) * 100 for i in range(10)]
+        compressed = ''.join(gzip_compress_stream(iter(chunks)))
+        self.assertEquals(gzip_decompress(compressed), ''.join(chunks))
+
+    def test_stream_closes_chunks(self):
+        closed = []
+
+        def chunks():
+            try:
+                yield 'first'
+                yield 'second'
+            finally:
+                closed.append(True)
+        stream = gzip_compress_stream(chunks())
+        next(stream)
+        stream.close()
+        self.assertEquals(closed, [True])
+
+    def test_decompress_limits_size(self):
+        compressed = gzip_compress('\0' * 100000)
+        self.assertRaises(
+            DecompressedTooLargeError, gzip_decompress, compressed, 1000)
+        self.assertEquals(len(gzip_decompress(compressed, 100000)), 100000)
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip('gzip, deflate'))
+        self.assertTrue(accepts_gzip('br, GZIP;q=0.5'))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('deflate'))
+        self.assertFalse(accepts_gzip(None))
@@ -0,0 +1,140 @@
+import os
+import signal
+import time
+
+import unittest2
+
+from hoplite.exceptions import JobCancelledError, JobFailedError, TimeoutError
+from hoplite.utils.job_context import JobContext, current_context, set_current_context
+
+
+class ChildJob(object):
+    def __init__(self, finished=False, error=None):
+        self.uuid = "child"
+        self.address = "localhost"
+        self._finished = finished
+        self._error = error
+        self.kills = 0
+
+    def finished(self):
+        if self._error is not None:
+            raise self._error
+        return self._finished
+
+    def kill(self):
+        self.kills += 1
+        return True
+
+
+class TestJobContext(unittest2.TestCase):
+    def test_remaining(self):
+        self.assertIsNone(JobContext("uuid").remaining())
+        remaining = JobContext("uuid", deadline=time.time() + 30).remaining()
+        self.assertGreater(remaining, 29)
+        self.assertLessEqual(remaining, 30)
+
+    def test_child_max_runtime(self):
+        self.assertIsNone(JobContext("uuid").child_max_runtime())
+        self.assertEquals(JobContext("uuid").child_max_runtime(10), 10)
+        context = JobContext("uuid", deadline=time.time() + 30)
+        self.assertEquals(context.child_max_runtime(10), 10)
+        self.assertLessEqual(context.child_max_runtime(60), 30)
+        self.assertLessEqual(context.child_max_runtime(), 30)
+
+    def test_child_max_runtime_raises_past_deadline(self):
+        context = JobContext("uuid", deadline=time.time() - 1)
+        self.assertRaises(TimeoutError, context.child_max_runtime)
+
+    def test_child_max_runtime_raises_once_cancelled(self):
+        context = JobContext("uuid")
+        context.cancel()
+        self.assertRaises(JobCancelledError, context.child_max_runtime)
+
+    def test_cancel_kills_unfinished_children(self):
+        context = JobContext("uuid")
+        running = ChildJob()
+        finished = ChildJob(finished=True)
+        context.add_child(running)
+        context.add_child(finished)
+        self.assertFalse(context.cancelled())
+        self.assertTrue(context.cancel())
+        self.assertTrue(context.cancelled())
+        self.assertEquals(running.kills, 1)
+        self.assertEquals(finished.kills, 0)
+        # Children are only killed once
+        self.assertFalse(context.cancel())
+        self.assertEquals(running.kills, 1)
+
+    def test_children_added_after_cancel_are_killed(self):
+        context = JobContext("uuid")
+        context.cancel()
+        child = ChildJob()
+        context.add_child(child)
+        self.assertEquals(child.kills, 1)
+
+    def test_children_which_fail_do_not_stop_cancel(self):
+        context = JobContext("uuid")
+        failed = ChildJob(error=JobFailedError("localhost", "child", None, None))
+        running = ChildJob()
+        context.add_child(failed)
+        context.add_child(running)
+        context.cancel()
+        self.assertEquals(running.kills, 1)
+
+    def test_check_cancelled_and_wait(self):
+        context = JobContext("uuid")
+        context.check_cancelled()
+        self.assertFalse(context.wait(0))
+        context.cancel()
+        self.assertTrue(context.wait(0))
+        self.assertRaises(JobCancelledError, context.check_cancelled)
+
+    def test_current_context(self):
+        self.assertIsNone(current_context())
+        context = JobContext("uuid")
+        set_current_context(context)
+        try:
+            self.assertIs(current_context(), context)
+        finally:
+            set_current_context(None)
+
+    @unittest2.skipUnless(hasattr(os, 'kill') and hasattr(signal, 'SIGTERM'), "Signals are not supported")
+    def test_sigterm_cancels_job(self):
+        context = JobContext("uuid")
+        child = ChildJob()
+        context.add_child(child)
+        previous_handler = context.install_signal_handler()
+        try:
+            with self.assertRaises(JobCancelledError):
+                os.kill(os.getpid(), signal.SIGTERM)
+                # The handler runs between bytecodes of the main thread
+                time.sleep(1)
+            self.assertTrue(context.cancelled())
+            # Later signals only cancel the job once
+            os.kill(os.getpid(), signal.SIGTERM)
+            time.sleep(.1)
+            # The children are killed by the job wrapper, once the plugin has
+            # returned
+            self.assertEquals(child.kills, 0)
+            self.assertTrue(context.cancel())
+            self.assertEquals(child.kills, 1)
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    @unittest2.skipUnless(hasattr(os, 'kill') and hasattr(signal, 'SIGTERM'), "Signals are not supported")
+    def test_sigterm_while_lock_is_held(self):
+        context = JobContext("uuid")
+        child = ChildJob()
+        previous_handler = context.install_signal_handler()
+        try:
+            with self.assertRaises(JobCancelledError):
+                # As if the plugin was adding a child when the job was killed
+                with context._lock:
+                    os.kill(os.getpid(), signal.SIGTERM)
+                    time.sleep(1)
+            context.add_child(child)
+            # Added after the job was cancelled, so killed straight away
+            self.assertEquals(child.kills, 1)
+            self.assertTrue(context.cancel())
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
@@ -10,7 +10,13 @@ setup(
             '{0}={1}'.format(c.WAIT_10_SECONDS_JOB_NAME, c.WAIT_10_SECONDS_JOB_MODULE),
             '{0}={1}'.format(c.CREATE_FILE_JOB_NAME, c.CREATE_FILE_JOB_MODULE),
             '{0}={1}'.format(c.THROW_AN_EXCEPTION_JOB_NAME, c.THROW_AN_EXCEPTION_JOB_MODULE),
-            '{0}={1}'.format(c.JOB_FAILED_EXCEPTION_JOB_NAME, c.JOB_FAILED_EXCEPTION_JOB_MODULE)
+            '{0}={1}'.format(c.JOB_FAILED_EXCEPTION_JOB_NAME, c.JOB_FAILED_EXCEPTION_JOB_MODULE),
+            '{0}={1}'.format(c.SPAWN_PROCESS_JOB_NAME, c.SPAWN_PROCESS_JOB_MODULE),
+            '{0}={1}'.format(c.WAIT_FOR_CANCEL_JOB_NAME, c.WAIT_FOR_CANCEL_JOB_MODULE),
+            '{0}={1}'.format(c.THREAD_EXECUTOR_JOB_NAME, c.THREAD_EXECUTOR_JOB_MODULE),
+            '{0}={1}'.format(c.BUSY_WAIT_JOB_NAME, c.BUSY_WAIT_JOB_MODULE),
+            '{0}={1}'.format(c.PLUGIN_RESOURCES_JOB_NAME, c.PLUGIN_RESOURCES_JOB_MODULE),
+            '{0}={1}'.format(c.COUNT_RUNS_JOB_NAME, c.COUNT_RUNS_JOB_MODULE)
         ]
     }
 )
@@ -0,0 +1,9 @@
+import time
+
+
+def run(config, status):
+    # Sleeps in short steps, so the job runs Python code often but never
+    # checks whether it has been cancelled
+    end_time = time.time() + 10
+    while time.time() < end_time:
+        time.sleep(.01)
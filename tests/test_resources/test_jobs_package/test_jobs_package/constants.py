@@ -9,3 +9,21 @@ THROW_AN_EXCEPTION_JOB_MODULE = "test_jobs_package.throw_an_exception_job"
 
 JOB_FAILED_EXCEPTION_JOB_NAME = "throw_job_failed_exception"
 JOB_FAILED_EXCEPTION_JOB_MODULE = "test_jobs_package.throw_job_failed_exception"
+
+SPAWN_PROCESS_JOB_NAME = "spawn_process_job"
+SPAWN_PROCESS_JOB_MODULE = "test_jobs_package.spawn_process_job"
+
+WAIT_FOR_CANCEL_JOB_NAME = "wait_for_cancel_job"
+WAIT_FOR_CANCEL_JOB_MODULE = "test_jobs_package.wait_for_cancel_job"
+
+THREAD_EXECUTOR_JOB_NAME = "thread_executor_job"
+THREAD_EXECUTOR_JOB_MODULE = "test_jobs_package.thread_executor_job"
+
+BUSY_WAIT_JOB_NAME = "busy_wait_job"
+BUSY_WAIT_JOB_MODULE = "test_jobs_package.busy_wait_job"
+
+PLUGIN_RESOURCES_JOB_NAME = "plugin_resources_job"
+PLUGIN_RESOURCES_JOB_MODULE = "test_jobs_package.plugin_resources_job"
+
+COUNT_RUNS_JOB_NAME = "count_runs_job"
+COUNT_RUNS_JOB_MODULE = "test_jobs_package.count_runs_job"
@@ -0,0 +1,9 @@
+import time
+
+CACHE_RESULTS = True
+
+
+def run(config, status):
+    with open(config["runs_file"], 'a') as runs_file:
+        runs_file.write("run\n")
+    time.sleep(config.get("seconds", 0))
@@ -0,0 +1,21 @@
+import json
+import os
+
+
+def setup():
+    return {"jobs": 0, "teardown_file": None}
+
+
+def run(config, status, resources):
+    resources["jobs"] += 1
+    resources["teardown_file"] = config.get("teardown_file")
+    with open(config["output_file"], 'w') as output:
+        json.dump({"jobs": resources["jobs"], "pid": os.getpid()}, output)
+    if config.get("fail", False):
+        raise ValueError("Failed as asked")
+
+
+def teardown(resources):
+    if resources["teardown_file"] is not None:
+        with open(resources["teardown_file"], 'a') as output:
+            output.write("torn down\n")
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+import time
+
+# The child writes its process ID once it is ready to be killed
+CHILD = """
+import os
+import signal
+import time
+if {ignore_sigterm}:
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+with open({pid_file!r}, 'w') as pid_file:
+    pid_file.write(str(os.getpid()))
+time.sleep(60)
+"""
+
+
+def run(config, status):
+    subprocess.Popen([sys.executable, '-c', CHILD.format(
+        ignore_sigterm=config.get("ignore_sigterm", False),
+        pid_file=config["pid_file"])])
+    # The child is left running if the job returns first
+    time.sleep(config.get("runtime", 10))
@@ -0,0 +1,8 @@
+import threading
+
+EXECUTOR = "thread"
+
+
+def run(config, status):
+    with open(config["output_file"], 'w') as output:
+        output.write(threading.current_thread().name)
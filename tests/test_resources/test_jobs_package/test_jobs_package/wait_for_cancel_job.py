@@ -0,0 +1,23 @@
+import json
+import os
+
+from hoplite.exceptions import JobCancelledError
+from hoplite.utils.job_context import current_context
+
+
+def _write(path, data):
+    with open(path + ".tmp", 'w') as output:
+        json.dump(data, output)
+    # Renamed so readers never see a partly written file
+    os.rename(path + ".tmp", path)
+
+
+def run(config, status):
+    context = current_context()
+    _write(config["output_file"], {"remaining": context.remaining(), "cancelled": False})
+    try:
+        if context.wait(10):
+            context.check_cancelled()
+    except JobCancelledError:
+        _write(config["output_file"], {"remaining": context.remaining(), "cancelled": True})
+        raise
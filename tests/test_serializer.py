@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import re
+import unittest2
+
+from bson import json_util
+from bson.code import Code
+from bson.int64 import Int64
+from bson.objectid import ObjectId
+
+from hoplite import serializer
+from hoplite.serializer import (
+    hoplite_bson_dumps,
+    hoplite_bson_loads,
+    hoplite_dumps,
+    hoplite_loads,
+    object_hook)
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+PLAIN_PAYLOADS = [
+    {},
+    {'uuid': 'correctuuid', 'running': True, 'finished': False, 'exit': None},
+    {'config': {'retries': 3, 'timeout': 2.5, 'big': 2 ** 70, 'paths': ['a', u'b']}},
+    {'status': {u'unicode key': u'été', 'utf8': 'caf\xc3\xa9', 'nested': [[1, (2, 3)], {'a': []}]}},
+    {1: 'int key', 2.5: 'float key', None: 'none key'},
+    # True == 1, so bool keys are kept apart from int keys
+    {True: 'bool key', False: 'other bool key'},
+    ['a', 1, 2.0, None],
+    u'just a string',
+    12
+]
+
+
+class TestHopliteDumps(unittest2.TestCase):
+    def test_plain_payloads_match_bson_json_util(self):
+        for payload in PLAIN_PAYLOADS:
+            self.assertEqual(hoplite_dumps(payload), json_util.dumps(payload))
+
+    def test_arguments_match_bson_json_util(self):
+        payload = PLAIN_PAYLOADS[3]
+        self.assertEqual(
+            hoplite_dumps(payload, indent=2, sort_keys=True),
+            json_util.dumps(payload, indent=2, sort_keys=True))
+
+    def test_extended_types_match_bson_json_util(self):
+        payloads = [
+            {'id': ObjectId(), 'when': datetime.datetime(2016, 1, 1, 12)},
+            {'status': {'values': [1, Int64(2)]}},
+            {'code': Code('return 1')},
+            {'regex': re.compile('hoplite')},
+            {'set': set([1])},
+            {'nan': float('nan'), 'inf': float('inf')}
+        ]
+        for payload in payloads:
+            self.assertEqual(hoplite_dumps(payload), json_util.dumps(payload))
+
+    def test_unserializable_objects_raise(self):
+        self.assertRaises(TypeError, hoplite_dumps, {'object': object()})
+
+    def test_backend_is_used_for_plain_payloads(self):
+        class Backend(object):
+            def __init__(self):
+                self.dumped = []
+
+            def dumps(self, obj):
+                self.dumped.append(obj)
+                return json.dumps(obj)
+        backend = Backend()
+        serializer.set_json_backend(backend)
+        try:
+            hoplite_dumps({'a': 1})
+            hoplite_dumps({'id': ObjectId()})
+        finally:
+            serializer.set_json_backend()
+        self.assertEqual(backend.dumped, [{'a': 1}])
+
+
+class TestHopliteLoads(unittest2.TestCase):
+    def slow_loads(self, s):
+        return json.loads(s, object_hook=lambda dct: object_hook(dct, True, False, 'utf-8'))
+
+    def assertIdentical(self, first, second):
+        self.assertEqual(first, second)
+        self.assertEqual(repr(first), repr(second))
+
+    def test_plain_payloads_match_object_hook(self):
+        for payload in PLAIN_PAYLOADS:
+            text = json.dumps(payload)
+            self.assertIdentical(hoplite_loads(text), self.slow_loads(text))
+            self.assertIdentical(hoplite_loads(text.decode('utf-8')), self.slow_loads(text))
+
+    def test_keys_and_values_are_encoded(self):
+        decoded = hoplite_loads('{"key": "value", "list": ["a"]}')
+        self.assertEqual(decoded, {'key': 'value', 'list': [u'a']})
+        self.assertIsInstance(decoded.keys()[0], str)
+        self.assertIsInstance(decoded['key'], str)
+
+    def test_encoding_can_be_disabled(self):
+        decoded = hoplite_loads('{"key": "value"}', encoding=None)
+        self.assertIsInstance(decoded['key'], unicode)
+
+    def test_extended_types_are_decoded(self):
+        oid = ObjectId()
+        decoded = hoplite_loads(hoplite_dumps({'id': oid, 'when': datetime.datetime(2016, 1, 1, 12)}))
+        self.assertEqual(decoded, {'id': oid, 'when': datetime.datetime(2016, 1, 1, 12)})
+
+    def test_escaped_extended_types_are_decoded(self):
+        oid = ObjectId()
+        decoded = hoplite_loads('{"id": {"\\u0024oid": "%s"}}' % oid)
+        self.assertEqual(decoded, {'id': oid})
+
+    def test_extra_arguments_are_passed_to_json(self):
+        decoded = hoplite_loads('{"value": 1.5}', parse_float=str)
+        self.assertEqual(decoded, {'value': '1.5'})
+
+    @unittest2.skipIf(simplejson is None, 'simplejson is not installed')
+    def test_simplejson_backend_matches_json(self):
+        serializer.set_json_backend(simplejson)
+        try:
+            for payload in PLAIN_PAYLOADS:
+                text = json.dumps(payload)
+                self.assertIdentical(hoplite_loads(text), self.slow_loads(text))
+                self.assertEqual(hoplite_dumps(payload), json_util.dumps(payload))
+        finally:
+            serializer.set_json_backend()
+
+
+class TestHopliteBson(unittest2.TestCase):
+    def test_decodes_like_hoplite_loads(self):
+        payload = {
+            'uuid': 'correctuuid',
+            'status': {u'unicode': u'\xe9t\xe9', 'list': ['a', {'nested': u'b'}], 'number': 1.5},
+            'id': ObjectId(),
+            'when': datetime.datetime(2016, 1, 1, 12, 0, 0, 123000),
+            'empty': None
+        }
+        from_json = hoplite_loads(hoplite_dumps(payload))
+        from_bson = hoplite_bson_loads(hoplite_bson_dumps(payload))
+        self.assertEqual(from_bson, from_json)
+        self.assertEqual(repr(from_bson), repr(from_json))
+
+    def test_large_integers_decode_as_plain_integers(self):
+        decoded = hoplite_bson_loads(hoplite_bson_dumps({'big': 2 ** 40, 'list': [-2 ** 40]}))
+        self.assertEqual(decoded, {'big': 2 ** 40, 'list': [-2 ** 40]})
+        self.assertIs(type(decoded['big']), long)
+        self.assertIs(type(decoded['list'][0]), long)
+        self.assertEqual(hoplite_dumps(decoded), json.dumps(decoded))
+
+    def test_regular_expressions_are_compiled(self):
+        decoded = hoplite_bson_loads(hoplite_bson_dumps({'regex': re.compile('hop', re.I)}))
+        self.assertEqual(decoded['regex'].pattern, 'hop')
+        self.assertEqual(decoded['regex'].flags & re.I, re.I)
+
+    def test_values_bson_cannot_represent_raise_value_error(self):
+        self.assertRaises(ValueError, hoplite_bson_dumps, {'big': 2 ** 70})
+        self.assertRaises(ValueError, hoplite_bson_dumps, {1: 'int key'})
+        self.assertRaises(ValueError, hoplite_bson_dumps, {'bytes': '\xff'})
@@ -0,0 +1,121 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest2
+import uuid
+
+from hoplite.utils import server_logging
+
+
+class TestAsyncHandler(unittest2.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.temp_dir, 'test.log')
+        self.file_handler = logging.FileHandler(self.log_path)
+        self.file_handler.setFormatter(
+            logging.Formatter('%(levelname)s %(message)s'))
+        self.handler = server_logging.AsyncHandler(self.file_handler)
+        self.logger = logging.getLogger(
+            'hoplite.test_server_logging.{0}'.format(uuid.uuid4()))
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        server_logging.flush()
+        shutil.rmtree(self.temp_dir)
+
+    def read_log(self):
+        with open(self.log_path) as log_file:
+            return log_file.read()
+
+    def test_records_are_written_after_flush(self):
+        self.logger.info('Hello %s', 'world')
+        self.assertTrue(server_logging.flush())
+        self.assertEqual(self.read_log(), 'INFO Hello world\n')
+
+    def test_arguments_are_formatted_when_logged(self):
+        status = {'state': 'before'}
+        self.logger.info('Status %s', status)
+        status['state'] = 'after'
+        server_logging.flush()
+        self.assertIn("'before'", self.read_log())
+
+    def test_exceptions_are_formatted_when_logged(self):
+        try:
+            raise TypeError('THE SKY IS FALLING!!')
+        except TypeError:
+            self.logger.exception('Failed')
+        server_logging.flush()
+        log = self.read_log()
+        self.assertIn('Failed', log)
+        self.assertIn('TypeError: THE SKY IS FALLING!!', log)
+
+    def test_level_of_wrapped_handler_is_used(self):
+        self.file_handler.setLevel(logging.WARNING)
+        handler = server_logging.AsyncHandler(self.file_handler)
+        self.assertEqual(handler.level, logging.WARNING)
+
+
+class TestJobLogger(unittest2.TestCase):
+    def setUp(self):
+        self.uuid = str(uuid.uuid4())
+        self.name = 'test_server_logging'
+        self.log_path = server_logging.get_job_file_path(
+            self.name, self.uuid, 'log')
+
+    def tearDown(self):
+        server_logging.flush()
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+    def test_file_is_opened_lazily(self):
+        logger = server_logging.get_job_logger(self.name, self.uuid)
+        self.assertFalse(os.path.exists(self.log_path))
+        logger.debug('First message')
+        server_logging.flush()
+        self.assertTrue(os.path.exists(self.log_path))
+        server_logging.close_job_logger(logger)
+
+    def test_logger_is_only_given_one_handler(self):
+        logger = server_logging.get_job_logger(self.name, self.uuid)
+        logger = server_logging.get_job_logger(self.name, self.uuid)
+        self.assertEqual(len(logger.handlers), 1)
+        server_logging.close_job_logger(logger)
+
+    def test_close_job_logger(self):
+        logger = server_logging.get_job_logger(self.name, self.uuid)
+        handler = logger.handlers[0]
+        logger.debug('First message')
+        server_logging.close_job_logger(logger)
+        server_logging.flush()
+        self.assertEqual(logger.handlers, [])
+        self.assertIsNone(handler.handler.stream)
+        self.assertNotIn(logger.name, logging.Logger.manager.loggerDict)
+        with open(self.log_path) as log_file:
+            self.assertIn('First message', log_file.read())
+
+
+class TestServerLogger(unittest2.TestCase):
+    def test_configuration_is_loaded_once(self):
+        server_logging.get_server_logger('hoplite.test_server_logging')
+        handlers = list(logging.getLogger('hoplite').handlers)
+        server_logging.get_server_logger('hoplite.test_server_logging')
+        self.assertEqual(logging.getLogger('hoplite').handlers, handlers)
+        for handler in handlers:
+            self.assertIsInstance(handler, server_logging.AsyncHandler)
+
+
+class TestRemotedFunctionLogging(unittest2.TestCase):
+    def test_log_filenames_are_unique(self):
+        first = server_logging.get_log_filename(
+            'tests.test_server_logging.function', '2016-01-01 00-00-00')
+        second = server_logging.get_log_filename(
+            'tests.test_server_logging.function', '2016-01-01 00-00-00')
+        self.assertNotEqual(first, second)
+        self.assertTrue(os.path.basename(first).startswith(
+            '2016-01-01 00-00-00 function_'))
+        self.assertTrue(first.endswith('.log'))
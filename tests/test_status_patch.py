@@ -0,0 +1,57 @@
+import unittest2
+
+from hoplite.exceptions import InvalidStatusUpdateError
+from hoplite.utils.status_patch import (
+    apply_patch,
+    check_patch,
+    make_patch,
+    merge_patches)
+
+
+class TestStatusPatch(unittest2.TestCase):
+    def test_make_patch_leaves_out_empty_parts(self):
+        self.assertEquals(make_patch(), {})
+        self.assertEquals(
+            make_patch({"a": 1}, ("b",), {"c": [2]}),
+            {"set": {"a": 1}, "unset": ["b"], "append": {"c": [2]}})
+
+    def test_make_patch_checks_types(self):
+        self.assertRaises(InvalidStatusUpdateError, make_patch, values=["a"])
+        self.assertRaises(InvalidStatusUpdateError, make_patch, unset="a")
+        self.assertRaises(
+            InvalidStatusUpdateError, make_patch, append={"a": "b"})
+
+    def test_apply_patch(self):
+        status = {"a": 1, "b": 2, "log": ["one"]}
+        patch = make_patch({"c": 3}, ["b"], {"log": ["two"], "new": [1]})
+        check_patch(status, patch)
+        apply_patch(status, patch)
+        self.assertEquals(
+            status, {"a": 1, "c": 3, "log": ["one", "two"], "new": [1]})
+
+    def test_check_patch_rejects_append_to_non_list(self):
+        status = {"a": 1}
+        self.assertRaises(
+            InvalidStatusUpdateError,
+            check_patch, status, make_patch(append={"a": [2]}))
+        check_patch(status, make_patch(unset=["a"], append={"a": [2]}))
+        check_patch(status, make_patch({"a": []}, append={"a": [2]}))
+
+    def test_merged_patches_have_the_same_effect(self):
+        patches = [
+            make_patch({"a": 1, "log": ["one"]}),
+            make_patch(append={"log": ["two"], "other": [1]}),
+            make_patch(unset=["a", "other"]),
+            make_patch({"a": 2}, append={"other": [2]}),
+            make_patch(append={"other": [3]}),
+        ]
+        one_by_one = {"b": 1, "other": [0]}
+        merged_status = dict(one_by_one)
+        merged = {}
+        for patch in patches:
+            apply_patch(one_by_one, patch)
+            merge_patches(merged, patch)
+        apply_patch(merged_status, merged)
+        self.assertEquals(merged_status, one_by_one)
+        self.assertEquals(
+            one_by_one, {"a": 2, "b": 1, "log": ["one", "two"], "other": [2, 3]})
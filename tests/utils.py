@@ -1,6 +1,23 @@
+import time
+
 from hoplite.serializer import hoplite_dumps
 
 
+class WaitTestMixin(object):
+    def wait_for(self, condition, message, timeout_s=10):
+        """Wait for something a job, process or thread does in the background
+
+        :param condition: Function which returns True once it has happened
+        :param message: What is waited for, for the failure message
+        :param timeout_s: Seconds to wait before failing the test
+        """
+        start_time = time.time()
+        while not condition():
+            if time.time() - start_time > timeout_s:
+                self.fail("Timed out waiting for {0}".format(message))
+            time.sleep(.01)
+
+
 class StatusCodeTestMixin(object):
     def assertStatusCode(self, response, status_code):
         """Assert the status code of a Flask test client response